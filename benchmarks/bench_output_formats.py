@@ -0,0 +1,84 @@
+"""Rows-per-token comparison of the verbose and compact tool output formats.
+
+Runs every row-rendering tool against the local Socrata stand-in once per output format and reports
+how many rows fit in the tool output budget and how many rows each thousand prompt tokens buys:
+
+    uv run python benchmarks/bench_output_formats.py --rows 1000
+
+Token counts use tiktoken's cl100k_base encoding when it is installed, and ~4 characters per token otherwise.
+"""
+
+import argparse
+import json
+import os
+import sys
+from pathlib import Path
+
+BENCHMARK_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BENCHMARK_DIR.parent / "chicago_location_investigator"))
+sys.path.insert(0, str(BENCHMARK_DIR))
+
+from socrata_stub import SocrataStub
+from run_benchmarks import TOOL_CASES
+
+# Tools whose output is one block per returned row; the rest return a single record
+ROW_TOOLS = [name for name in TOOL_CASES if name not in ("get_violation_details", "search_ward_for_point")]
+
+
+def token_counter():
+    try:
+        import tiktoken
+        encoding = tiktoken.get_encoding("cl100k_base")
+        return "cl100k_base", lambda text: len(encoding.encode(text))
+    except ImportError:
+        return "chars/4", lambda text: max(1, len(text) // 4)
+
+
+def run(rows):
+    counter_name, count_tokens = token_counter()
+    with SocrataStub(rows=rows) as stub:
+        # The tools read these at import time, so they have to be set before the imports below
+        os.environ["SOCRATA_BASE_URL"] = stub.base_url
+        os.environ.setdefault("OPEN_DATA_APP_TOKEN", "benchmark")
+
+        import main
+        from tools import metrics, render
+
+        tools = {t.__name__: metrics.instrument_tool(t) for t in main.TOOLS}
+        results = []
+        for name in ROW_TOOLS:
+            by_format = {}
+            for fmt in (render.VERBOSE, render.COMPACT):
+                render.set_output_formats(f"{name}={fmt}")
+                metrics.reset()
+                output = tools[name](**TOOL_CASES[name])
+                tool_span = next(s for s in metrics.get_spans() if s["kind"] == "tool")
+                tokens = count_tokens(output)
+                by_format[fmt] = {
+                    "rows_rendered": tool_span.get("rows_rendered") or 0,
+                    "output_chars": len(output),
+                    "output_tokens": tokens,
+                    "rows_per_1k_tokens": 1000 * (tool_span.get("rows_rendered") or 0) / tokens if tokens else 0.0,
+                }
+            results.append({"tool": name, "table_rows": rows, **by_format})
+
+    print(f"Token counts: {counter_name}")
+    print(f"{'tool':<45}{'verbose rows':>13}{'compact rows':>13}{'verbose r/1k':>13}{'compact r/1k':>13}{'gain':>7}")
+    for r in results:
+        v, c = r[render.VERBOSE], r[render.COMPACT]
+        # A tool that rendered no rows (e.g. an empty table) has no ratio to report
+        gain = f"{c['rows_per_1k_tokens'] / v['rows_per_1k_tokens']:.2f}x" if v["rows_per_1k_tokens"] else "n/a"
+        print(f"{r['tool']:<45}{v['rows_rendered']:>13}{c['rows_rendered']:>13}{v['rows_per_1k_tokens']:>13.1f}{c['rows_per_1k_tokens']:>13.1f}{gain:>7}")
+    return {"token_counter": counter_name, "results": results}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare rows per prompt token for the verbose and compact tool output formats")
+    parser.add_argument("--rows", type=int, default=1000, help="Rows per dataset to serve")
+    parser.add_argument("--out", type=str, required=False, help="Optional JSON file to write the results to")
+    args = parser.parse_args()
+
+    results = run(args.rows)
+    if args.out:
+        Path(args.out).write_text(json.dumps(results, indent=2))
+        print(f"Results written to {args.out}")
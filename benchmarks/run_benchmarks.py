@@ -0,0 +1,206 @@
+"""Offline benchmarks for the tools and the agent loop.
+
+Runs every tool against a local Socrata stand-in at several table sizes, then runs scripted agent
+trajectories end to end, and writes one JSON results file that can be compared with another run:
+
+    uv run python benchmarks/run_benchmarks.py --sizes 10 1000 10000 100000
+    uv run python benchmarks/run_benchmarks.py --compare benchmarks/results/old.json benchmarks/results/new.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+
+BENCHMARK_DIR = Path(__file__).resolve().parent
+ROOT = BENCHMARK_DIR.parent
+sys.path.insert(0, str(ROOT / "chicago_location_investigator"))
+sys.path.insert(0, str(BENCHMARK_DIR))
+
+from diskcache import Cache
+from socrata_stub import SocrataStub
+from scripted_model import ScriptedChatModel, TRAJECTORIES
+
+BOX = {"north": 41.92, "south": 41.88, "east": -87.65, "west": -87.70}
+
+# tool name -> keyword arguments for one representative call
+TOOL_CASES = {
+    "search_address_violations": {"address": "1601 W CHICAGO AVE", "start_date": "2025-01-01"},
+    "search_coordinates_violations": {"coordinate_boundaries": BOX, "start_date": "2025-01-01"},
+    "get_violation_details": {"violation_id_number": "7000001"},
+    "search_address_active_building_permits": {"house_number": "830", "cardinal_direction": "N", "street": "MARSHFIELD AVE"},
+    "search_coordinates_active_building_permits": {"coordinate_boundaries": BOX},
+    "search_address_food_inspections": {"name": "PUFFY CAKES"},
+    "search_coordinates_food_inspections": {"coordinate_boundaries": BOX},
+    "search_coordinates_crash": {"coordinate_boundaries": BOX},
+    "search_coordinates_murals": {"coordinate_boundaries": BOX},
+    "search_ward_for_point": {"latitude": 41.8958, "longitude": -87.6688},
+    "search_addresses_violations": {"addresses": ["1601 W CHICAGO AVE", "1751 W AUGUSTA BLVD", "2300 N HUMBOLDT BLVD"], "start_date": "2025-01-01"},
+    "search_addresses_active_building_permits": {"addresses": ["830 N MARSHFIELD AVE", "1601 W CHICAGO AVE"]},
+    "search_addresses_food_inspections": {"addresses": ["1601 W CHICAGO AVE", "1751 W AUGUSTA BLVD"], "start_date": "2025-01-01"},
+}
+
+
+def peak_memory(func):
+    """Run func once under tracemalloc and return the peak traced allocation in bytes."""
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def bench_tool(metrics, tool, kwargs, repeats):
+    """Time one tool: total latency, the HTTP part of it, and the rendering left over."""
+    samples = []
+    for _ in range(repeats):
+        metrics.reset()
+        start = time.perf_counter()
+        output = tool(**kwargs)
+        total = time.perf_counter() - start
+        http = [s for s in metrics.get_spans() if s["kind"] == "http"]
+        tool_span = next((s for s in metrics.get_spans() if s["kind"] == "tool"), {})
+        samples.append({
+            "latency_s": total,
+            "http_s": sum(s["wall_time_s"] for s in http),
+            "rows_returned": sum(s.get("rows_returned") or 0 for s in http),
+            "rows_rendered": tool_span.get("rows_rendered") or 0,
+            "bytes": sum(s.get("bytes") or 0 for s in http),
+            "output_chars": len(str(output)),
+        })
+    latency = statistics.median(s["latency_s"] for s in samples)
+    http_s = statistics.median(s["http_s"] for s in samples)
+    render_s = max(latency - http_s, 1e-9)
+    last = samples[-1]
+    return {
+        "latency_s": latency,
+        "latency_min_s": min(s["latency_s"] for s in samples),
+        "http_s": http_s,
+        "render_s": render_s,
+        "rows_returned": last["rows_returned"],
+        "rows_rendered": last["rows_rendered"],
+        "render_rows_per_s": last["rows_returned"] / render_s,
+        "bytes": last["bytes"],
+        "output_chars": last["output_chars"],
+        "peak_memory_bytes": peak_memory(lambda: tool(**kwargs)),
+    }
+
+
+def bench_agent(main, metrics, name, trajectory, repeats):
+    """Time a scripted agent run end to end."""
+    def run():
+        agent = main.setup(ScriptedChatModel(trajectory=trajectory))
+        return agent.invoke({"messages": [{"role": "user", "content": f"benchmark: {name}"}]})
+
+    latencies = []
+    for _ in range(repeats):
+        metrics.reset()
+        start = time.perf_counter()
+        response = run()
+        latencies.append(time.perf_counter() - start)
+    tool_spans = [s for s in metrics.get_spans() if s["kind"] == "tool"]
+    return {
+        "latency_s": statistics.median(latencies),
+        "latency_min_s": min(latencies),
+        "tool_calls": len(tool_spans),
+        "tool_time_s": sum(s["wall_time_s"] for s in tool_spans),
+        "messages": len(response["messages"]),
+        "prompt_chars": sum(len(str(m.content)) for m in response["messages"]),
+        "peak_memory_bytes": peak_memory(run),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def run_benchmarks(sizes, repeats, recorded_dir=None):
+    with SocrataStub(rows=sizes[0], recorded_dir=recorded_dir) as stub, tempfile.TemporaryDirectory() as scratch:
+        # The tools read these at import time, so they have to be set before the imports below
+        os.environ["SOCRATA_BASE_URL"] = stub.base_url
+        os.environ.setdefault("OPEN_DATA_APP_TOKEN", "benchmark")
+
+        import main
+        from tools import metrics, mural_catalog, name_index
+
+        # The catalog and index of the stand-in's rows are kept out of the real ones on disk
+        mural_catalog._MURAL_CATALOG_DIR = Path(scratch) / "mural_catalog"
+        name_index._NAME_INDEX_DIR = Path(scratch) / "name_index"
+
+        tools = {t.__name__: metrics.instrument_tool(t) for t in main.TOOLS}
+        results = {"tools": [], "agent": []}
+        for size in sizes:
+            stub.set_rows(size)
+            # Both are loaded once per process, so they are dropped to be rebuilt from the new tables
+            mural_catalog._catalog = None
+            name_index._index = None
+            for directory in (mural_catalog._MURAL_CATALOG_DIR, name_index._NAME_INDEX_DIR):
+                Cache(str(directory)).clear()
+            for name, kwargs in TOOL_CASES.items():
+                result = bench_tool(metrics, tools[name], kwargs, repeats)
+                results["tools"].append({"tool": name, "table_rows": size, **result})
+                print(f"{name:<45}{size:>8} rows {result['latency_s'] * 1000:>10.1f} ms {result['render_rows_per_s']:>12.0f} rows/s")
+            for name, trajectory in TRAJECTORIES.items():
+                result = bench_agent(main, metrics, name, trajectory, repeats)
+                results["agent"].append({"trajectory": name, "table_rows": size, **result})
+                print(f"agent:{name:<39}{size:>8} rows {result['latency_s'] * 1000:>10.1f} ms")
+    results["meta"] = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "git_commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "sizes": sizes,
+        "repeats": repeats,
+        "recorded_dir": recorded_dir,
+    }
+    return results
+
+
+def compare(old_path, new_path):
+    """Print median latency and peak memory ratios (new / old) for every benchmark present in both files."""
+    old, new = (json.loads(Path(p).read_text()) for p in (old_path, new_path))
+
+    def keyed(results):
+        out = {(r["tool"], r["table_rows"]): r for r in results["tools"]}
+        out.update({("agent:" + r["trajectory"], r["table_rows"]): r for r in results["agent"]})
+        return out
+
+    old_keyed, new_keyed = keyed(old), keyed(new)
+    print(f"{'benchmark':<50}{'rows':>8}{'old ms':>10}{'new ms':>10}{'speed':>8}{'mem':>8}")
+    for key in sorted(old_keyed.keys() & new_keyed.keys()):
+        o, n = old_keyed[key], new_keyed[key]
+        speed = o["latency_s"] / n["latency_s"] if n["latency_s"] else float("inf")
+        mem = n["peak_memory_bytes"] / o["peak_memory_bytes"] if o["peak_memory_bytes"] else float("nan")
+        print(f"{key[0]:<50}{key[1]:>8}{o['latency_s'] * 1000:>10.1f}{n['latency_s'] * 1000:>10.1f}{speed:>7.2f}x{mem:>7.2f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline benchmarks against a local Socrata stand-in and a scripted LLM")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 1000, 10000, 100000], help="Rows per dataset to serve")
+    parser.add_argument("--repeats", type=int, default=3, help="Timed repetitions per benchmark (the median is reported)")
+    parser.add_argument("--recorded", type=str, required=False, help="Directory of recorded <dataset_id>.json responses to serve instead of synthetic rows")
+    parser.add_argument("--out", type=str, required=False, help="Results file (defaults to benchmarks/results/<timestamp>_<commit>.json)")
+    parser.add_argument("--compare", type=str, nargs=2, metavar=("OLD", "NEW"), help="Compare two results files instead of running")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        sys.exit(0)
+
+    results = run_benchmarks(args.sizes, args.repeats, args.recorded)
+    out = Path(args.out) if args.out else BENCHMARK_DIR / "results" / f"{datetime.now():%Y%m%d_%H%M%S}_{results['meta']['git_commit'] or 'nogit'}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(results, indent=2))
+    print(f"Results written to {out}")
@@ -0,0 +1,70 @@
+"""A chat model that replays a fixed tool-call trajectory, so agent runs can be benchmarked without an LLM."""
+
+import time
+from uuid import uuid4
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from pydantic import PrivateAttr
+
+# Each trajectory is the list of model turns for one agent run: a list of tool calls, or the final answer text.
+TRAJECTORIES = {
+    "address_violations": [
+        [("search_address_violations", {"address": "1601 W CHICAGO AVE", "start_date": "2025-06-01"})],
+        [("get_violation_details", {"violation_id_number": "7000001"})],
+        "There are several open violations at 1601 W CHICAGO AVE.",
+    ],
+    "nearby_crashes": [
+        [("get_proximity_to_coords", {"coordinates": [41.8958, -87.6688], "dist_in_miles": 0.25})],
+        [("search_coordinates_crash", {"coordinate_boundaries": {"north": 41.8994, "south": 41.8922, "east": -87.6640, "west": -87.6736}, "start_date": "2025-01-01"})],
+        "Here are the crashes near 1601 W CHICAGO AVE.",
+    ],
+    "violations_and_permits": [
+        [("get_proximity_to_coords", {"coordinates": [41.8991, -87.6721], "dist_in_miles": 0.1})],
+        [
+            ("search_coordinates_violations", {"coordinate_boundaries": {"north": 41.9005, "south": 41.8977, "east": -87.6702, "west": -87.6740}, "start_date": "2025-01-01"}),
+            ("search_coordinates_active_building_permits", {"coordinate_boundaries": {"north": 41.9005, "south": 41.8977, "east": -87.6702, "west": -87.6740}}),
+        ],
+        "Several addresses with violations also have active permits.",
+    ],
+    "restaurants_nearby": [
+        [("search_coordinates_food_inspections", {"coordinate_boundaries": {"north": 41.9209, "south": 41.9137, "east": -87.6963, "west": -87.7060}, "start_date": "2025-10-01"})],
+        [("search_coordinates_murals", {"coordinate_boundaries": {"north": 41.9209, "south": 41.9137, "east": -87.6963, "west": -87.7060}})],
+        [("search_ward_for_point", {"latitude": 41.9173, "longitude": -87.7012})],
+        "The Spice Room and Gretel have passed all inspections.",
+    ],
+}
+
+
+class ScriptedChatModel(BaseChatModel):
+    """Replays one trajectory turn per call. `latency_s` optionally simulates model think time."""
+
+    trajectory: list
+    latency_s: float = 0.0
+    # Private, so the position in the script is not part of the model's cache identity
+    _turn: int = PrivateAttr(default=0)
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted"
+
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        if self.latency_s:
+            time.sleep(self.latency_s)
+        step = self.trajectory[min(self._turn, len(self.trajectory) - 1)]
+        self._turn += 1
+        if isinstance(step, str):
+            message = AIMessage(content=step)
+        else:
+            message = AIMessage(
+                content="",
+                tool_calls=[{"name": name, "args": args, "id": f"call_{uuid4().hex[:12]}"} for name, args in step],
+            )
+        # Rough ~4 characters per token, so LLM usage accounting has numbers to work with
+        input_tokens = sum(len(str(m.content)) for m in messages) // 4
+        output_tokens = len(str(message.content)) // 4 + 10
+        message.usage_metadata = {"input_tokens": input_tokens, "output_tokens": output_tokens, "total_tokens": input_tokens + output_tokens}
+        return ChatResult(generations=[ChatGeneration(message=message)])
@@ -0,0 +1,188 @@
+"""Local stand-in for the Chicago Open Data Portal, serving synthetic (or recorded) rows for the datasets the tools use."""
+
+import json
+import random
+import re
+import threading
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import urlparse, parse_qs
+
+VIOLATIONS = "22u3-xenr"
+PERMITS = "ydr8-5enu"
+FOOD_INSPECTIONS = "4ijn-s7e5"
+CRASHES = "85ca-t3if"
+MURALS = "we8h-apcf"
+WARDS = "p293-wvbd"
+DATASET_IDS = [VIOLATIONS, PERMITS, FOOD_INSPECTIONS, CRASHES, MURALS, WARDS]
+
+# The portal answers a query without $limit with at most this many rows
+DEFAULT_LIMIT = 1000
+
+STREETS = ["W CHICAGO AVE", "W AUGUSTA BLVD", "N MARSHFIELD AVE", "W ARMITAGE AVE", "N HUMBOLDT BLVD", "W HURON ST", "N FRANCISCO AVE"]
+
+
+def _address(rng):
+    return f"{rng.randrange(100, 3999)} {rng.choice(STREETS)}"
+
+
+def _date(rng):
+    return (datetime(2025, 12, 31) - timedelta(days=rng.randrange(0, 3 * 365), hours=rng.randrange(24))).strftime("%Y-%m-%dT%H:00:00.000")
+
+
+def _coords(rng):
+    return f"{41.88 + rng.random() * 0.04:.8f}", f"{-87.70 + rng.random() * 0.05:.8f}"
+
+
+def synthetic_row(dataset_id: str, i: int, rng: random.Random) -> dict:
+    """One plausible row for a dataset, carrying the columns the tools read."""
+    lat, lon = _coords(rng)
+    if dataset_id == VIOLATIONS:
+        return {
+            "id": str(7000000 + i), "violation_date": _date(rng), "address": _address(rng),
+            "inspection_status": rng.choice(["FAILED", "FAILED", "PASSED", "CLOSED"]),
+            "violation_status": rng.choice(["OPEN", "COMPLIED"]), "inspection_number": str(12000000 + i),
+            "violation_description": rng.choice(["ARRANGE PREMISE INSPECTION", "REPAIR EXTERIOR WALL", "MAINTAIN DOOR"]),
+            "violation_inspector_comments": "OBSERVED DAMAGED MASONRY AT REAR WALL. REPAIR AS NEEDED.",
+            "latitude": lat, "longitude": lon,
+        }
+    if dataset_id == PERMITS:
+        number, direction, *street = _address(rng).split()
+        return {
+            "id": str(3200000 + i), "permit_": str(100900000 + i), "permit#": str(100900000 + i),
+            "permit_status": rng.choice(["ACTIVE", "ACTIVE", "COMPLETE", "EXPIRED"]),
+            "permit_type": rng.choice(["PERMIT - RENOVATION/ALTERATION", "PERMIT - NEW CONSTRUCTION", "PERMIT - ELECTRIC WIRING"]),
+            "issue_date": _date(rng), "work_description": "INTERIOR ALTERATIONS TO EXISTING 3 DU PER PLANS",
+            "contact_1_name": "DOE, JANE", "street_number": number, "street_direction": direction,
+            "street_name": " ".join(street), "latitude": lat, "longitude": lon,
+        }
+    if dataset_id == FOOD_INSPECTIONS:
+        return {
+            "inspection_id": str(2600000 + i), "dba_name": rng.choice(["PUFFY CAKES", "THE SPICE ROOM", "GRETEL", "DANTE'S PIZZERIA", "BANG BANG PIE & BISCUITS"]),
+            "license_": str(2900000 + i % 500), "address": _address(rng), "inspection_date": _date(rng),
+            "results": rng.choice(["Pass", "Pass", "Fail", "Pass w/ Conditions"]), "risk": "Risk 1 (High)",
+            "violations": "38. INSECTS, RODENTS, & ANIMALS NOT PRESENT - Comments: OBSERVED A GAP ALONG BOTTOM OF FRONT DOOR.",
+            "latitude": lat, "longitude": lon,
+        }
+    if dataset_id == CRASHES:
+        number, direction, *street = _address(rng).split()
+        crash_date = _date(rng)
+        return {
+            "crash_record_id": f"{i:064x}", "crash_date": crash_date, "street_no": number, "street_direction": direction,
+            "street_name": " ".join(street), "traffic_control_device": rng.choice(["NO CONTROLS", "TRAFFIC SIGNAL", "STOP SIGN/FLASHER"]),
+            "device_condition": rng.choice(["NO CONTROLS", "FUNCTIONING PROPERLY"]), "weather_condition": rng.choice(["CLEAR", "RAIN", "SNOW", "CLOUDY/OVERCAST"]),
+            "lighting_condition": rng.choice(["DAYLIGHT", "DARKNESS, LIGHTED ROAD", "DUSK"]), "trafficway_type": rng.choice(["NOT DIVIDED", "ONE-WAY", "FOUR WAY"]),
+            "crash_type": rng.choice(["NO INJURY / DRIVE AWAY", "INJURY AND / OR TOW DUE TO CRASH"]),
+            "intersection_related_i": rng.choice(["Y", "N"]), "dooring_i": rng.choice(["N", "N", "N", "Y"]),
+            "injuries_total": str(rng.choice([0, 0, 0, 1, 2])), "injuries_fatal": "0",
+            "most_severe_injury": rng.choice(["NO INDICATION OF INJURY", "NONINCAPACITATING INJURY"]), "hit_and_run_i": rng.choice(["Y", "N", "N"]),
+            "crash_hour": crash_date[11:13].lstrip("0") or "0", "crash_day_of_week": str(rng.randrange(1, 8)),
+            "latitude": lat, "longitude": lon,
+        }
+    if dataset_id == MURALS:
+        return {
+            "mural_registration_id": str(1000 + i), "year_installed": str(rng.randrange(1970, 2025)), "artist_credit": "CHICAGO PUBLIC ART GROUP",
+            "artwork_title": f"Untitled #{i}", "location_description": "South wall of building", "street_address": _address(rng),
+            "description": "A colorful mural of neighborhood history.", "media": "Acrylic paint", "affiliated_or_commissioning": "SSA 33",
+            "latitude": lat, "longitude": lon,
+        }
+    if dataset_id == WARDS:
+        return {"ward": str(1 + i % 50)}
+    raise ValueError(f"Unknown dataset {dataset_id}")
+
+
+class SocrataStub:
+    """Threaded HTTP server answering `/resource/<dataset>.json` with a fixed body per dataset.
+
+    Filters in the query are not evaluated: every search gets the whole configured table, which is
+    what a benchmark wants (a known row count). Lookups by id and ward point queries get a single row.
+    The exception is `:updated_at > '...'`, so incremental re-fetches get only the rows changed since;
+    the system fields (:id, :updated_at) are included when `$select` asks for `:*`. `$limit` and
+    `$offset` are honored, as the portal would, so capped queries transfer only what they asked for, and a
+    query without `$limit` gets the portal's default of DEFAULT_LIMIT rows, so tools have to page past it.
+    """
+
+    def __init__(self, rows: int = 100, recorded_dir: str = None, seed: int = 0):
+        self.seed = seed
+        self.recorded_dir = Path(recorded_dir) if recorded_dir else None
+        self.requests_served = 0
+        self.bytes_served = 0
+        self._bodies = {}
+        self._data = {}
+        self.set_rows(rows)
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_address[1]}/resource"
+
+    def set_rows(self, rows: int):
+        """Regenerate every dataset body with `rows` rows (recorded datasets are sampled or repeated to size)."""
+        self.rows = rows
+        for dataset_id in DATASET_IDS:
+            recorded = self.recorded_dir / f"{dataset_id}.json" if self.recorded_dir else None
+            if recorded and recorded.exists():
+                source = json.loads(recorded.read_text())
+                data = [source[i % len(source)] for i in range(rows)] if source else []
+            else:
+                rng = random.Random(f"{self.seed}-{dataset_id}")
+                data = [synthetic_row(dataset_id, i, rng) for i in range(rows)]
+            self._data[dataset_id] = [{":id": f"row-{i:08x}", ":updated_at": "2026-01-01T00:00:00.000", **r} for i, r in enumerate(data)]
+            self._bodies[dataset_id] = (json.dumps(data[:DEFAULT_LIMIT]).encode(), json.dumps(data[:1]).encode())
+
+    def touch(self, dataset_id: str, rows: int):
+        """Mark the last `rows` rows of a dataset as updated now, as a daily portal refresh would."""
+        now = datetime.now().isoformat(timespec="milliseconds")
+        for row in self._data[dataset_id][-rows:]:
+            row[":updated_at"] = now
+
+    def body_for(self, dataset_id: str, query: dict) -> bytes:
+        full, single = self._bodies[dataset_id]
+        if "id" in query or dataset_id == WARDS:
+            return single
+        with_system_fields = ":*" in query.get("$select", [""])[0]
+        if not with_system_fields and "$limit" not in query and "$offset" not in query:
+            return full
+        data = self._data[dataset_id]
+        since = re.search(r":updated_at > '([^']+)'", query.get("$where", [""])[0])
+        if since:
+            data = [r for r in data if r[":updated_at"] > since.group(1)]
+        offset = int(query.get("$offset", ["0"])[0])
+        data = data[offset:offset + int(query.get("$limit", [DEFAULT_LIMIT])[0])]
+        if not with_system_fields:
+            data = [{k: v for k, v in r.items() if not k.startswith(":")} for r in data]
+        return json.dumps(data).encode()
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                parsed = urlparse(self.path)
+                dataset_id = parsed.path.rsplit("/", 1)[-1].removesuffix(".json")
+                if dataset_id not in stub._bodies:
+                    self.send_error(404, f"Unknown dataset {dataset_id}")
+                    return
+                body = stub.body_for(dataset_id, parse_qs(parsed.query))
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                stub.requests_served += 1
+                stub.bytes_served += len(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
@@ -0,0 +1,76 @@
+"""Answer-level cache in front of the agent, for questions that get asked over and over.
+
+Answers are keyed on the normalized question, the model and today's date, so a cached answer never
+outlives the day it was produced. Within the day, each answer expires when the most frequently
+refreshed dataset it drew on is due to change: an answer built from crash data goes stale much sooner
+than one built only from the ward map.
+"""
+
+import hashlib
+import json
+import re
+import time
+from datetime import date
+from pathlib import Path
+
+from diskcache import Cache
+
+ANSWER_CACHE_DIR = Path(__file__).resolve().parent / ".answer_cache"
+
+# How long data from each dataset stays current, in seconds. The daily-refreshed portal datasets
+# don't publish a refresh time, so answers built on them are kept for a quarter of a day.
+DATASET_TTL_S = {
+    "22u3-xenr": 6 * 3600,  # building violations, refreshed daily
+    "ydr8-5enu": 6 * 3600,  # building permits, refreshed daily
+    "4ijn-s7e5": 6 * 3600,  # food inspections, refreshed daily
+    "85ca-t3if": 6 * 3600,  # traffic crashes, refreshed daily
+    "we8h-apcf": 7 * 86400,  # mural registry, updated as murals are registered
+    "p293-wvbd": 30 * 86400,  # ward boundaries, change with redistricting
+}
+# Datasets not listed above, and answers that used no dataset at all
+DEFAULT_TTL_S = 6 * 3600
+
+
+def normalize_query(query: str) -> str:
+    """Lowercase, collapse whitespace and drop trailing punctuation, so trivially different phrasings share an entry."""
+    return re.sub(r"[\s?.!]+$", "", " ".join(query.lower().split()))
+
+
+def answer_ttl(datasets) -> float:
+    """Seconds a cached answer stays valid: the TTL of the most frequently refreshed dataset it used."""
+    return min((DATASET_TTL_S.get(d, DEFAULT_TTL_S) for d in datasets), default=DEFAULT_TTL_S)
+
+
+def format_age(seconds: float) -> str:
+    if seconds < 60:
+        return f"{seconds:.0f} seconds"
+    if seconds < 3600:
+        return f"{seconds / 60:.0f} minutes"
+    return f"{seconds / 3600:.1f} hours"
+
+
+class AnswerCache:
+    """Final agent answers on disk, keyed on (normalized query, model name, date)."""
+
+    def __init__(self, directory: str = ANSWER_CACHE_DIR):
+        self.cache = Cache(str(directory))
+
+    @staticmethod
+    def key(query: str, model_name: str) -> str:
+        payload = json.dumps([normalize_query(query), model_name, date.today().isoformat()])
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def get(self, query: str, model_name: str):
+        """The cached entry for this question, with its age in seconds under "age_s", or None."""
+        entry = self.cache.get(self.key(query, model_name))
+        if entry is None:
+            return None
+        return {**entry, "cached": True, "age_s": time.time() - entry["created_at"]}
+
+    def put(self, query: str, model_name: str, answer: str, datasets) -> float:
+        """Store an answer, expiring with the freshest dataset it used. Returns the TTL in seconds."""
+        datasets = sorted(set(datasets))
+        ttl = answer_ttl(datasets)
+        entry = {"query": query, "model_name": model_name, "answer": answer, "datasets": datasets, "created_at": time.time()}
+        self.cache.set(self.key(query, model_name), entry, expire=ttl)
+        return ttl
@@ -0,0 +1,195 @@
+"""Record/replay of external traffic, so tests, evals and profiling runs can be repeated offline.
+
+Two layers are covered:
+* HTTP made through `requests` (the Socrata client and geopy's ArcGIS geocoder both use it) is intercepted
+  at the transport adapter and keyed by the normalized request.
+* Chat model calls (Ollama, Anthropic, Bedrock) go through LangChain's LLM cache hook, keyed by the
+  normalized prompt and model configuration.
+
+In "record" mode everything goes out to the network as usual and is saved to the cassette file.
+In "replay" mode nothing leaves the machine: a request that is not in the cassette raises CassetteMiss.
+"""
+
+import base64
+import hashlib
+import io
+import json
+import threading
+from contextlib import contextmanager
+from datetime import date
+from pathlib import Path
+from urllib.parse import urlsplit, parse_qsl, urlencode
+
+import requests
+from requests.structures import CaseInsensitiveDict
+from langchain_core.caches import BaseCache
+from langchain_core.globals import get_llm_cache, set_llm_cache
+from langchain_core.messages import messages_from_dict, messages_to_dict
+from langchain_core.outputs import ChatGeneration, Generation
+
+RECORD = "record"
+REPLAY = "replay"
+
+# Credentials never go into a cassette, and never affect matching
+_SECRET_PARAMS = {"$$app_token", "token", "api_key", "key"}
+_SECRET_HEADERS = {"authorization", "x-api-key", "x-app-token", "set-cookie", "cookie"}
+# Message fields that change from run to run without changing what the model is asked
+_VOLATILE_MESSAGE_FIELDS = {"id", "response_metadata", "usage_metadata"}
+
+
+class CassetteMiss(KeyError):
+    """Raised in replay mode when a request was never recorded."""
+
+
+def _without_today(text: str) -> str:
+    # The system prompt and default end dates carry today's date; keep recordings usable on other days
+    return text.replace(date.today().isoformat(), "<today>")
+
+
+def normalize_request(method: str, url: str, body=None) -> str:
+    """Canonical form of a request: method, URL with sorted non-secret query params, and a body digest."""
+    parts = urlsplit(url)
+    query = sorted((k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if k not in _SECRET_PARAMS)
+    key = f"{method.upper()} {parts.scheme}://{parts.netloc}{parts.path}?{urlencode(query)}"
+    if body:
+        body = body.encode() if isinstance(body, str) else body
+        key += f" body:{hashlib.sha256(body).hexdigest()[:16]}"
+    return _without_today(key)
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Drop per-run message ids and provider metadata from a serialized chat prompt."""
+    try:
+        serialized = json.loads(prompt)
+    except ValueError:
+        return _without_today(prompt)
+
+    def strip(obj):
+        if isinstance(obj, dict):
+            if obj.get("type") == "constructor" and isinstance(obj.get("kwargs"), dict):
+                obj = {**obj, "kwargs": {k: v for k, v in obj["kwargs"].items() if k not in _VOLATILE_MESSAGE_FIELDS}}
+            return {k: strip(v) for k, v in obj.items()}
+        if isinstance(obj, list):
+            return [strip(v) for v in obj]
+        return obj
+
+    return _without_today(json.dumps(strip(serialized), sort_keys=True))
+
+
+class Cassette(BaseCache):
+    """A JSON file of recorded HTTP interactions and LLM generations. Also serves as the LangChain LLM cache."""
+
+    def __init__(self, path: str, mode: str = REPLAY):
+        if mode not in (RECORD, REPLAY):
+            raise ValueError(f"Unknown cassette mode {mode!r}, expected '{RECORD}' or '{REPLAY}'")
+        self.path = Path(path)
+        self.mode = mode
+        self.http = {}
+        self.llm = {}
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        if self.path.exists():
+            data = json.loads(self.path.read_text())
+            self.http, self.llm = data.get("http", {}), data.get("llm", {})
+        elif mode == REPLAY:
+            raise FileNotFoundError(f"No cassette at {self.path} to replay; run once with mode '{RECORD}' first")
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.path.write_text(json.dumps({"http": self.http, "llm": self.llm}, indent=1))
+
+    # --- HTTP -----------------------------------------------------------------------------------------
+
+    def record_response(self, key: str, response: requests.Response):
+        body = response.content
+        try:
+            stored_body = {"text": body.decode("utf-8")}
+        except UnicodeDecodeError:
+            stored_body = {"base64": base64.b64encode(body).decode("ascii")}
+        headers = {k: v for k, v in response.headers.items() if k.lower() not in _SECRET_HEADERS}
+        headers.pop("Content-Encoding", None)  # the body is stored already decoded
+        with self._lock:
+            self.http[key] = {"status": response.status_code, "reason": response.reason, "headers": headers, **stored_body}
+
+    def replay_response(self, key: str, request) -> requests.Response:
+        with self._lock:
+            recorded = self.http.get(key)
+            self.hits += recorded is not None
+            self.misses += recorded is None
+        if recorded is None:
+            raise CassetteMiss(f"No recorded response for {key}")
+        body = recorded["text"].encode("utf-8") if "text" in recorded else base64.b64decode(recorded["base64"])
+        response = requests.Response()
+        response.status_code = recorded["status"]
+        response.reason = recorded.get("reason")
+        response.headers = CaseInsensitiveDict(recorded["headers"])
+        response.raw = io.BytesIO(body)
+        response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+        response.url = request.url
+        response.request = request
+        return response
+
+    # --- LLM cache ------------------------------------------------------------------------------------
+
+    @staticmethod
+    def _llm_key(prompt: str, llm_string: str) -> str:
+        return hashlib.sha256(f"{_without_today(llm_string)}\n{normalize_prompt(prompt)}".encode()).hexdigest()
+
+    def lookup(self, prompt: str, llm_string: str):
+        with self._lock:
+            recorded = self.llm.get(self._llm_key(prompt, llm_string))
+        if self.mode == RECORD:
+            return None
+        if recorded is None:
+            with self._lock:
+                self.misses += 1
+            raise CassetteMiss("No recorded LLM generation for this prompt and model configuration")
+        with self._lock:
+            self.hits += 1
+        return [
+            ChatGeneration(message=messages_from_dict([g["message"]])[0]) if "message" in g else Generation(text=g["text"])
+            for g in recorded
+        ]
+
+    def update(self, prompt: str, llm_string: str, return_val):
+        if self.mode != RECORD:
+            return
+        stored = [
+            {"message": messages_to_dict([g.message])[0]} if isinstance(g, ChatGeneration) else {"text": g.text}
+            for g in return_val
+        ]
+        with self._lock:
+            self.llm[self._llm_key(prompt, llm_string)] = stored
+
+    def clear(self, **kwargs):
+        with self._lock:
+            self.http.clear()
+            self.llm.clear()
+
+
+@contextmanager
+def use_cassette(path: str, mode: str = REPLAY):
+    """Record or replay all `requests` traffic and chat model calls made inside the block."""
+    cassette = Cassette(path, mode)
+    original_send = requests.adapters.HTTPAdapter.send
+    previous_llm_cache = get_llm_cache()
+
+    def send(adapter, request, **kwargs):
+        key = normalize_request(request.method, request.url, request.body)
+        if cassette.mode == REPLAY:
+            return cassette.replay_response(key, request)
+        response = original_send(adapter, request, **kwargs)
+        cassette.record_response(key, response)
+        return response
+
+    requests.adapters.HTTPAdapter.send = send
+    set_llm_cache(cassette)
+    try:
+        yield cassette
+    finally:
+        requests.adapters.HTTPAdapter.send = original_send
+        set_llm_cache(previous_llm_cache)
+        if mode == RECORD:
+            cassette.save()
+        print(f"Cassette {cassette.path} ({mode}): {len(cassette.http)} HTTP, {len(cassette.llm)} LLM entries, {cassette.hits} hits, {cassette.misses} misses")
@@ -1,14 +1,12 @@
 # Orchestration for agent
 
 from langchain_anthropic import ChatAnthropic
-from main import agent
-from deepeval import evaluate
 from deepeval.test_case import LLMTestCase, ToolCall
 from deepeval.metrics import ToolCorrectnessMetric, GEval
 from dotenv import load_dotenv
 from deepeval.models.base_model import DeepEvalBaseLLM
 from deepeval.test_case import LLMTestCaseParams
-from main import model
+from main import model_anthropic as model
 
 from tools.tools_geocoding import get_proximity_to_coords
 
@@ -17,13 +15,36 @@ from tools.tools_violations import search_address_violations, get_violation_deta
 from tools.tools_permits import search_address_active_building_permits, search_coordinates_active_building_permits
 
 from tools.tools_food import search_address_food_inspections, search_coordinates_food_inspections
+from tools.render import output_format
 from langchain.agents import create_agent
 import json
+import argparse
+import asyncio
+import hashlib
+import inspect
+import time
+from pathlib import Path
+from diskcache import Cache
+from contextlib import nullcontext
 from datetime import datetime
+from cassette import use_cassette
 
 
 load_dotenv()
 
+# Agent runs and judge verdicts are cached on disk under a hash of everything that produced them,
+# so changing a prompt, a metric, the model, the tools or the system prompt invalidates only what it touches.
+_CACHE_DIR = Path(__file__).resolve().parent / ".eval_cache"
+_TOOLS_DIR = Path(__file__).resolve().parent / "tools"
+eval_cache = Cache(str(_CACHE_DIR))
+use_eval_cache = True
+
+
+def content_key(kind: str, *parts) -> str:
+    """Hash of the JSON form of `parts`, namespaced by the kind of artifact being cached."""
+    payload = json.dumps(parts, sort_keys=True, default=str)
+    return f"{kind}:{hashlib.sha256(payload.encode()).hexdigest()}"
+
 
 class AnthropicDeepEvalLLM(DeepEvalBaseLLM):
     def __init__(self, model_name: str = "claude-haiku-4-5", temperature: int = 0):
@@ -79,10 +100,9 @@ def mock_geocode_address(address:str):
         return (41.8781, -87.6298)
 
 
-agent = create_agent(
-    model=model,
-    tools=[search_address_violations, get_violation_details, search_address_active_building_permits, search_address_food_inspections, mock_geocode_address, get_proximity_to_coords, search_coordinates_violations, search_coordinates_active_building_permits, search_coordinates_food_inspections],
-    system_prompt="""You are a research assistant helping users find information about buildings in Chicago, Illinois. They will submit an address, and possibly a date or date range to look for.
+AGENT_TOOLS = [search_address_violations, get_violation_details, search_address_active_building_permits, search_address_food_inspections, mock_geocode_address, get_proximity_to_coords, search_coordinates_violations, search_coordinates_active_building_permits, search_coordinates_food_inspections]
+
+AGENT_SYSTEM_PROMPT = """You are a research assistant helping users find information about buildings in Chicago, Illinois. They will submit an address, and possibly a date or date range to look for.
 
 When addresses are provided, convert them to all-caps and format cardinal directions with one letter (eg, N for North) and abbreviate street types (eg, BLVD for Boulevard). Where restaurant names are provided, also convert them to all-caps before passing to a tool.
 
@@ -96,11 +116,95 @@ Available tools:
 7. search_address_food_inspections - Get a listing of health department inspections for restaurants or food services. Accepts name and/or address.
 8. search_coordinates_food_inspections - Get a listing of health department inspections for restaurants or food services found within coordinate boundaries.
 
-Use multiple tools when helpful to provide comprehensive answers. Do not ask follow up questions or offer to do more. If results had to be truncated due to length, let the user know.""",
+Use multiple tools when helpful to provide comprehensive answers. Do not ask follow up questions or offer to do more. If results had to be truncated due to length, let the user know."""
+
+agent = create_agent(
+    model=model,
+    tools=AGENT_TOOLS,
+    system_prompt=AGENT_SYSTEM_PROMPT,
 )
 
 
 
+def _tool_fingerprint(tool):
+    try:
+        source = inspect.getsource(tool)
+    except (OSError, TypeError):
+        source = None
+    return {
+        "name": tool.__name__,
+        "doc": tool.__doc__,
+        "signature": str(inspect.signature(tool)),
+        "source": source,
+        "output_format": output_format(tool.__name__),
+    }
+
+
+def _tools_package_hash() -> str:
+    """Hash of the source of every module in the tools package, so a change to a shared helper
+    (rendering, Socrata queries, the name index) invalidates runs as much as a change to a tool."""
+    digest = hashlib.sha256()
+    for path in sorted(_TOOLS_DIR.rglob("*.py")):
+        digest.update(str(path.relative_to(_TOOLS_DIR)).encode())
+        digest.update(path.read_bytes())
+    return digest.hexdigest()
+
+
+def agent_fingerprint(prompt: str) -> dict:
+    """Everything that determines an agent run: the prompt, the model and its settings, the tools, the system prompt,
+    and the day, since the tools answer from live portal data and a run from an earlier day is stale."""
+    return {
+        "prompt": prompt,
+        "model": {"class": type(model).__name__, **model._identifying_params},
+        "tools": [_tool_fingerprint(t) for t in AGENT_TOOLS],
+        "tools_package": _tools_package_hash(),
+        "system_prompt": AGENT_SYSTEM_PROMPT,
+        "date": datetime.now().strftime("%Y-%m-%d"),
+    }
+
+
+def metric_fingerprint(metric) -> dict:
+    """Everything that determines a judge verdict on the metric side: what it checks and which model judges it."""
+    judge = getattr(metric, "model", None)
+    return {
+        "class": type(metric).__name__,
+        "name": metric.__name__,
+        "criteria": getattr(metric, "criteria", None),
+        "evaluation_steps": getattr(metric, "evaluation_steps", None),
+        "evaluation_params": [str(p) for p in getattr(metric, "evaluation_params", None) or []],
+        "threshold": getattr(metric, "threshold", None),
+        "judge": judge.get_model_name() if hasattr(judge, "get_model_name") else str(judge),
+    }
+
+
+def test_case_fingerprint(test_case) -> dict:
+    return {
+        "input": test_case.input,
+        "actual_output": test_case.actual_output,
+        "expected_output": test_case.expected_output,
+        "tools_called": [t.name for t in test_case.tools_called or []],
+        "expected_tools": [t.name for t in test_case.expected_tools or []],
+    }
+
+
+async def a_measure_cached(metric, test_case) -> dict:
+    """Score a test case with a metric, reusing an earlier verdict for the same metric and test case."""
+    key = content_key("judge", metric_fingerprint(metric), test_case_fingerprint(test_case))
+    if use_eval_cache and key in eval_cache:
+        return {**eval_cache[key], "cached": True}
+
+    await metric.a_measure(test_case, _show_indicator=False)
+    verdict = {
+        "name": metric.__name__,
+        "score": metric.score,
+        "success": metric.is_successful(),
+        "reason": getattr(metric, "reason", None),
+    }
+    if getattr(metric, "error", None) is None:
+        eval_cache[key] = verdict
+    return {**verdict, "cached": False}
+
+
 def create_metrics():
     correct_tool_metric = ToolCorrectnessMetric(model=create_model())
 
@@ -138,6 +242,8 @@ class RunTestCase:
         self.prompt = None
         self.tools_called = None
         self.response = None
+        self.actual_output = None
+        self.from_cache = False
 
     def get_called_tools(self):
         tools_called = []
@@ -153,25 +259,71 @@ class RunTestCase:
 
         return LLMTestCase(
             input=self.prompt,
-            actual_output=self.response["messages"][-1].content,
+            actual_output=self.actual_output,
             tools_called=self.tools_called,
             expected_tools=expected_tool_list,
             expected_output=expected_output,
         )
 
-    def run_prompt(self, prompt):
+    async def a_run_prompt(self, prompt):
         self.prompt = prompt
-        self.response = agent.invoke(
+        key = content_key("agent", agent_fingerprint(prompt))
+        if use_eval_cache and key in eval_cache:
+            cached = eval_cache[key]
+            self.actual_output = cached["actual_output"]
+            self.tools_called = [ToolCall(name=x) for x in cached["tools_called"]]
+            self.from_cache = True
+            return
+
+        self.response = await agent.ainvoke(
             {"messages": [{"role": "user", "content": self.prompt}]}
         )
-
-    def evaluate(self, prompt, expected_output, expected_tool_names):
-        self.run_prompt(prompt)
+        self.actual_output = self.response["messages"][-1].content
         self.get_called_tools()
+        eval_cache[key] = {"actual_output": self.actual_output, "tools_called": [t.name for t in self.tools_called]}
+
+    async def a_evaluate(self, prompt, expected_output, expected_tool_names):
+        await self.a_run_prompt(prompt)
 
         test_case = self.create_test_case(expected_output, expected_tool_names)
 
-        return evaluate(test_cases=[test_case], metrics=metrics)
+        # Metric objects hold the result of their last measurement, so every case needs its own set
+        case_metrics = create_metrics()
+        verdicts = await asyncio.gather(*(a_measure_cached(m, test_case) for m in case_metrics))
+
+        return test_case, verdicts
+
+
+async def run_eval_case(case, semaphore):
+    """Run and judge one test case once a concurrency slot is free. Failures are recorded, not raised."""
+    async with semaphore:
+        start = time.perf_counter()
+        result = {
+            "prompt": case["prompt"],
+            "expected_output": case["expected_output"],
+            "expected_tool_names": case["expected_tool_names"],
+            "metrics": [],
+        }
+        try:
+            runner = RunTestCase()
+            test_case, verdicts = await runner.a_evaluate(
+                case["prompt"], case["expected_output"], case["expected_tool_names"]
+            )
+            result["actual_output"] = test_case.actual_output
+            result["tools_called"] = [t.name for t in test_case.tools_called]
+            result["agent_run_cached"] = runner.from_cache
+            result["metrics"] = verdicts
+        except Exception as e:
+            result["error"] = repr(e)
+        result["duration_s"] = round(time.perf_counter() - start, 3)
+        print(f"Finished in {result['duration_s']}s: {case['prompt'][:80]}")
+        return result
+
+
+async def run_eval_suite(test_cases, concurrency):
+    """Run all test cases concurrently, at most `concurrency` at a time, keeping their original order."""
+    semaphore = asyncio.Semaphore(concurrency)
+    return await asyncio.gather(*(run_eval_case(case, semaphore) for case in test_cases))
 
 
 if __name__ == "__main__":
@@ -224,39 +376,31 @@ if __name__ == "__main__":
         },
     ]
 
-    metrics = create_metrics()
-
-    for i in test_cases:
-        evaluation = RunTestCase().evaluate(
-            i["prompt"], i["expected_output"], i["expected_tool_names"]
-        )
-        
-        # Generate timestamp and create filename
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"data/test_result{timestamp}.json"
-        
-        # Collect results for each test case
-        test_result = {
+    parser = argparse.ArgumentParser(description='Run the DeepEval test cases against the agent')
+    parser.add_argument('-c', '--concurrency', type=int, required=False, default=5, help='How many test cases to run at the same time')
+    parser.add_argument('--cassette', type=str, required=False, help='Path of a cassette file to record all API and LLM traffic to, or replay it from')
+    parser.add_argument('--cassette-mode', type=str, required=False, choices=['record', 'replay'], default='replay', help='Record live traffic into the cassette, or replay it with no network access')
+    parser.add_argument('--no-cache', action='store_true', help='Ignore cached agent runs and judge verdicts and compute everything fresh (results are still cached)')
+    args = parser.parse_args()
+    use_eval_cache = not args.no_cache
+
+    start = time.perf_counter()
+    with use_cassette(args.cassette, args.cassette_mode) if args.cassette else nullcontext():
+        results = asyncio.run(run_eval_suite(test_cases, args.concurrency))
+    wall_time = time.perf_counter() - start
+
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    filename = Path("data") / f"eval_results_{timestamp}.json"
+    filename.parent.mkdir(parents=True, exist_ok=True)
+
+    # Write all evaluation results to a single file
+    with open(filename, 'w') as f:
+        json.dump({
             "timestamp": timestamp,
-            "prompt": i["prompt"],
-            "expected_output": i["expected_output"],
-            "expected_tool_names": i["expected_tool_names"],
-            "metrics": []
-        }
-        
-        # Extract metric results
-        for test_case in evaluation.test_results:
-            for metric_result in test_case.metrics_data:
-                test_result["metrics"].append({
-                    "name": metric_result.name,
-                    "score": metric_result.score,
-                    "success": metric_result.success,
-                    "reason": metric_result.reason if hasattr(metric_result, 'reason') else None
-                })
-                
-        # Write evaluation results to file
-        with open(filename, 'w') as f:
-            json.dump(test_result, f, indent=2, default=str)
-
-        print(f"Results written to {filename}")
+            "concurrency": args.concurrency,
+            "wall_time_s": round(wall_time, 3),
+            "summed_case_time_s": round(sum(r["duration_s"] for r in results), 3),
+            "test_cases": results,
+        }, f, indent=2, default=str)
 
+    print(f"Results written to {filename}")
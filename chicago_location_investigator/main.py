@@ -5,29 +5,42 @@ import os
 
 from tools.tools_geocoding import geocode_address, get_proximity_to_coords, geocode_intersection
 
-from tools.tools_violations import search_address_violations, get_violation_details, search_coordinates_violations
+from tools.tools_violations import search_address_violations, get_violation_details, search_coordinates_violations, search_addresses_violations
 
-from tools.tools_permits import search_address_active_building_permits, search_coordinates_active_building_permits
+from tools.tools_permits import search_address_active_building_permits, search_coordinates_active_building_permits, search_addresses_active_building_permits
 from tools.tools_art import search_coordinates_murals
-from tools.tools_food import search_address_food_inspections, search_coordinates_food_inspections
-from tools.tools_crash import search_coordinates_crash
-from tools.tools_wards import search_ward_for_point
+from tools.tools_food import search_address_food_inspections, search_coordinates_food_inspections, search_addresses_food_inspections, search_food_establishments
+from tools.tools_crash import search_coordinates_crash, search_crash_hotspots, search_crash_statistics
+from tools.tools_wards import search_ward_for_point, search_ward_records
+from tools import metrics, render, ratelimit, socrata
+from tools.memo import ToolMemo
 from models.ollama import model as model_llama3_1
 from models.anthropic import model as model_anthropic
 from models.bedrock import model as model_bedrock
+from models.usage import LLMUsageTracker, usage_table
+from cassette import use_cassette
+from answer_cache import AnswerCache, DATASET_TTL_S, format_age
 
 from dotenv import load_dotenv
 from datetime import date
 import argparse
+import sys
+import time
+from contextlib import nullcontext
 
 load_dotenv()
 OPEN_DATA_APP_TOKEN = os.getenv("OPEN_DATA_APP_TOKEN")
 
 
+TOOLS = [search_address_violations, get_violation_details, search_address_active_building_permits, search_address_food_inspections, geocode_address, get_proximity_to_coords, search_coordinates_violations, search_coordinates_active_building_permits, search_coordinates_food_inspections, search_coordinates_murals, search_coordinates_crash, search_ward_for_point, geocode_intersection, search_addresses_violations, search_addresses_active_building_permits, search_addresses_food_inspections, search_crash_hotspots, search_crash_statistics, search_food_establishments, search_ward_records]
+
+
 def setup(model):
+    # Each agent gets its own memo, so a tool call repeated within a run with the same arguments is answered without another request
+    memo = ToolMemo()
     agent = create_agent(
         model=model,
-        tools=[search_address_violations, get_violation_details, search_address_active_building_permits, search_address_food_inspections, geocode_address, get_proximity_to_coords, search_coordinates_violations, search_coordinates_active_building_permits, search_coordinates_food_inspections, search_coordinates_murals, search_coordinates_crash, search_ward_for_point, geocode_intersection],
+        tools=[metrics.instrument_tool(memo.wrap(t)) for t in TOOLS],
         system_prompt=f"""You are a research assistant helping users find information about locations in Chicago, Illinois. They will submit an address, and possibly a date or date range to look for.
 
     Today's date is {date.today().isoformat()}. Use it to interpret any relative dates or date ranges the user gives (eg, "in the last 6 months" or "since June"). Never search for records dated in the future, and do not search further back than the user has asked for.
@@ -40,14 +53,21 @@ def setup(model):
     3. get_proximity_to_coords - This function takes in coordinates representing an address and calculates the north, south, east, and west bounds for the requested radius. Radius must be provided in miles.
     4. search_address_violations - Get building code violations for an exact address with optional date filtering (start_date, end_date, or days parameters)
     5. get_violation_details - Get detailed info about a specific building code violation number. Submit one violation number at a time with argument "violation_id_number".
-    6. search_address_active_building_permits - Get a listing of any active building permits for an address.
-    7. search_coordinates_active_building_permits - Get a listing of any active building permits found within coordinate boundaries.
+    6. search_address_active_building_permits - Get a listing of any active building permits for an address, optionally only those issued within a date range.
+    7. search_coordinates_active_building_permits - Get a listing of any active building permits found within coordinate boundaries, optionally only those issued within a date range.
     8. search_address_food_inspections - Get a listing of health department inspections for restaurants or food services. Accepts name and/or address.
     9. search_coordinates_food_inspections - Get a listing of health department inspections for restaurants or food services found within coordinate boundaries.
-    10. search_coordinates_violations - Get a listing of building code violations within coordinate boundaries.
-    11. search_coordinates_murals - Get a listing of public art murals on buildings within coordinate boundaries.
-    12. search_coordinates_crash - Get a listing of car crashes that occurred within coordinate boundaries.
+    10. search_coordinates_violations - Get a listing of building code violations within coordinate boundaries. Addresses with several violations are summarized on one line; use search_address_violations or get_violation_details to drill into one.
+    11. search_coordinates_murals - Get a listing of public art murals on buildings within coordinate boundaries, or within radius_miles of a latitude/longitude, optionally installed within a date range.
+    12. search_coordinates_crash - Get a listing of car crashes that occurred within coordinate boundaries. Blocks with several crashes are summarized on one line; search again with that block's coordinate boundaries and group_by_block=False to see its crashes in full.
     13. search_ward_for_point - Given a coordinate point, identify what Chicago city ward it falls into. 
+    14. search_addresses_violations - Get building code violations for a list of exact addresses at once, grouped by address. Use this instead of calling search_address_violations for each of several addresses.
+    15. search_addresses_active_building_permits - Get any active building permits for a list of addresses at once, grouped by address.
+    16. search_addresses_food_inspections - Get health department inspections for a list of addresses at once, grouped by address.
+    17. search_crash_hotspots - Rank the most dangerous spots for car crashes within coordinate boundaries, up to the whole city, with crash counts, injuries, fatalities and hit-and-run share per spot. Use this for questions like "where are the worst intersections near here?" instead of listing crashes.
+    18. search_crash_statistics - Get exact crash counts within coordinate boundaries, broken down by hour, weekday, weather, lighting, crash type, injury severity, dooring and hit-and-run. Use this for questions about how safe an area is or how many crashes happened, rather than counting search_coordinates_crash results yourself.
+    19. search_food_establishments - Summarize health inspections per restaurant (latest result, passes, failures, last failure) by coordinate boundaries, name or address. Use no_failures_since or latest_result to answer questions like "restaurants near here that haven't failed an inspection since October" in one call.
+    20. search_ward_records - Get the violations, permits, food inspections, crashes or murals inside a whole ward, optionally within a date range, from the local mirror of the data.
 
     Use multiple tools when helpful to provide comprehensive answers. Do not ask follow up questions or offer to do more. If results had to be truncated due to length, let the user know.""",
     )
@@ -58,7 +78,18 @@ if __name__ == "__main__":
     parser.add_argument('-m', '--model_name', type=str, required=False, help='The LLM to use to run the agent', default='llama3.1')    
     parser.add_argument('-q', '--query', type=str, required=False, help='The query to ask about building violations')
     parser.add_argument('-d', '--debug', type=str, required=False, help='Whether you want to run the job in debug mode, getting all the model exchanges')
+    parser.add_argument('--metrics', type=str, required=False, help='Path of a JSON file to write tool, HTTP and LLM call metrics to; also prints summary tables')
+    parser.add_argument('--cassette', type=str, required=False, help='Path of a cassette file to record all API and LLM traffic to, or replay it from')
+    parser.add_argument('--cassette-mode', type=str, required=False, choices=['record', 'replay'], default='replay', help='Record live traffic into the cassette, or replay it with no network access')
+    parser.add_argument('--answer-cache', action='store_true', help='Answer repeated questions from a cache of earlier answers, skipping the LLM and the data portal')
+    parser.add_argument('--area-cache', action='store_true', help='Answer coordinate searches inside an area already searched this run by filtering those results locally')
+    parser.add_argument('--output-format', type=str, required=False, help="Tool output format: 'verbose' or 'compact' for all tools, or per tool, e.g. 'search_coordinates_crash=compact'")
     args = parser.parse_args()
+
+    if args.output_format:
+        render.set_output_formats(args.output_format)
+    if args.area_cache:
+        socrata.enable_area_cache()
     
     if args.query:
         query_text = args.query
@@ -81,21 +112,57 @@ if __name__ == "__main__":
         print("No supported model provided, defaulting to Llama 3.1")
         model = model_llama3_1
 
-    agent = setup(model)
+    answer_cache = AnswerCache() if args.answer_cache else None
+    cached = answer_cache.get(query_text, args.model_name) if answer_cache else None
+    if cached:
+        # Skips both the LLM and the Open Data Portal
+        print(f"[Cached answer from {format_age(cached['age_s'])} ago, using data from: {', '.join(cached['datasets']) or 'no datasets'}]")
+        print(cached["answer"])
+        if args.metrics:
+            metrics.write_metrics(args.metrics, query=query_text, model_name=args.model_name, answer_cache={"hit": True, "age_s": cached["age_s"]})
+        sys.exit(0)
 
-    response = agent.invoke(
-        {
-            "messages": [
-                {
-                    "role": "user",
-                    "content": query_text,
-                }
-            ]
-        }
-    )
+    agent = setup(model)
+    usage_tracker = LLMUsageTracker()
+    run_start = time.perf_counter()
+
+    with use_cassette(args.cassette, args.cassette_mode) if args.cassette else nullcontext():
+        response = agent.invoke(
+            {
+                "messages": [
+                    {
+                        "role": "user",
+                        "content": query_text,
+                    }
+                ]
+            },
+            config={"callbacks": [usage_tracker]},
+        )
+    run_wall_time = time.perf_counter() - run_start
 
     print(response["messages"][-1].content)
+
+    if answer_cache:
+        http_spans = [s for s in metrics.get_spans() if s["kind"] == "http"]
+        # Don't keep an answer built on a failed request; the next ask should try again
+        if not any(s.get("error") or (s.get("status") or 200) >= 400 for s in http_spans):
+            # Datasets read locally (memo, mural catalog, name index, mirror, caches) count as much as requested ones
+            datasets = [d for d in metrics.datasets_used() if d in DATASET_TTL_S]
+            ttl = answer_cache.put(query_text, args.model_name, response["messages"][-1].content, datasets)
+            print(f"Answer cached for {format_age(ttl)}")
     
+    if socrata.area_cache is not None:
+        area_stats = socrata.area_cache.stats()
+        print(f"Area cache: {area_stats['hits']} of {area_stats['hits'] + area_stats['misses']} coordinate searches answered locally")
+
     if args.debug:
         for message in response["messages"]:
             print(f"\n{message.type.upper()}: {message.content}")
+
+    if args.metrics:
+        tool_time = sum(s["wall_time_s"] for s in metrics.get_spans() if s["kind"] == "tool")
+        llm_usage = usage_tracker.report(run_wall_time_s=run_wall_time, tool_time_s=tool_time)
+        print("\n" + metrics.summary_table())
+        print("\n" + usage_table(llm_usage))
+        metrics.write_metrics(args.metrics, query=query_text, model_name=args.model_name, llm_usage=llm_usage, rate_limits=ratelimit.snapshot(),
+                              area_cache=socrata.area_cache.stats() if socrata.area_cache is not None else None)
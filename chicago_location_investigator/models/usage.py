@@ -0,0 +1,115 @@
+import threading
+import time
+from langchain_core.callbacks import BaseCallbackHandler
+
+
+class LLMUsageTracker(BaseCallbackHandler):
+    """Callback handler that accounts for every chat model call in an agent run.
+
+    Works with any LangChain chat model (Ollama, Anthropic, Bedrock) because it reads the standard
+    `usage_metadata` on the returned message. Tool output tokens are attributed by looking at how
+    much the prompt grew between consecutive calls, split across the tool messages that were added.
+    """
+
+    def __init__(self):
+        self.calls = []
+        self.tool_outputs = []
+        self._pending = {}
+        self._seen_tool_calls = set()
+        self._lock = threading.Lock()
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        prompt = messages[0] if messages else []
+        new_tool_messages = [
+            m for m in prompt if m.type == "tool" and m.tool_call_id not in self._seen_tool_calls
+        ]
+        with self._lock:
+            self._seen_tool_calls.update(m.tool_call_id for m in new_tool_messages)
+            self._pending[run_id] = (time.perf_counter(), len(prompt), new_tool_messages)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        with self._lock:
+            started, n_messages, new_tool_messages = self._pending.pop(run_id, (time.perf_counter(), 0, []))
+        latency = time.perf_counter() - started
+
+        message = getattr(response.generations[0][0], "message", None) if response.generations else None
+        usage = getattr(message, "usage_metadata", None) or {}
+        call = {
+            "index": len(self.calls),
+            "latency_s": round(latency, 6),
+            "prompt_messages": n_messages,
+            "input_tokens": usage.get("input_tokens"),
+            "output_tokens": usage.get("output_tokens"),
+            "tool_calls_requested": [t["name"] for t in getattr(message, "tool_calls", None) or []],
+        }
+
+        with self._lock:
+            self._attribute_tool_tokens(call, new_tool_messages)
+            self.calls.append(call)
+
+    def _attribute_tool_tokens(self, call, new_tool_messages):
+        if not new_tool_messages:
+            return
+        previous = self.calls[-1] if self.calls else None
+        if previous and None not in (previous["input_tokens"], previous["output_tokens"], call["input_tokens"]):
+            added = max(call["input_tokens"] - previous["input_tokens"] - previous["output_tokens"], 0)
+        else:
+            # No usage numbers to diff, fall back to the usual ~4 characters per token estimate
+            added = sum(len(str(m.content)) for m in new_tool_messages) // 4
+        total_chars = sum(len(str(m.content)) for m in new_tool_messages) or 1
+        for m in new_tool_messages:
+            tokens = round(added * len(str(m.content)) / total_chars)
+            self.tool_outputs.append({"tool": m.name, "tokens": tokens, "first_sent_in_call": call["index"]})
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        with self._lock:
+            self._pending.pop(run_id, None)
+
+    def report(self, run_wall_time_s: float = None, tool_time_s: float = None) -> dict:
+        """Summarize the run: per-call records, totals, and shares of time and tokens."""
+        llm_time = sum(c["latency_s"] for c in self.calls)
+        input_tokens = sum(c["input_tokens"] or 0 for c in self.calls)
+        output_tokens = sum(c["output_tokens"] or 0 for c in self.calls)
+        # A tool result stays in the conversation, so it is re-sent as input on every later call
+        tool_tokens, tool_tokens_billed = {}, {}
+        for t in self.tool_outputs:
+            tool_tokens[t["tool"]] = tool_tokens.get(t["tool"], 0) + t["tokens"]
+            resent = len(self.calls) - t["first_sent_in_call"]
+            tool_tokens_billed[t["tool"]] = tool_tokens_billed.get(t["tool"], 0) + t["tokens"] * resent
+        report = {
+            "llm_calls": len(self.calls),
+            "llm_time_s": round(llm_time, 6),
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "calls": self.calls,
+            "tool_output_tokens": dict(sorted(tool_tokens.items(), key=lambda kv: kv[1], reverse=True)),
+            "tool_output_input_tokens_billed": tool_tokens_billed,
+            "tool_output_token_share": {
+                name: round(tokens / input_tokens, 4) if input_tokens else None
+                for name, tokens in tool_tokens_billed.items()
+            },
+        }
+        if run_wall_time_s:
+            report["run_wall_time_s"] = round(run_wall_time_s, 6)
+            report["time_share"] = {"llm": round(llm_time / run_wall_time_s, 4)}
+            if tool_time_s is not None:
+                report["time_share"]["tools"] = round(tool_time_s / run_wall_time_s, 4)
+                report["time_share"]["other"] = round(max(run_wall_time_s - llm_time - tool_time_s, 0) / run_wall_time_s, 4)
+        return report
+
+
+def usage_table(report: dict) -> str:
+    """Render an LLM usage report as a short text table."""
+    lines = [f"{'llm call':<10}{'latency s':>11}{'in tok':>9}{'out tok':>9}  tools requested"]
+    for c in report["calls"]:
+        lines.append(
+            f"{c['index']:<10}{c['latency_s']:>11.3f}{str(c['input_tokens']):>9}{str(c['output_tokens']):>9}  {', '.join(c['tool_calls_requested'])}"
+        )
+    lines.append(f"{'total':<10}{report['llm_time_s']:>11.3f}{report['input_tokens']:>9}{report['output_tokens']:>9}")
+    for name, tokens in report["tool_output_tokens"].items():
+        share = report["tool_output_token_share"].get(name)
+        billed = report["tool_output_input_tokens_billed"][name]
+        lines.append(f"  {name}: ~{tokens} tokens of output, ~{billed} input tokens across calls" + (f" ({share:.0%} of input)" if share is not None else ""))
+    for part, share in report.get("time_share", {}).items():
+        lines.append(f"  {part} share of run time: {share:.0%}")
+    return "\n".join(lines)
@@ -0,0 +1,46 @@
+"""Keep a local SQLite mirror of the violation, permit, food inspection, crash and mural datasets.
+
+Each sync fetches only the rows changed since the last one (`:updated_at` past the stored high-water mark)
+and tags every row with the ward it falls in, and optionally its community area and census tract, as it is
+written. Questions about a whole ward are then answered by search_ward_records with an indexed lookup:
+
+    uv run python chicago_location_investigator/sync_mirror.py --since 2024-01-01
+    uv run python chicago_location_investigator/sync_mirror.py --datasets violations crashes --regions ward community_area
+
+--since only applies to a dataset's first sync; without it the first sync downloads the full history,
+which is millions of rows for violations and crashes. A sync that fails part way keeps what it wrote
+and picks up from the same high-water mark next time.
+"""
+
+import argparse
+import time
+
+from tools import metrics
+from tools.mirror import Mirror, MIRROR_DATASETS, mirror_path
+from tools.regions import REGION_LAYERS
+
+
+def run(datasets: list, since: str = None, regions: list = None, refresh_regions: bool = False):
+    mirror = Mirror()
+    try:
+        if refresh_regions:
+            mirror.sync_regions(regions)
+            mirror.retag(regions)
+        metrics.reset()
+        start = time.perf_counter()
+        written = mirror.sync(datasets, since, regions)
+        requests_made = sum(1 for s in metrics.get_spans() if s["kind"] == "http")
+        print(f"Synced {sum(written.values())} record(s) into {mirror_path()} with {requests_made} requests in {time.perf_counter() - start:.1f}s")
+    finally:
+        mirror.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sync a local mirror of the Chicago datasets, tagged with wards")
+    parser.add_argument("--datasets", nargs="+", choices=list(MIRROR_DATASETS), default=list(MIRROR_DATASETS), help="Datasets to sync (default: all)")
+    parser.add_argument("--since", type=str, required=False, help="On a dataset's first sync, only fetch records dated on or after this date (YYYY-MM-DD)")
+    parser.add_argument("--regions", nargs="+", choices=list(REGION_LAYERS), default=["ward"], help="Region layers to tag records with (default: ward)")
+    parser.add_argument("--refresh-regions", action="store_true", help="Fetch the region boundaries again before syncing")
+    args = parser.parse_args()
+
+    run(args.datasets, args.since, args.regions, args.refresh_regions)
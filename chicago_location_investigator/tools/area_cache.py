@@ -0,0 +1,143 @@
+import re
+import threading
+from collections import OrderedDict
+from urllib.parse import urlsplit, parse_qsl
+from . import metrics
+
+# Without a $limit, Socrata returns at most this many rows
+SOCRATA_DEFAULT_LIMIT = 1000
+
+_LATITUDE = re.compile(r"^latitude between (\S+) and (\S+)$")
+_LONGITUDE = re.compile(r"^longitude between (\S+) and (\S+)$")
+_DATE_RANGE = re.compile(r"^(\w+) between '([^']+)' and '([^']+)'$")
+# Predicates simple enough to apply to cached rows: column='value'
+_EQUALS = re.compile(r"^(\w+)\s*=\s*'((?:[^']|'')*)'$")
+
+
+def parse_area_query(url: str):
+    """Break a coordinate search URL into the parts the cache compares, or None if it isn't one.
+
+    Returns:
+        Dict with "scope" (dataset and every parameter but $where, $limit and the app token, which must
+        match exactly), "box" (south, north, west, east), "dates" ((field, start, end) or None),
+        "predicates" (the rest of $where, as a set of strings) and "limit".
+    """
+    parts = urlsplit(url)
+    params = dict(parse_qsl(parts.query, keep_blank_values=True))
+    box, dates, predicates = {}, None, set()
+    for predicate in params.pop("$where", "").split(" AND "):
+        predicate = " ".join(predicate.split())
+        if match := _LATITUDE.match(predicate):
+            box["south"], box["north"] = float(match.group(1)), float(match.group(2))
+        elif match := _LONGITUDE.match(predicate):
+            box["west"], box["east"] = float(match.group(1)), float(match.group(2))
+        elif match := _DATE_RANGE.match(predicate):
+            dates = match.groups()
+        elif predicate:
+            predicates.add(predicate)
+    if len(box) != 4:
+        return None
+    limit = params.pop("$limit", None)
+    params.pop("$$app_token", None)
+    return {
+        "scope": (parts.path, tuple(sorted(params.items()))),
+        "box": (box["south"], box["north"], box["west"], box["east"]),
+        "dates": dates,
+        "predicates": frozenset(predicates),
+        "limit": int(limit) if limit else SOCRATA_DEFAULT_LIMIT,
+    }
+
+
+def _contains(cached: dict, query: dict) -> bool:
+    """Whether every row the query asks for is among the cached query's rows."""
+    south, north, west, east = cached["box"]
+    q_south, q_north, q_west, q_east = query["box"]
+    if not (south <= q_south and q_north <= north and west <= q_west and q_east <= east):
+        return False
+    if cached["dates"]:
+        field, start, end = cached["dates"]
+        if not query["dates"] or query["dates"][0] != field or query["dates"][1] < start or query["dates"][2] > end:
+            return False
+    # The cached query may be broader (fewer filters), as long as the extra ones can be applied locally
+    if not cached["predicates"] <= query["predicates"]:
+        return False
+    return all(_EQUALS.match(p) for p in query["predicates"] - cached["predicates"])
+
+
+def _in_box(row: dict, box: tuple) -> bool:
+    south, north, west, east = box
+    try:
+        return south <= float(row["latitude"]) <= north and west <= float(row["longitude"]) <= east
+    except (KeyError, TypeError, ValueError):
+        return False
+
+
+def _filter(rows: list, cached: dict, query: dict) -> list:
+    """Apply the query's filters to the rows of a cached query that contains it, keeping their order."""
+    equals = [_EQUALS.match(p).groups() for p in query["predicates"] - cached["predicates"]]
+    equals = [(column, value.replace("''", "'")) for column, value in equals]
+    dates = query["dates"]
+    matched = []
+    for row in rows:
+        if not _in_box(row, query["box"]):
+            continue
+        if dates and not (dates[1] <= (row.get(dates[0]) or "") <= dates[2]):
+            continue
+        if any(row.get(column) != value for column, value in equals):
+            continue
+        matched.append(row)
+        if len(matched) == query["limit"]:
+            break
+    return matched
+
+
+class AreaCache:
+    """Complete results of coordinate searches, kept for the life of the process so that a search inside
+    an area already fetched (a smaller radius around the same point, a narrower date range, the same
+    area with a status filter) is answered by filtering those rows instead of asking the portal again.
+
+    Only results that came back whole are kept: a query that hit its $limit may be missing rows that a
+    narrower search would have returned.
+    """
+
+    def __init__(self, max_entries: int = 32):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, url: str):
+        """Rows for a coordinate search answered from a cached area that contains it, or None."""
+        query = parse_area_query(url)
+        if query is None:
+            return None
+        with self._lock:
+            for key, (cached, rows) in reversed(self._entries.items()):
+                if cached["scope"] == query["scope"] and _contains(cached, query):
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    break
+            else:
+                self.misses += 1
+                rows = None
+        metrics.record(area_cache="hit" if rows is not None else "miss")
+        return None if rows is None else _filter(rows, cached, query)
+
+    def put(self, url: str, rows: list):
+        """Keep the rows of a coordinate search, if it is one and no rows were cut off by its limit."""
+        query = parse_area_query(url)
+        if query is None or len(rows) >= query["limit"]:
+            return
+        with self._lock:
+            self._entries[url] = (query, rows)
+            self._entries.move_to_end(url)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits, "misses": self.misses, "entries": len(self._entries),
+            "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+        }
@@ -0,0 +1,100 @@
+import re
+from datetime import datetime, timedelta
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode, quote
+from diskcache import Cache
+from . import metrics
+from .area_cache import SOCRATA_DEFAULT_LIMIT
+
+# The date filter the tools add: "<field> between '<start>' and '<end>'"
+_DATE_RANGE = re.compile(r"(\w+) between '([^']+)' and '([^']+)'")
+_TIMESTAMP = "%Y-%m-%dT%H:%M:%S"
+# The portal datasets refresh daily and don't say when, so fetched ranges are trusted for a quarter of a day
+INTERVAL_TTL_S = 6 * 3600
+
+
+def _shift(timestamp: str, seconds: int) -> str:
+    return (datetime.strptime(timestamp[:19], _TIMESTAMP) + timedelta(seconds=seconds)).strftime(_TIMESTAMP)
+
+
+def missing_intervals(start: str, end: str, covered: list) -> list:
+    """The parts of [start, end] not covered by any of the (start, end) intervals, all inclusive timestamps."""
+    gaps, cursor = [], start
+    for covered_start, covered_end in sorted(covered):
+        if covered_end < cursor or covered_start > end:
+            continue
+        if covered_start > cursor:
+            gaps.append((cursor, _shift(covered_start, -1)))
+        cursor = max(cursor, _shift(covered_end, 1))
+        if cursor > end:
+            return gaps
+    return gaps + [(cursor, end)]
+
+
+class IntervalCache:
+    """Rows of date-filtered queries, kept per query and per date range already fetched.
+
+    Queries that only differ in their date range ("since June", then "since January" at the same place)
+    share an entry. A new range fetches only the sub-ranges not fetched yet and stitches them onto the
+    cached rows. Ranges that run into the future are stored only up to the time they were fetched, and
+    ranges that hit the query's $limit (or, without one, the portal's default of 1000 rows) aren't stored at all,
+    since rows may be missing from them.
+    """
+
+    def __init__(self, directory: str, ttl_s: float = INTERVAL_TTL_S):
+        self.cache = Cache(str(directory))
+        self.ttl_s = ttl_s
+
+    def fetch(self, url: str, get_rows):
+        """Answer a query with get_rows(url) -> (status code, rows), fetching only the date ranges not cached.
+
+        Returns:
+            Tuple of (status code, list of rows), or None when the query has no date range to split.
+        """
+        parts = urlsplit(url)
+        params = parse_qsl(parts.query, keep_blank_values=True)
+        where = dict(params).get("$where", "")
+        date_range = _DATE_RANGE.search(where)
+        if not date_range:
+            return None
+        field, start, end = date_range.groups()
+        limit = dict(params).get("$limit")
+        # As in the area cache, a gap fetched without a $limit is only known to be complete under the portal's
+        # default cap, whoever fetched it
+        complete_under = int(limit) if limit else SOCRATA_DEFAULT_LIMIT
+        key = self._key(parts, params, where.replace(date_range.group(0), f"{field} between ?"))
+
+        now = datetime.now()
+        fetched_at = now.strftime(_TIMESTAMP)
+        stale = (now - timedelta(seconds=self.ttl_s)).strftime(_TIMESTAMP)
+        segments = [s for s in self.cache.get(key, []) if s["fetched_at"] > stale]
+        gaps = missing_intervals(start, end, [(s["start"], s["end"]) for s in segments])
+
+        rows = [r for s in segments for r in s["rows"] if start <= (r.get(field) or "")[:19] <= end]
+        for gap_start, gap_end in gaps:
+            gap_where = where.replace(date_range.group(0), f"{field} between '{gap_start}' and '{gap_end}'")
+            status_code, gap_rows = get_rows(self._with_where(parts, params, gap_where))
+            if status_code != 200:
+                return status_code, None
+            rows.extend(gap_rows)
+            # Only keep ranges known to be complete, and nothing past the time they were fetched
+            if len(gap_rows) < complete_under and gap_start <= fetched_at:
+                segments.append({"start": gap_start, "end": min(gap_end, fetched_at), "fetched_at": fetched_at, "rows": gap_rows})
+        if gaps:
+            self.cache.set(key, segments, expire=self.ttl_s)
+
+        metrics.record(interval_cache="miss" if gaps == [(start, end)] else "hit", interval_gaps=len(gaps))
+        order = dict(params).get("$order", "")
+        if order.split()[:1] == [field]:
+            rows.sort(key=lambda r: r.get(field) or "", reverse=order.upper().endswith(" DESC"))
+        return 200, rows[:int(limit)] if limit else rows
+
+    @staticmethod
+    def _key(parts, params: list, where_without_dates: str) -> str:
+        skipped = ("$where", "$limit", "$offset", "$$app_token")
+        key_params = sorted([(k, v) for k, v in params if k not in skipped] + [("$where", where_without_dates)])
+        return f"{parts.path}?{urlencode(key_params)}"
+
+    @staticmethod
+    def _with_where(parts, params: list, where: str) -> str:
+        params = [(k, where if k == "$where" else v) for k, v in params]
+        return urlunsplit(parts._replace(query=urlencode(params, quote_via=quote, safe="$:*,'")))
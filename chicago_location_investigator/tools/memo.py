@@ -0,0 +1,68 @@
+import inspect
+import json
+import threading
+from functools import wraps
+from . import metrics
+
+
+def canonical_call(func, args: tuple, kwargs: dict) -> str:
+    """A stable key for one tool call: arguments bound to parameter names, defaults filled in, dict keys sorted
+    and surrounding whitespace stripped, so calls that mean the same thing share a key."""
+    bound = inspect.signature(func).bind(*args, **kwargs)
+    bound.apply_defaults()
+
+    def canonical(value):
+        if isinstance(value, str):
+            return " ".join(value.split())
+        if isinstance(value, dict):
+            return {str(k): canonical(v) for k, v in value.items()}
+        if isinstance(value, (list, tuple)):
+            return [canonical(v) for v in value]
+        if isinstance(value, float) and value.is_integer():
+            return int(value)
+        return value
+
+    return json.dumps([func.__name__, canonical(dict(bound.arguments))], sort_keys=True, default=str)
+
+
+class ToolMemo:
+    """Remembers tool results for the life of one agent, so a repeated call with the same arguments
+    (the same geocode, the same bounding box search after a failed reasoning step) skips the request.
+
+    Error results and exceptions are never remembered, so a failed call can be retried. The datasets a result
+    was built from are remembered with it and noted again on every hit.
+    """
+
+    def __init__(self):
+        self._results = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def wrap(self, func):
+        """Wrap a tool so repeated calls are answered from the memo. Keeps the name, signature and docstring the agent sees."""
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            key = canonical_call(func, args, kwargs)
+            with self._lock:
+                found = key in self._results
+                result, datasets = self._results.get(key, (None, []))
+                self.hits += found
+                self.misses += not found
+            metrics.record(memo="hit" if found else "miss")
+            if found:
+                for dataset_id in datasets:
+                    metrics.record_dataset(dataset_id)
+                return result
+
+            result = func(*args, **kwargs)
+            if not (isinstance(result, str) and result.startswith("Error")):
+                with self._lock:
+                    self._results[key] = (result, metrics.recorded_datasets())
+            return result
+
+        return wrapper
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self._results)}
@@ -0,0 +1,155 @@
+import json
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from itertools import count
+
+# Every tool call and upstream request becomes a span (a flat dict) so a run can be dumped to JSON
+# and compared. Spans nest through a context variable, so an HTTP span knows which tool issued it.
+_spans = []
+_lock = threading.Lock()
+_ids = count(1)
+_current_span = ContextVar("current_span", default=None)
+
+
+@contextmanager
+def span(kind: str, name: str, **fields):
+    """Time a block of work and record it as a span. Yields the span dict so callers can add fields."""
+    parent = _current_span.get()
+    record = {
+        "id": next(_ids),
+        "parent_id": parent["id"] if parent else None,
+        "kind": kind,
+        "name": name,
+        "started_at": time.time(),
+        **fields,
+    }
+    token = _current_span.set(record)
+    start = time.perf_counter()
+    try:
+        yield record
+    except Exception as e:
+        record["error"] = repr(e)
+        raise
+    finally:
+        record["wall_time_s"] = round(time.perf_counter() - start, 6)
+        _current_span.reset(token)
+        with _lock:
+            _spans.append(record)
+
+
+def record(**fields):
+    """Attach fields to the innermost open span, if there is one."""
+    current = _current_span.get()
+    if current is not None:
+        current.update(fields)
+
+
+def record_dataset(dataset_id: str):
+    """Note on the innermost open span that it drew on a dataset, whether by a request or from a local copy
+    (a cache, the mural catalog, the name index, the mirror), so an answer built on it expires with it."""
+    current = _current_span.get()
+    if current is not None and dataset_id not in current.setdefault("datasets", []):
+        current["datasets"].append(dataset_id)
+
+
+def recorded_datasets() -> list:
+    """The datasets noted so far on the innermost open span."""
+    current = _current_span.get()
+    return list(current.get("datasets", [])) if current is not None else []
+
+
+def datasets_used(spans: list = None) -> list:
+    """Every dataset a run drew on: the ones requested over HTTP and the ones read locally."""
+    spans = get_spans() if spans is None else spans
+    found = [s["name"] for s in spans if s["kind"] == "http"] + [d for s in spans for d in s.get("datasets", [])]
+    return list(dict.fromkeys(found))
+
+
+def increment(field: str, amount: int = 1):
+    """Add to a counter on the innermost open span, if there is one."""
+    current = _current_span.get()
+    if current is not None:
+        current[field] = current.get(field, 0) + amount
+
+
+def instrument_tool(func):
+    """Wrap a tool so each call is recorded as a 'tool' span. Keeps the name, signature and docstring the agent sees."""
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        with span("tool", func.__name__) as s:
+            result = func(*args, **kwargs)
+            s["output_chars"] = len(str(result))
+            return result
+
+    return wrapper
+
+
+def get_spans() -> list:
+    """Return a copy of all finished spans, ordered by start time."""
+    with _lock:
+        return sorted((dict(s) for s in _spans), key=lambda s: s["started_at"])
+
+
+def reset():
+    """Forget all recorded spans."""
+    with _lock:
+        _spans.clear()
+
+
+def summarize(spans: list = None) -> dict:
+    """Aggregate spans by (kind, name): call count, total and max wall time, and summed counters."""
+    spans = get_spans() if spans is None else spans
+    totals = {}
+    for s in spans:
+        key = f"{s['kind']}:{s['name']}"
+        t = totals.setdefault(key, {
+            "kind": s["kind"], "name": s["name"], "calls": 0, "wall_time_s": 0.0, "max_wall_time_s": 0.0,
+            "bytes": 0, "rows_returned": 0, "rows_rendered": 0, "truncated": 0, "cache_hits": 0,
+            "cache_misses": 0, "memo_hits": 0, "memo_misses": 0, "area_hits": 0, "area_misses": 0, "interval_hits": 0, "interval_misses": 0, "retries": 0, "rate_limit_wait_s": 0.0, "max_queue_depth": 0, "errors": 0,
+        })
+        t["calls"] += 1
+        t["wall_time_s"] += s.get("wall_time_s", 0.0)
+        t["max_wall_time_s"] = max(t["max_wall_time_s"], s.get("wall_time_s", 0.0))
+        for field in ("bytes", "rows_returned", "rows_rendered", "retries", "rate_limit_wait_s"):
+            t[field] += s.get(field) or 0
+        t["max_queue_depth"] = max(t["max_queue_depth"], s.get("queue_depth") or 0)
+        t["truncated"] += 1 if s.get("truncated") else 0
+        t["cache_hits"] += 1 if s.get("cache") == "hit" else 0
+        t["cache_misses"] += 1 if s.get("cache") == "miss" else 0
+        t["memo_hits"] += 1 if s.get("memo") == "hit" else 0
+        t["memo_misses"] += 1 if s.get("memo") == "miss" else 0
+        t["area_hits"] += 1 if s.get("area_cache") == "hit" else 0
+        t["area_misses"] += 1 if s.get("area_cache") == "miss" else 0
+        t["interval_hits"] += 1 if s.get("interval_cache") == "hit" else 0
+        t["interval_misses"] += 1 if s.get("interval_cache") == "miss" else 0
+        t["errors"] += 1 if s.get("error") or (s.get("status") or 200) >= 400 else 0
+    return totals
+
+
+def summary_table(spans: list = None) -> str:
+    """Render the span summary as a fixed-width text table, slowest first."""
+    rows = sorted(summarize(spans).values(), key=lambda t: t["wall_time_s"], reverse=True)
+    header = f"{'span':<52}{'calls':>6}{'total s':>10}{'max s':>9}{'KB':>9}{'rows':>8}{'shown':>7}{'trunc':>6}{'hit/miss':>10}{'memo':>8}{'area':>8}{'retry':>6}{'wait s':>8}{'err':>5}"
+    lines = [header, "-" * len(header)]
+    for t in rows:
+        lines.append(
+            f"{t['kind'] + ':' + t['name']:<52}{t['calls']:>6}{t['wall_time_s']:>10.3f}{t['max_wall_time_s']:>9.3f}"
+            f"{t['bytes'] / 1024:>9.1f}{t['rows_returned']:>8}{t['rows_rendered']:>7}{t['truncated']:>6}"
+            f"{str(t['cache_hits']) + '/' + str(t['cache_misses']):>10}{str(t['memo_hits']) + '/' + str(t['memo_misses']):>8}"
+            f"{str(t['area_hits']) + '/' + str(t['area_misses']):>8}"
+            f"{t['retries']:>6}{t['rate_limit_wait_s']:>8.2f}{t['errors']:>5}"
+        )
+    return "\n".join(lines)
+
+
+def write_metrics(path: str, **extra):
+    """Write all spans plus their summary to a JSON file."""
+    spans = get_spans()
+    payload = {"spans": spans, "summary": list(summarize(spans).values()), **extra}
+    with open(path, "w") as f:
+        json.dump(payload, f, indent=2, default=str)
+    print(f"Metrics written to {path}")
@@ -0,0 +1,219 @@
+import json
+import os
+import sqlite3
+from itertools import islice
+from pathlib import Path
+from urllib.parse import quote
+from dotenv import load_dotenv
+from . import metrics
+from .socrata import SOCRATA_BASE_URL, iter_pages
+from .regions import REGION_LAYERS, RegionIndex
+
+load_dotenv()
+OPEN_DATA_APP_TOKEN = os.getenv("OPEN_DATA_APP_TOKEN")
+
+# A local SQLite copy of the datasets, with every record tagged with the regions it falls in when it is synced
+_MIRROR_PATH = Path(__file__).resolve().parent.parent / ".mirror" / "mirror.sqlite"
+# Datasets kept in the mirror: name -> dataset id, id column and date column (None for murals, which only have a year)
+MIRROR_DATASETS = {
+    "violations": {"dataset_id": "22u3-xenr", "id_field": "id", "date_field": "violation_date"},
+    "permits": {"dataset_id": "ydr8-5enu", "id_field": "id", "date_field": "issue_date"},
+    "food_inspections": {"dataset_id": "4ijn-s7e5", "id_field": "inspection_id", "date_field": "inspection_date"},
+    "crashes": {"dataset_id": "85ca-t3if", "id_field": "crash_record_id", "date_field": "crash_date"},
+    "murals": {"dataset_id": "we8h-apcf", "id_field": "mural_registration_id", "date_field": None},
+}
+# Rows fetched, tagged and written per transaction during a sync
+SYNC_BATCH_ROWS = 5000
+
+
+def mirror_path() -> Path:
+    """Where the mirror lives: SOCRATA_MIRROR, or .mirror/mirror.sqlite next to the tools."""
+    return Path(os.getenv("SOCRATA_MIRROR") or _MIRROR_PATH)
+
+
+class Mirror:
+    """A SQLite copy of the Socrata datasets, kept current by sync() and queried by region and date.
+
+    Each dataset is a table of (id, date, coordinates, one column per region layer, :updated_at, the record as JSON),
+    indexed on every region column and the date, so "violations in Ward 27 this year" is an indexed equality lookup
+    instead of a point-in-polygon test per row.
+    """
+
+    def __init__(self, path: str = None):
+        self.path = Path(path) if path else mirror_path()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.db = sqlite3.connect(self.path)
+        regions = ", ".join(f"{layer} TEXT" for layer in REGION_LAYERS)
+        with self.db:
+            self.db.execute("CREATE TABLE IF NOT EXISTS sync_state (dataset TEXT PRIMARY KEY, high_water_mark TEXT, synced_at TEXT)")
+            self.db.execute("CREATE TABLE IF NOT EXISTS regions (layer TEXT, label TEXT, geometry TEXT, PRIMARY KEY (layer, label))")
+            for name in MIRROR_DATASETS:
+                self.db.execute(
+                    f"CREATE TABLE IF NOT EXISTS {name} (id TEXT PRIMARY KEY, date TEXT, latitude REAL, longitude REAL, "
+                    f"{regions}, updated_at TEXT, record TEXT)"
+                )
+                for layer in REGION_LAYERS:
+                    self.db.execute(f"CREATE INDEX IF NOT EXISTS {name}_{layer} ON {name} ({layer}, date)")
+                self.db.execute(f"CREATE INDEX IF NOT EXISTS {name}_date ON {name} (date)")
+
+    def close(self):
+        self.db.close()
+
+    def sync_regions(self, layers=("ward",)):
+        """Fetch the boundaries of each region layer from the portal, replacing the stored ones."""
+        for layer in layers:
+            dataset_id, label_field = REGION_LAYERS[layer]
+            url = f"{SOCRATA_BASE_URL}/{dataset_id}.json?$select={label_field}, the_geom&$order=:id&$$app_token={OPEN_DATA_APP_TOKEN}"
+            rows = [(layer, str(r[label_field]), json.dumps(r["the_geom"])) for r in iter_pages(url) if r.get("the_geom")]
+            with self.db:
+                self.db.execute("DELETE FROM regions WHERE layer = ?", (layer,))
+                self.db.executemany("INSERT INTO regions VALUES (?, ?, ?)", rows)
+            print(f"{layer}: {len(rows)} boundaries")
+
+    def region_index(self, layer: str) -> RegionIndex:
+        rows = self.db.execute("SELECT label, geometry FROM regions WHERE layer = ? ORDER BY label", (layer,)).fetchall()
+        return RegionIndex([(label, json.loads(geometry)) for label, geometry in rows])
+
+    def high_water_mark(self, dataset: str):
+        """The newest `:updated_at` synced for a dataset, or None if it was never synced."""
+        row = self.db.execute("SELECT high_water_mark FROM sync_state WHERE dataset = ?", (dataset,)).fetchone()
+        return row[0] if row else None
+
+    def sync(self, datasets=None, since: str = None, layers=("ward",)) -> dict:
+        """Bring the mirror up to date: fetch rows changed since the last sync, tag them with their regions and upsert them.
+
+        Args:
+            datasets: Names from MIRROR_DATASETS, all of them by default
+            since: On a dataset's first sync, only fetch records dated on or after this date (YYYY-MM-DD) rather than its full history
+            layers: Region layers to tag records with; their boundaries are fetched first if not stored yet, and
+                the records already in the mirror are tagged with them too. Layers tagged by earlier syncs are kept up.
+
+        Returns:
+            {dataset name: rows written}
+        """
+        stored = {layer for (layer,) in self.db.execute("SELECT DISTINCT layer FROM regions")}
+        added = [layer for layer in layers if layer not in stored]
+        self.sync_regions(added)
+        self.retag(added)
+        indexes = {layer: self.region_index(layer) for layer in REGION_LAYERS if layer in stored or layer in layers}
+
+        written = {}
+        for name in datasets or MIRROR_DATASETS:
+            spec = MIRROR_DATASETS[name]
+            mark = self.high_water_mark(name)
+            if mark:
+                where = f":updated_at > '{mark}'"
+            elif since and spec["date_field"]:
+                where = f"{spec['date_field']} >= '{since}T00:00:00'"
+            else:
+                where = None
+            url = (
+                f"{SOCRATA_BASE_URL}/{spec['dataset_id']}.json?$select={quote(':*, *', safe=':*,')}"
+                + (f"&$where={quote(where, safe=chr(39) + '(),=:><')}" if where else "")
+                + f"&$order=:id&$$app_token={OPEN_DATA_APP_TOKEN}"
+            )
+            # Rows are tagged and written a batch at a time as they stream in, so a large first sync holds one batch
+            rows, written[name], newest = iter_pages(url), 0, mark or ""
+            while batch := list(islice(rows, SYNC_BATCH_ROWS)):
+                newest = max([newest] + [r.get(":updated_at") or "" for r in batch])
+                self._upsert(name, spec, batch, indexes)
+                written[name] += len(batch)
+            with self.db:
+                self.db.execute(
+                    "INSERT OR REPLACE INTO sync_state VALUES (?, ?, datetime('now'))", (name, newest or None)
+                )
+            print(f"{name}: {written[name]} record(s) synced")
+        return written
+
+    def retag(self, layers):
+        """Tag every record already in the mirror with the given region layers, e.g. after adding a layer or
+        refreshing its boundaries. Records are read and written a batch at a time."""
+        for layer in layers:
+            index = self.region_index(layer)
+            for name in MIRROR_DATASETS:
+                last, tagged = 0, 0
+                while batch := self.db.execute(
+                    f"SELECT rowid, latitude, longitude FROM {name} WHERE rowid > ? ORDER BY rowid LIMIT ?", (last, SYNC_BATCH_ROWS)
+                ).fetchall():
+                    tags = index.assign([r[1] for r in batch], [r[2] for r in batch])
+                    with self.db:
+                        self.db.executemany(f"UPDATE {name} SET {layer} = ? WHERE rowid = ?", [(tag, r[0]) for tag, r in zip(tags, batch)])
+                    last, tagged = batch[-1][0], tagged + len(batch)
+                if tagged:
+                    print(f"{name}: {tagged} record(s) tagged with {layer}")
+
+    def _upsert(self, name: str, spec: dict, batch: list, indexes: dict):
+        latitudes = [r.get("latitude") for r in batch]
+        longitudes = [r.get("longitude") for r in batch]
+        # One vectorized point-in-polygon pass per layer for the whole batch
+        tags = {layer: index.assign(latitudes, longitudes) for layer, index in indexes.items()}
+        values = []
+        for i, r in enumerate(batch):
+            record = {k: v for k, v in r.items() if not k.startswith(":")}
+            date = (r.get(spec["date_field"]) or "")[:19] if spec["date_field"] else ""
+            values.append((
+                str(r.get(spec["id_field"]) or r.get(":id")),
+                date or None,
+                _float(latitudes[i]),
+                _float(longitudes[i]),
+                *[tags[layer][i] for layer in tags],
+                r.get(":updated_at"),
+                json.dumps(record),
+            ))
+        # Only the layers tagged in this sync are written, so a record keeps its tags for the others
+        columns = ["id", "date", "latitude", "longitude", *tags, "updated_at", "record"]
+        updates = ", ".join(f"{column} = excluded.{column}" for column in columns[1:])
+        with self.db:
+            self.db.executemany(
+                f"INSERT INTO {name} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))}) "
+                f"ON CONFLICT (id) DO UPDATE SET {updates}",
+                values,
+            )
+
+    def records(self, dataset: str, start_date: str = None, end_date: str = None, limit: int = None, matching: dict = None,
+                **regions) -> list:
+        """Records of a dataset in a region, newest first, e.g. records("violations", ward="27", start_date="2025-01-01").
+
+        The mirror keeps every record whatever its status, so that a sync can update one that changed status.
+        Pass `matching` to get only the records the portal tools show, e.g. {"inspection_status": "FAILED"}.
+
+        Args:
+            dataset: A name from MIRROR_DATASETS
+            start_date: Optional start date in YYYY-MM-DD format
+            end_date: Optional end date in YYYY-MM-DD format
+            limit: Optional most records to return
+            matching: Optional field = value filters on the records themselves, e.g. {"permit_status": "ACTIVE"}
+            regions: Region layer = label filters, e.g. ward="27" or community_area="24"
+
+        Returns:
+            The records as they came from the portal.
+        """
+        if dataset not in MIRROR_DATASETS:
+            raise ValueError(f"Unknown dataset {dataset!r}, expected one of {', '.join(MIRROR_DATASETS)}")
+        metrics.record_dataset(MIRROR_DATASETS[dataset]["dataset_id"])
+        clauses, params = [], []
+        for layer, label in regions.items():
+            if layer not in REGION_LAYERS:
+                raise ValueError(f"Unknown region layer {layer!r}, expected one of {', '.join(REGION_LAYERS)}")
+            clauses.append(f"{layer} = ?")
+            params.append(str(label))
+        for field, value in (matching or {}).items():
+            clauses.append("json_extract(record, ?) = ?")
+            params.extend([f"$.{field}", value])
+        if start_date:
+            clauses.append("date >= ?")
+            params.append(f"{start_date}T00:00:00")
+        if end_date:
+            clauses.append("date <= ?")
+            params.append(f"{end_date}T23:59:59")
+        query = f"SELECT record FROM {dataset}" + (" WHERE " + " AND ".join(clauses) if clauses else "") + " ORDER BY date DESC"
+        if limit:
+            query += f" LIMIT {int(limit)}"
+        return [json.loads(record) for (record,) in self.db.execute(query, params)]
+
+
+def _float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
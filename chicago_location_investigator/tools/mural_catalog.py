@@ -0,0 +1,177 @@
+import math
+import os
+import time
+from pathlib import Path
+import numpy as np
+from dotenv import load_dotenv
+from diskcache import Cache
+from . import metrics
+from .socrata import SOCRATA_BASE_URL, iter_pages
+
+load_dotenv()
+OPEN_DATA_APP_TOKEN = os.getenv("OPEN_DATA_APP_TOKEN")
+
+# The mural registry is a few thousand rows and changes rarely, so the whole of it is kept on disk and in memory
+_MURAL_CATALOG_DIR = Path(__file__).resolve().parent.parent / ".mural_catalog"
+MURAL_CATALOG_TTL_S = 7 * 86400
+# Points are projected onto a flat plane in meters around Chicago, close enough for distances within the city
+METERS_PER_DEGREE_LATITUDE = 111320
+CHICAGO_LATITUDE = 41.84
+METERS_PER_MILE = 1609.344
+LEAF_SIZE = 16
+
+_catalog = None
+
+
+def project(latitude, longitude):
+    """Latitude/longitude (scalars or arrays) to (y, x) meters on a plane, for box and distance queries."""
+    return (
+        np.asarray(latitude, dtype=float) * METERS_PER_DEGREE_LATITUDE,
+        np.asarray(longitude, dtype=float) * METERS_PER_DEGREE_LATITUDE * math.cos(math.radians(CHICAGO_LATITUDE)),
+    )
+
+
+class KDTree:
+    """A 2-d tree over projected points, answering box and radius queries without looking at every point.
+
+    Nodes are kept in flat lists: each covers order[start:end] and has the bounding box of its points, so whole
+    subtrees are taken or skipped by their box and only straddling leaves are filtered point by point.
+    """
+
+    def __init__(self, points: np.ndarray):
+        self.points = points
+        self.order = np.arange(len(points))
+        self.start, self.end, self.lo, self.hi, self.children = [], [], [], [], []
+        if len(points):
+            self._build(0, len(points))
+
+    def _build(self, start: int, end: int) -> int:
+        node = len(self.start)
+        members = self.points[self.order[start:end]]
+        self.start.append(start)
+        self.end.append(end)
+        self.lo.append(members.min(axis=0))
+        self.hi.append(members.max(axis=0))
+        self.children.append(None)
+        if end - start > LEAF_SIZE:
+            axis = int(np.argmax(self.hi[node] - self.lo[node]))
+            middle = (end - start) // 2
+            self.order[start:end] = self.order[start:end][np.argpartition(members[:, axis], middle)]
+            self.children[node] = (self._build(start, start + middle), self._build(start + middle, end))
+        return node
+
+    def _query(self, box_relation, point_mask) -> np.ndarray:
+        found, stack = [], [0] if self.start else []
+        while stack:
+            node = stack.pop()
+            relation = box_relation(self.lo[node], self.hi[node])
+            if relation == "outside":
+                continue
+            indices = self.order[self.start[node]:self.end[node]]
+            if relation == "inside":
+                found.append(indices)
+            elif self.children[node] is None:
+                found.append(indices[point_mask(self.points[indices])])
+            else:
+                stack.extend(self.children[node])
+        return np.sort(np.concatenate(found)) if found else np.array([], dtype=int)
+
+    def in_box(self, lo: np.ndarray, hi: np.ndarray) -> np.ndarray:
+        """Indices of the points with lo <= point <= hi on both axes."""
+        def relation(node_lo, node_hi):
+            if np.any(node_hi < lo) or np.any(node_lo > hi):
+                return "outside"
+            return "inside" if np.all(node_lo >= lo) and np.all(node_hi <= hi) else "partial"
+
+        return self._query(relation, lambda p: np.all((p >= lo) & (p <= hi), axis=1))
+
+    def within(self, center: np.ndarray, radius: float) -> np.ndarray:
+        """Indices of the points within radius of center."""
+        def relation(node_lo, node_hi):
+            nearest = np.clip(center, node_lo, node_hi)
+            if np.hypot(*(nearest - center)) > radius:
+                return "outside"
+            farthest = np.maximum(np.abs(node_lo - center), np.abs(node_hi - center))
+            return "inside" if np.hypot(*farthest) <= radius else "partial"
+
+        return self._query(relation, lambda p: np.hypot(*(p - center).T) <= radius)
+
+
+def _year(mural: dict) -> float:
+    try:
+        return float(str(mural.get("year_installed"))[:4])
+    except ValueError:
+        return math.nan
+
+
+class MuralCatalog:
+    """Every registered mural, indexed by location (a KDTree) and by year installed (a sorted array)."""
+
+    def __init__(self, murals: list, fetched_at: float = None):
+        self.murals = murals
+        self.fetched_at = time.time() if fetched_at is None else fetched_at
+        located = [i for i, m in enumerate(murals) if m.get("latitude") and m.get("longitude")]
+        self.located = np.array(located, dtype=int)
+        y, x = project([murals[i]["latitude"] for i in located], [murals[i]["longitude"] for i in located])
+        self.tree = KDTree(np.stack([y, x], axis=1) if located else np.empty((0, 2)))
+        self.years = np.array([_year(m) for m in murals])
+        # Unknown years (NaN) sort last, past every searchsorted bound
+        self.year_order = np.argsort(self.years, kind="stable")
+        self.sorted_years = self.years[self.year_order]
+
+    def in_box(self, coordinate_boundaries: dict) -> np.ndarray:
+        """Indices of the murals inside {"north", "south", "east", "west"} boundaries."""
+        lo = np.array(project(coordinate_boundaries["south"], coordinate_boundaries["west"]))
+        hi = np.array(project(coordinate_boundaries["north"], coordinate_boundaries["east"]))
+        return self.located[self.tree.in_box(lo, hi)]
+
+    def within(self, latitude: float, longitude: float, radius_m: float) -> np.ndarray:
+        """Indices of the murals within radius_m meters of a point."""
+        return self.located[self.tree.within(np.array(project(latitude, longitude)), radius_m)]
+
+    def installed_between(self, start_year: int = None, end_year: int = None) -> np.ndarray:
+        """Indices of the murals installed from start_year through end_year; either end may be left open."""
+        first = np.searchsorted(self.sorted_years, start_year, side="left") if start_year else 0
+        last = np.searchsorted(self.sorted_years, end_year, side="right") if end_year else np.searchsorted(self.sorted_years, np.inf, side="right")
+        return np.sort(self.year_order[first:last])
+
+    def search(self, coordinate_boundaries: dict = None, latitude: float = None, longitude: float = None, radius_m: float = None,
+               start_year: int = None, end_year: int = None) -> list:
+        """Murals matching every filter given: inside a box, within radius_m of a point, installed between two years.
+
+        Returns:
+            The matching mural rows, nearest first for a radius search and otherwise most recently installed first.
+        """
+        matches = np.arange(len(self.murals))
+        if coordinate_boundaries:
+            matches = np.intersect1d(matches, self.in_box(coordinate_boundaries))
+        if radius_m is not None:
+            matches = np.intersect1d(matches, self.within(latitude, longitude, radius_m))
+        if start_year or end_year:
+            matches = np.intersect1d(matches, self.installed_between(start_year, end_year))
+
+        if radius_m is not None:
+            y, x = project([float(self.murals[i]["latitude"]) for i in matches], [float(self.murals[i]["longitude"]) for i in matches])
+            center_y, center_x = project(latitude, longitude)
+            matches = matches[np.argsort(np.hypot(y - center_y, x - center_x), kind="stable")]
+        else:
+            matches = matches[np.argsort(-np.nan_to_num(self.years[matches], nan=-np.inf), kind="stable")]
+        return [self.murals[i] for i in matches]
+
+
+def mural_catalog(directory: str = None, ttl_s: float = MURAL_CATALOG_TTL_S) -> MuralCatalog:
+    """The mural catalog, loaded from disk or fetched in full from the portal when missing or older than ttl_s."""
+    global _catalog
+    metrics.record_dataset("we8h-apcf")
+    if _catalog is None or time.time() - _catalog.fetched_at > ttl_s:
+        cache = Cache(str(directory or _MURAL_CATALOG_DIR))
+        # Keyed by portal, so a run against the benchmark stand-in doesn't leave its murals behind
+        key = f"murals:{SOCRATA_BASE_URL}"
+        entry = cache.get(key)
+        if entry is None:
+            print("Loading the mural catalog")
+            url = f"{SOCRATA_BASE_URL}/we8h-apcf.json?$order=:id&$$app_token={OPEN_DATA_APP_TOKEN}"
+            entry = {"fetched_at": time.time(), "murals": list(iter_pages(url))}
+            cache.set(key, entry, expire=ttl_s)
+        _catalog = MuralCatalog(entry["murals"], entry["fetched_at"])
+    return _catalog
@@ -0,0 +1,143 @@
+import os
+import re
+import time
+from collections import Counter
+from pathlib import Path
+from dotenv import load_dotenv
+from diskcache import Cache
+from . import metrics
+from .socrata import SOCRATA_BASE_URL, iter_pages
+
+load_dotenv()
+OPEN_DATA_APP_TOKEN = os.getenv("OPEN_DATA_APP_TOKEN")
+
+# The index of food inspection business names is built from the portal once and kept on disk
+_NAME_INDEX_DIR = Path(__file__).resolve().parent.parent / ".name_index"
+# New restaurants show up daily, but a name search that misses one falls back to the portal's own matching
+NAME_INDEX_TTL_S = 7 * 24 * 3600
+# Lowest similarity (Dice coefficient of the trigrams) counted as a match
+MIN_SCORE = 0.4
+# Lowest similarity at which a name is taken to be the business asked about, e.g. "MC DONALD'S" for "MCDONALDS" (0.76)
+RESOLVE_SCORE = 0.6
+
+_index = None
+
+
+def normalize_name(name: str) -> str:
+    """Upper-case a business name, spell out '&' and drop punctuation, so "DANTE'S B&G" matches "DANTES B AND G"."""
+    name = re.sub(r"['’`.]", "", name.upper().replace("&", " AND "))
+    return " ".join(re.sub(r"[^A-Z0-9]+", " ", name).split())
+
+
+def trigrams(name: str) -> set:
+    """The three-character pieces of a normalized name, padded so word starts count too."""
+    padded = f"  {name} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class NameIndex:
+    """Trigram index from business names to their license numbers, for fuzzy name search without a portal scan.
+
+    Each distinct normalized name is one entry, keeping every raw spelling of it found in the data; the postings
+    map every trigram to the entries containing it, so a search only scores names sharing at least one trigram with the query.
+    """
+
+    def __init__(self, names: list, licenses: list, sizes: list = None, postings: dict = None, spellings: list = None,
+                 fetched_at: float = None):
+        self.names = names
+        self.fetched_at = time.time() if fetched_at is None else fetched_at
+        self.licenses = licenses
+        self.spellings = spellings or [[name] for name in names]
+        self.sizes = sizes
+        self.postings = postings
+        if postings is None:
+            self.sizes, self.postings = [], {}
+            for i, name in enumerate(names):
+                grams = trigrams(normalize_name(name))
+                self.sizes.append(len(grams))
+                for gram in grams:
+                    self.postings.setdefault(gram, []).append(i)
+        # Names without spaces, for the substring matches the portal's `like '%name%'` would find
+        self.compact = [normalize_name(name).replace(" ", "") for name in names]
+
+    @classmethod
+    def from_rows(cls, rows) -> "NameIndex":
+        """Build the index from rows with dba_name and license_, e.g. the portal's distinct name and license pairs."""
+        ids, names, licenses, spellings = {}, [], [], []
+        for row in rows:
+            name = " ".join((row.get("dba_name") or "").split())
+            key = normalize_name(name)
+            if not key:
+                continue
+            if key not in ids:
+                ids[key] = len(names)
+                names.append(name)
+                licenses.append([])
+                spellings.append([])
+            if name not in spellings[ids[key]]:
+                spellings[ids[key]].append(name)
+            license_id = row.get("license_")
+            if license_id and license_id != "0" and license_id not in licenses[ids[key]]:
+                licenses[ids[key]].append(license_id)
+        return cls(names, licenses, spellings=spellings)
+
+    def search(self, name: str, limit: int = 5, min_score: float = MIN_SCORE) -> list:
+        """Rank indexed names by trigram similarity to a name.
+
+        Returns:
+            Up to `limit` (all when None) dicts with "name", "score" (0-1), "licenses" and "spellings", best match first.
+        """
+        return [self._match(i, score) for score, i in self._scored(name) if score >= min_score][:limit]
+
+    def resolve(self, name: str) -> list:
+        """Every indexed name that is the business asked about: the ones containing it, as the portal's
+        `like '%name%'` would find (so "SUBWAY" gets "SUBWAY #2345"), and those scoring at least RESOLVE_SCORE.
+
+        Returns:
+            Dicts like search(), best match first.
+        """
+        query = normalize_name(name).replace(" ", "")
+        if not query:
+            return []
+        scores = {i: score for score, i in self._scored(name)}
+        contained = {i for i, compact in enumerate(self.compact) if query in compact}
+        found = contained | {i for i, score in scores.items() if score >= RESOLVE_SCORE}
+        ranked = sorted(found, key=lambda i: (-scores.get(i, 0), self.names[i]))
+        return [self._match(i, scores.get(i, 0)) for i in ranked]
+
+    def _scored(self, name: str) -> list:
+        """(score, entry) for every name sharing a trigram with a name, best first."""
+        query = trigrams(normalize_name(name))
+        shared = Counter()
+        for gram in query:
+            shared.update(self.postings.get(gram, ()))
+        return sorted(
+            ((2 * n / (len(query) + self.sizes[i]), i) for i, n in shared.items()),
+            key=lambda s: (-s[0], self.names[s[1]]),
+        )
+
+    def _match(self, i: int, score: float) -> dict:
+        return {"name": self.names[i], "score": round(score, 2), "licenses": self.licenses[i], "spellings": self.spellings[i]}
+
+
+def name_index(directory: str = None, ttl_s: float = NAME_INDEX_TTL_S) -> NameIndex:
+    """The food inspection name index, loaded from disk or built from the portal when missing or older than ttl_s."""
+    global _index
+    metrics.record_dataset("4ijn-s7e5")
+    if _index is None or time.time() - _index.fetched_at > ttl_s:
+        cache = Cache(str(directory or _NAME_INDEX_DIR))
+        # Only plain lists and dicts are stored, so the index loads however this module was imported. Keyed
+        # by portal, so a run against the benchmark stand-in doesn't leave its names behind
+        key = f"food_inspection_names:{SOCRATA_BASE_URL}"
+        state = cache.get(key)
+        if state is None:
+            print("Building the restaurant name index")
+            url = f"{SOCRATA_BASE_URL}/4ijn-s7e5.json?$select=dba_name, license_&$group=dba_name, license_&$order=dba_name, license_&$$app_token={OPEN_DATA_APP_TOKEN}"
+            index = NameIndex.from_rows(iter_pages(url))
+            state = {
+                "names": index.names, "licenses": index.licenses, "sizes": index.sizes, "postings": index.postings,
+                "spellings": index.spellings, "fetched_at": index.fetched_at,
+            }
+            cache.set(key, state, expire=ttl_s)
+        _index = NameIndex(**state)
+    return _index
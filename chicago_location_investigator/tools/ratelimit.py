@@ -0,0 +1,155 @@
+import asyncio
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from . import metrics
+
+# Requests per second and burst size allowed to each upstream host, shared by every thread and
+# coroutine in the process. Other hosts (a local stand-in, a mirror) are effectively unlimited,
+# but still get retries.
+HOST_RATES = {
+    "data.cityofchicago.org": (5.0, 10),
+    "geocode.arcgis.com": (2.0, 4),
+}
+DEFAULT_RATE = (1000.0, 1000)
+
+# Throttling and transient upstream errors that are worth retrying
+RETRY_STATUSES = {429, 502, 503, 504}
+MAX_RETRIES = 4
+BASE_DELAY_S = 1.0
+# Longest a single retry waits, whatever Retry-After asks for, so one bad header can't stall every caller
+MAX_RETRY_DELAY_S = 60.0
+
+
+class TokenBucket:
+    """A token bucket that callers reserve a slot from, then wait for outside the lock, so the same
+    bucket can be shared by threads (acquire) and asyncio tasks (acquire_async) without blocking either.
+
+    A throttled response pauses the whole bucket, so every caller backs off, not just the one that got it.
+    """
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+        self.waiting = 0
+        self.max_waiting = 0
+        self.requests = 0
+        self.throttled = 0
+        self.total_wait_s = 0.0
+
+    def _reserve(self) -> float:
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            wait = max(0.0, -self._tokens / self.rate, self._paused_until - now)
+            self.requests += 1
+            if wait > 0:
+                self.waiting += 1
+                self.max_waiting = max(self.max_waiting, self.waiting)
+                self.total_wait_s += wait
+            metrics.record(queue_depth=self.waiting)
+            return wait
+
+    def _done_waiting(self):
+        with self._lock:
+            self.waiting -= 1
+
+    def acquire(self) -> float:
+        """Wait (blocking this thread) until a request may be sent. Returns the seconds waited."""
+        wait = self._reserve()
+        if wait > 0:
+            try:
+                time.sleep(wait)
+            finally:
+                self._done_waiting()
+        return wait
+
+    async def acquire_async(self) -> float:
+        """Wait (without blocking the event loop) until a request may be sent. Returns the seconds waited."""
+        wait = self._reserve()
+        if wait > 0:
+            try:
+                await asyncio.sleep(wait)
+            finally:
+                self._done_waiting()
+        return wait
+
+    def pause(self, seconds: float):
+        """Hold every caller back for `seconds`, e.g. after a 429."""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self.throttled += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "rate_per_s": self.rate, "burst": self.burst, "requests": self.requests, "waiting": self.waiting,
+                "max_waiting": self.max_waiting, "total_wait_s": round(self.total_wait_s, 3), "throttled": self.throttled,
+            }
+
+
+_buckets = {}
+_buckets_lock = threading.Lock()
+
+
+def limiter(host: str) -> TokenBucket:
+    """The process-wide bucket for a host."""
+    with _buckets_lock:
+        if host not in _buckets:
+            _buckets[host] = TokenBucket(*HOST_RATES.get(host, DEFAULT_RATE))
+        return _buckets[host]
+
+
+def snapshot() -> dict:
+    """Current queue and throttling stats for every host seen so far."""
+    with _buckets_lock:
+        buckets = dict(_buckets)
+    return {host: bucket.stats() for host, bucket in buckets.items()}
+
+
+def parse_retry_after(value):
+    """Seconds to wait from a Retry-After header, which is either a number of seconds or an HTTP date."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+def retry_delay(attempt: int, retry_after: float = None) -> float:
+    """How long to back off before retry number `attempt` (0-based): the server's Retry-After when it
+    gives one, otherwise exponential backoff with full jitter so retrying callers spread out. Either is
+    capped at MAX_RETRY_DELAY_S."""
+    if retry_after is not None:
+        return min(retry_after, MAX_RETRY_DELAY_S)
+    return random.uniform(0, min(BASE_DELAY_S * 2 ** attempt, MAX_RETRY_DELAY_S))
+
+
+def send(host: str, request, max_retries: int = MAX_RETRIES):
+    """Call request() (returning a requests.Response) under the host's rate limit, retrying throttled
+    and transient failures. Wait time and retries are recorded on the current span."""
+    bucket = limiter(host)
+    for attempt in range(max_retries + 1):
+        metrics.increment("rate_limit_wait_s", bucket.acquire())
+        response = request()
+        if response.status_code not in RETRY_STATUSES or attempt == max_retries:
+            metrics.record(retries=attempt)
+            return response
+        delay = retry_delay(attempt, parse_retry_after(response.headers.get("Retry-After")))
+        # Release the connection (a streamed body would otherwise hold it) before waiting to retry
+        response.close()
+        print(f"{host} returned {response.status_code}, retrying in {delay:.1f}s")
+        bucket.pause(delay)
@@ -0,0 +1,62 @@
+import numpy as np
+
+# Boundary datasets records can be tagged with: layer -> (dataset id, label column). Every one has its shape in the_geom.
+REGION_LAYERS = {
+    "ward": ("p293-wvbd", "ward"),
+    "community_area": ("igwz-8jzy", "area_numbe"),
+    "census_tract": ("74p9-q2aq", "geoid10"),
+}
+# Most point x edge pairs tested at once, bounding the temporary arrays of a point-in-polygon pass
+MAX_PAIRS = 2_000_000
+
+
+def to_floats(values) -> np.ndarray:
+    """Socrata coordinates (strings, numbers or None) as a float array, NaN where missing."""
+    out = np.full(len(values), np.nan)
+    for i, value in enumerate(values):
+        try:
+            out[i] = float(value)
+        except (TypeError, ValueError):
+            pass
+    return out
+
+
+class RegionIndex:
+    """The polygons of one boundary layer (e.g. the 50 wards), for tagging many points at once.
+
+    Each region's rings are flattened into one array of edges, so a point is inside when a ray from it
+    crosses an odd number of edges; holes and multi-part regions need no special handling.
+    """
+
+    def __init__(self, regions: list):
+        """regions: (label, GeoJSON Polygon or MultiPolygon) pairs."""
+        self.labels, self.starts, self.ends, self.boxes = [], [], [], []
+        for label, geometry in regions:
+            polygons = geometry["coordinates"] if geometry["type"] == "MultiPolygon" else [geometry["coordinates"]]
+            rings = [np.asarray(ring, dtype=float)[:, :2] for polygon in polygons for ring in polygon]
+            # GeoJSON rings repeat their first point at the end, so consecutive points are the edges
+            starts = np.concatenate([ring[:-1] for ring in rings])
+            ends = np.concatenate([ring[1:] for ring in rings])
+            self.labels.append(label)
+            self.starts.append(starts)
+            self.ends.append(ends)
+            self.boxes.append((starts[:, 0].min(), starts[:, 1].min(), starts[:, 0].max(), starts[:, 1].max()))
+
+    def assign(self, latitudes, longitudes) -> list:
+        """The label of the region containing each point, or None for points outside every region or without coordinates."""
+        lat, lon = to_floats(latitudes), to_floats(longitudes)
+        result = np.full(len(lat), None, dtype=object)
+        unassigned = ~(np.isnan(lat) | np.isnan(lon))
+        for label, starts, ends, (west, south, east, north) in zip(self.labels, self.starts, self.ends, self.boxes):
+            candidates = np.flatnonzero(unassigned & (lon >= west) & (lon <= east) & (lat >= south) & (lat <= north))
+            x1, y1, x2, y2 = starts[:, 0], starts[:, 1], ends[:, 0], ends[:, 1]
+            step = max(1, MAX_PAIRS // len(starts))
+            for first in range(0, len(candidates), step):
+                points = candidates[first:first + step]
+                px, py = lon[points, None], lat[points, None]
+                with np.errstate(divide="ignore", invalid="ignore"):
+                    crossings = ((y1 > py) != (y2 > py)) & (px < (x2 - x1) * (py - y1) / (y2 - y1) + x1)
+                inside = points[crossings.sum(axis=1) % 2 == 1]
+                result[inside] = label
+                unassigned[inside] = False
+        return result.tolist()
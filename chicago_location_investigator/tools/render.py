@@ -0,0 +1,204 @@
+import os
+from collections import Counter
+from . import metrics
+
+# Tool output goes straight into the prompt, so cap how much text a single tool call can return.
+MAX_SUMMARY_CHARS = 10000
+TRUNCATION_NOTE = "\n This query returned a huge amount of data and had to be truncated, so it's probably incomplete."
+# No rendered row is shorter than this, so no query needs to download more rows than MAX_RENDERED_ROWS
+MIN_ROW_CHARS = 20
+MAX_RENDERED_ROWS = MAX_SUMMARY_CHARS // MIN_ROW_CHARS
+
+# "verbose" prints every field of every row as its own "Label: value" line. "compact" names the
+# columns once and prints one delimited line per row, which fits several times more rows per token.
+VERBOSE = "verbose"
+COMPACT = "compact"
+COMPACT_DELIMITER = "|"
+_EMPTY_VALUES = {None, "", "Unknown", "N/A"}
+
+
+def parse_output_formats(spec: str) -> dict:
+    """Parse a format spec like 'compact' or 'verbose,search_coordinates_crash=compact' into {tool name or '*': format}."""
+    formats = {}
+    for part in filter(None, (p.strip() for p in (spec or "").split(","))):
+        tool_name, _, fmt = part.rpartition("=")
+        if fmt not in (VERBOSE, COMPACT):
+            raise ValueError(f"Unknown output format {fmt!r}, expected '{VERBOSE}' or '{COMPACT}'")
+        formats[tool_name or "*"] = fmt
+    return formats
+
+
+_output_formats = parse_output_formats(os.getenv("TOOL_OUTPUT_FORMAT", VERBOSE))
+
+
+def set_output_formats(spec: str):
+    """Choose output formats for this process, e.g. 'compact' for every tool or 'search_coordinates_crash=compact' for one."""
+    _output_formats.update(parse_output_formats(spec))
+
+
+def output_format(tool_name: str) -> str:
+    """The output format selected for a tool, falling back to the default for all tools."""
+    return _output_formats.get(tool_name, _output_formats.get("*", VERBOSE))
+
+
+def row_limit(write_results: bool = False):
+    """The $limit for a query whose rows are only going to be rendered: no more than could fit in the budget.
+    None (no $limit) when the full results are also being written to a file."""
+    return None if write_results else MAX_RENDERED_ROWS
+
+
+def count_label(count: int, limit: int = None) -> str:
+    """'12', or 'at least 500' when a query stopped at its $limit."""
+    return f"at least {count}" if limit and count >= limit else str(count)
+
+
+def field_value(row: dict, getter):
+    """Read one field from a row, where the getter is a column name or a function of the row."""
+    value = getter(row) if callable(getter) else row.get(getter)
+    return None if value is None or (isinstance(value, str) and value in _EMPTY_VALUES) else value
+
+
+def _clean(value) -> str:
+    return " ".join(str(value).split()).replace(COMPACT_DELIMITER, "/")
+
+
+def _layout(rows: list, fields: list, fmt: str):
+    """The column line (compact only) and a generator of one rendered block per row."""
+    if fmt == COMPACT:
+        values = [[field_value(row, getter) for _, getter in fields] for row in rows]
+        # Columns that are empty in every row are dropped entirely; other empty cells stay blank
+        keep = [i for i in range(len(fields)) if any(v[i] is not None for v in values)]
+        columns = "Columns: " + COMPACT_DELIMITER.join(fields[i][0] for i in keep) + "\n"
+        return columns, (COMPACT_DELIMITER.join("" if v[i] is None else _clean(v[i]) for i in keep) + "\n" for v in values)
+    return "", (
+        "".join(f"{'-' if i == 0 else ' '} {label}: {_verbose_value(row, getter)}\n" for i, (label, getter) in enumerate(fields))
+        for row in rows
+    )
+
+
+def render_rows(header: str, rows: list, fields: list, fmt: str = VERBOSE, budget: int = MAX_SUMMARY_CHARS) -> str:
+    """Render rows under a header line, stopping once the character budget is used up.
+
+    Args:
+        header: First line(s) of the summary, e.g. "Found 3 crashes:"
+        rows: The API rows to render
+        fields: List of (label, getter) pairs; a getter is a column name or a function of the row
+        fmt: VERBOSE or COMPACT
+        budget: Maximum characters of output before the rest of the rows are dropped
+
+    Returns:
+        The summary text, with a truncation note when not every row fit.
+    """
+    return render_groups(header, {None: rows}, fields, fmt, budget)
+
+
+def render_groups(header: str, groups: dict, fields: list, fmt: str = VERBOSE, budget: int = MAX_SUMMARY_CHARS, noun: str = "result") -> str:
+    """Render rows in sections, one per group (e.g. per address), sharing one character budget.
+
+    Args:
+        header: First line(s) of the summary
+        groups: {group name: rows}, rendered in order; a None name renders the rows without a section line
+        fields: List of (label, getter) pairs, as for render_rows
+        fmt: VERBOSE or COMPACT. Compact output names the columns once, above every section.
+        budget: Maximum characters of output before the rest of the rows are dropped
+        noun: What a row is, for the section lines, e.g. "violation"
+
+    Returns:
+        The summary text, with a truncation note when not every row fit.
+    """
+    all_rows = [row for rows in groups.values() for row in rows]
+    columns, lines = _layout(all_rows, fields, fmt)
+
+    parts = [header + columns]
+    size = len(parts[0])
+    rendered = 0
+    full = False
+    for name, rows in groups.items():
+        if name is not None:
+            section = f"\n{name}: {len(rows)} {noun}(s)\n"
+            if size + len(section) > budget:
+                break
+            parts.append(section)
+            size += len(section)
+        for _ in rows:
+            line = next(lines)
+            if size + len(line) > budget:
+                full = True
+                break
+            parts.append(line)
+            size += len(line)
+            rendered += 1
+        if full:
+            break
+
+    truncated = rendered < len(all_rows)
+    metrics.record(rows_rendered=rendered, truncated=truncated, output_format=fmt)
+    return "".join(parts) + (TRUNCATION_NOTE if truncated else "")
+
+
+def group_by_address(addresses: list, rows: list, address_of) -> tuple:
+    """Group rows under the addresses they were asked for, in the order asked.
+
+    Returns:
+        Tuple of ({address: rows} for the addresses with rows, [addresses without any]).
+    """
+    by_address = {address: [] for address in addresses}
+    for row in rows:
+        by_address.setdefault(address_of(row), []).append(row)
+    found = {address: rows for address, rows in by_address.items() if rows}
+    return found, [address for address, rows in by_address.items() if not rows]
+
+
+def _verbose_value(row, getter):
+    value = field_value(row, getter)
+    return "Unknown" if value is None else value
+
+
+def group_rows(rows: list, key, date_field: str, category_field=None, id_field: str = None, extra: dict = None, top_n: int = 3) -> list:
+    """Collapse rows that share a key (an address, a block) into one summary row per group, largest groups first.
+
+    Args:
+        rows: The API rows to group
+        key: Column name or function of the row giving the group, e.g. the address
+        date_field: Column used for each group's first and last dates
+        category_field: Optional column or function whose most common values are listed per group
+        id_field: Optional column listing every row id in the group, so the full rows can be looked up
+        extra: Optional {column: function of the group's rows} for tool-specific aggregates
+        top_n: How many of the most common categories to list
+
+    Returns:
+        A list of dicts with "group", "count", "first", "last" and, when requested, "top", "ids" and the extra columns.
+    """
+    groups = {}
+    for row in rows:
+        groups.setdefault(field_value(row, key), []).append(row)
+
+    summaries = []
+    for group, members in groups.items():
+        dates = sorted(d[:10] for d in (m.get(date_field) for m in members) if d)
+        summary = {"group": group, "count": len(members), "first": dates[0] if dates else None, "last": dates[-1] if dates else None}
+        if category_field:
+            counts = Counter(v for v in (field_value(m, category_field) for m in members) if v is not None)
+            summary["top"] = ", ".join(f"{category} ({n})" for category, n in counts.most_common(top_n))
+        if id_field:
+            summary["ids"] = " ".join(str(m[id_field]) for m in members if m.get(id_field))
+        for column, aggregate in (extra or {}).items():
+            summary[column] = aggregate(members)
+        summaries.append(summary)
+    return sorted(summaries, key=lambda s: -s["count"])
+
+
+def should_group(rows: list, groups: list, grouped: bool = None) -> bool:
+    """Whether to render groups instead of rows: always/never when the caller says so, otherwise only when rows repeat a group."""
+    if grouped is not None:
+        return grouped
+    return len(groups) < len(rows)
+
+
+def truncate_summary(summary: str, rows_rendered: int) -> str:
+    """Cut a tool summary down to the character budget, telling the LLM when data was dropped."""
+    truncated = len(summary) > MAX_SUMMARY_CHARS
+    metrics.record(rows_rendered=rows_rendered, truncated=truncated)
+    if truncated:
+        return summary[:MAX_SUMMARY_CHARS] + TRUNCATION_NOTE
+    return summary
@@ -0,0 +1,423 @@
+import codecs
+import json
+import os
+import re
+import requests
+from datetime import datetime
+from pathlib import Path
+from urllib.parse import urlparse, urlsplit, urlunsplit, parse_qsl, urlencode, quote, unquote
+from dotenv import load_dotenv
+from diskcache import Cache
+try:
+    import orjson
+except ImportError:
+    orjson = None
+from . import metrics, ratelimit
+from .area_cache import AreaCache
+from .interval_cache import IntervalCache
+
+load_dotenv()
+# Point this at a local stand-in (see benchmarks/) to run the tools without touching the live portal
+SOCRATA_BASE_URL = os.getenv("SOCRATA_BASE_URL", "https://data.cityofchicago.org/resource").rstrip("/")
+
+# Decode responses with orjson when it is installed and SOCRATA_FAST_JSON is set. It parses large results
+# in roughly 60% of the time the standard library takes, but rejects a few inputs json accepts (NaN, huge ints).
+fast_json = bool(os.getenv("SOCRATA_FAST_JSON")) and orjson is not None
+
+# Read responses in chunks and parse rows as they arrive, instead of holding the whole body and the decoded
+# list at once. Off unless SOCRATA_STREAM is set; paged and exported queries then use flat memory.
+stream = bool(os.getenv("SOCRATA_STREAM"))
+STREAM_CHUNK_BYTES = 64 * 1024
+
+# Optional cache of query results for incremental re-fetching, see fetch_rows. Off unless SOCRATA_DELTA_CACHE is set.
+_DELTA_CACHE_DIR = Path(__file__).resolve().parent.parent / ".socrata_cache"
+delta_cache = Cache(str(_DELTA_CACHE_DIR)) if os.getenv("SOCRATA_DELTA_CACHE") else None
+# Optional cache of the date ranges each query has fetched, see IntervalCache. Off unless SOCRATA_INTERVAL_CACHE is set.
+_INTERVAL_CACHE_DIR = Path(__file__).resolve().parent.parent / ".interval_cache"
+interval_cache = IntervalCache(_INTERVAL_CACHE_DIR) if os.getenv("SOCRATA_INTERVAL_CACHE") else None
+# Optional in-memory cache answering coordinate searches inside an area already fetched, see AreaCache. Off unless SOCRATA_AREA_CACHE is set.
+area_cache = AreaCache() if os.getenv("SOCRATA_AREA_CACHE") else None
+
+# The date filter the tools add: "<field> between '<start>' and '<end>'"
+_DATE_RANGE = re.compile(r"(\w+) between '([^']+)' and '([^']+)'")
+# Rows asked for per request when a query has to be paged. Without a $limit the portal returns at most
+# 1000 rows, so queries that need every row (grouped summaries, exports, batches) are paged instead
+PAGE_ROWS = 50000
+# Columns whose value changes when a row is updated, so the delta cache checks filters on them itself
+# rather than in its delta query, which would never return a row updated out of them
+MUTABLE_COLUMNS = {"inspection_status", "violation_status", "permit_status", "results"}
+# The " AND " between a $where's predicates, outside quoted values
+_CONJUNCTS = re.compile(r" AND (?=(?:[^']*'[^']*')*[^']*$)")
+_EQUALS = re.compile(r"^(\w+)\s*=\s*'((?:[^']|'')*)'$")
+# Longest `in (...)` list a batched query builds, keeping request URLs well under common 8KB limits
+MAX_IN_CLAUSE_CHARS = 4000
+
+
+def dataset_id_from_url(url: str) -> str:
+    """Pull the dataset id (e.g. '22u3-xenr') out of a Socrata resource URL."""
+    return urlparse(url).path.rsplit("/", 1)[-1].removesuffix(".json")
+
+
+def enable_delta_cache(directory: str = _DELTA_CACHE_DIR):
+    """Turn on incremental fetching for this process (the same as setting SOCRATA_DELTA_CACHE)."""
+    global delta_cache
+    delta_cache = Cache(str(directory))
+
+
+def enable_interval_cache(directory: str = _INTERVAL_CACHE_DIR) -> IntervalCache:
+    """Turn on date range stitching for this process (the same as setting SOCRATA_INTERVAL_CACHE)."""
+    global interval_cache
+    interval_cache = IntervalCache(directory)
+    return interval_cache
+
+
+def enable_area_cache(max_entries: int = 32) -> AreaCache:
+    """Turn on the coordinate search cache for this process (the same as setting SOCRATA_AREA_CACHE)."""
+    global area_cache
+    area_cache = AreaCache(max_entries)
+    return area_cache
+
+
+class SocrataError(Exception):
+    """A query came back with a non-200 status while its rows were being streamed."""
+
+    def __init__(self, status_code: int):
+        super().__init__(f"Socrata returned {status_code}")
+        self.status_code = status_code
+
+
+_ARRAY_SEPARATORS = re.compile(r"[\s,]*")
+
+
+def iter_json_array(chunks):
+    """Parse a JSON array arriving as byte chunks, yielding each element as soon as it is complete.
+    Only the unparsed tail of the text is held, so memory stays at about one chunk plus one row.
+    """
+    decoder = json.JSONDecoder()
+    text = codecs.getincrementaldecoder("utf-8")()
+    buffer, pos, opened = "", 0, False
+    for chunk in chunks:
+        buffer = buffer[pos:] + text.decode(chunk)
+        pos = 0
+        if not opened:
+            pos = _ARRAY_SEPARATORS.match(buffer).end()
+            if pos == len(buffer):
+                continue
+            if buffer[pos] != "[":
+                raise ValueError(f"Expected a JSON array, got {buffer[pos:pos + 20]!r}")
+            pos, opened = pos + 1, True
+        while True:
+            pos = _ARRAY_SEPARATORS.match(buffer, pos).end()
+            if pos == len(buffer):
+                break
+            if buffer[pos] == "]":
+                return
+            try:
+                row, pos = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                break  # The row runs into the next chunk
+            yield row
+    raise ValueError("Response ended before the JSON array was closed")
+
+
+def _stream_rows(url: str, chunk_size: int = STREAM_CHUNK_BYTES):
+    host = urlparse(url).netloc
+    # The span is closed before the first row is handed out, so the caller's work isn't nested under it
+    with metrics.span("http", dataset_id_from_url(url), host=host, streamed=True) as s:
+        response = ratelimit.send(host, lambda: requests.get(url, stream=True))
+        s["status"] = response.status_code
+    if response.status_code != 200:
+        print(response)
+        response.close()
+        raise SocrataError(response.status_code)
+
+    def counted(chunks):
+        for chunk in chunks:
+            s["bytes"] = s.get("bytes", 0) + len(chunk)
+            yield chunk
+
+    s["rows_returned"] = 0
+    try:
+        for row in iter_json_array(counted(response.iter_content(chunk_size))):
+            s["rows_returned"] += 1
+            yield row
+    finally:
+        response.close()
+
+
+def _get_rows(url: str):
+    """Fetch the rows of a query. One without a $limit is paged with $limit/$offset until a short page,
+    since the portal would otherwise stop at 1000 rows."""
+    if "$limit" in dict(parse_qsl(urlsplit(url).query)):
+        return _get_page(url)
+    rows, offset = [], 0
+    while True:
+        status_code, page = _get_page(f"{url}&$limit={PAGE_ROWS}&$offset={offset}")
+        if status_code != 200:
+            return status_code, None
+        rows.extend(page)
+        if len(page) < PAGE_ROWS:
+            return 200, rows
+        offset += PAGE_ROWS
+
+
+def _get_page(url: str):
+    if stream:
+        try:
+            return 200, list(_stream_rows(url))
+        except SocrataError as e:
+            return e.status_code, None
+    with metrics.span("http", dataset_id_from_url(url), host=urlparse(url).netloc) as s:
+        response = ratelimit.send(urlparse(url).netloc, lambda: requests.get(url))
+        s["status"] = response.status_code
+        s["bytes"] = len(response.content)
+        if response.status_code != 200:
+            print(response)
+            return response.status_code, None
+        rows = orjson.loads(response.content) if fast_json else response.json()
+        s["rows_returned"] = len(rows)
+        return response.status_code, rows
+
+
+def stream_rows(url: str):
+    """Yield the rows of a Socrata query one at a time. With streaming on (SOCRATA_STREAM) they are parsed
+    from the response as it is read; otherwise this walks the decoded list.
+
+    Raises:
+        SocrataError: the query didn't come back 200.
+    """
+    if stream:
+        yield from _stream_rows(url)
+        return
+    status_code, rows = _get_page(url)
+    if status_code != 200:
+        raise SocrataError(status_code)
+    yield from rows
+
+
+def soql_quote(value) -> str:
+    """Quote a value as a SoQL string literal."""
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def soql_in(column: str, values) -> str:
+    """A SoQL `column in ('a', 'b')` clause."""
+    return f"{column} in ({', '.join(soql_quote(v) for v in values)})"
+
+
+def soql_order_limit(order: str = None, limit: int = None) -> str:
+    """The `&$order=...&$limit=...` part of a query URL, e.g. newest rows first and only as many as will be shown."""
+    return (f"&$order={order}" if order else "") + (f"&$limit={limit}" if limit else "")
+
+
+def chunk_values(values, max_chars: int = MAX_IN_CLAUSE_CHARS):
+    """Split values into batches whose quoted `in (...)` list stays under max_chars, so many addresses
+    can be looked up in a few requests instead of one each."""
+    batch, size = [], 0
+    for value in values:
+        length = len(soql_quote(value)) + 2
+        if batch and size + length > max_chars:
+            yield batch
+            batch, size = [], 0
+        batch.append(value)
+        size += length
+    if batch:
+        yield batch
+
+
+def date_window_clause(date_field: str, start_date: str = None, end_date: str = None, label: str = "Date range"):
+    """The SoQL filter `date_field between start and end` (end defaulting to today), or None without a start date."""
+    if not start_date:
+        return None
+    end_date = end_date or datetime.now().strftime("%Y-%m-%d")
+    print(f"{label}: {start_date} - {end_date}")
+    return f"{date_field} between '{start_date}T00:00:00' and '{end_date}T23:59:59'"
+
+
+def fetch_batches(values: list, url_for_batch):
+    """Run a query once per batch of values that fits in a URL (see chunk_values) rather than once per value.
+    The queries should carry no $limit, so fetch_rows pages each batch to its last row: a batch cut off at a limit,
+    or at the portal's default of 1000 rows, would report the values past the cut as having no rows.
+
+    Args:
+        values: e.g. the addresses asked about
+        url_for_batch: Function from a batch of values to the query URL for it
+
+    Returns:
+        Tuple of (status code, list of rows). Rows is None unless every batch came back 200.
+    """
+    rows = []
+    for batch in chunk_values(values):
+        status_code, batch_rows = fetch_rows(url_for_batch(batch))
+        if status_code != 200:
+            return status_code, None
+        rows.extend(batch_rows)
+    return 200, rows
+
+
+def iter_pages(url: str, page_size: int = PAGE_ROWS):
+    """Yield every row of a query, paging with $limit/$offset (without a $limit Socrata stops at 1000 rows).
+    The query should carry an $order, so pages don't overlap. Only the page being read is in memory
+    when streaming is on.
+
+    Raises:
+        SocrataError: a page didn't come back 200.
+    """
+    offset = 0
+    while True:
+        page_rows = 0
+        for row in stream_rows(f"{url}&$limit={page_size}&$offset={offset}"):
+            page_rows += 1
+            yield row
+        if page_rows < page_size:
+            return
+        offset += page_size
+
+
+def fetch_pages(url: str, page_size: int = PAGE_ROWS):
+    """Fetch every row of a query into a list, see iter_pages.
+
+    Returns:
+        Tuple of (status code, list of rows). Rows is None unless every page came back 200.
+    """
+    try:
+        return 200, list(iter_pages(url, page_size))
+    except SocrataError as e:
+        return e.status_code, None
+
+
+def fetch_rows(url: str):
+    """Run a Socrata query and decode the JSON rows, recording an 'http' span for each request. A query
+    without a $limit is paged (see PAGE_ROWS), so every row comes back rather than the portal's first 1000.
+
+    With the delta cache on, the rows of every query are kept along with their latest `:updated_at`.
+    Asking the same query again (the same address or area, any later end date) only fetches the rows
+    created or changed since then and merges them in by `:id`, dropping cached rows that changed so they
+    no longer match the query's filters. Rows deleted upstream are not noticed until the cache entry is cleared.
+
+    With the interval cache on, a date-filtered query only fetches the parts of its date range that the
+    same query (same place, same filters) hasn't fetched already, and stitches them onto the cached rows.
+
+    With the area cache on, a coordinate search inside the box and dates of an earlier complete one is
+    answered by filtering that search's rows, without a request.
+
+    Returns:
+        Tuple of (status code, list of rows). Rows is None unless the status code is 200.
+    """
+    metrics.record_dataset(dataset_id_from_url(url))
+    if area_cache is not None:
+        rows = area_cache.get(url)
+        if rows is not None:
+            return 200, rows
+    get_rows = _get_rows if delta_cache is None else _fetch_rows_incremental
+    result = interval_cache.fetch(url, get_rows) if interval_cache is not None else None
+    status_code, rows = result if result is not None else get_rows(url)
+    if area_cache is not None and status_code == 200:
+        area_cache.put(url, rows)
+    return status_code, rows
+
+
+def _split_query(url: str):
+    """Split a query URL into (canonical key, $where, date range match). The key leaves out the app
+    token and the end of the date range, so the same question asked on a later day shares an entry."""
+    parts = urlsplit(url)
+    params = [(k, unquote(v)) for k, v in parse_qsl(parts.query, keep_blank_values=True) if k != "$$app_token"]
+    where = dict(params).get("$where", "")
+    date_range = _DATE_RANGE.search(where)
+    canonical_where = where.replace(date_range.group(0), f"{date_range.group(1)} >= '{date_range.group(2)}'") if date_range else where
+    key_params = sorted((k, canonical_where if k == "$where" else v) for k, v in params)
+    return f"{parts.path}?{urlencode(key_params)}", where, date_range
+
+
+def _with_where(url: str, where: str, limit: bool = True) -> str:
+    """The same query with a different $where, selecting the system fields (:id, :updated_at) as well.
+    With limit=False the $limit is dropped too, so every matching row comes back (see _get_rows)."""
+    parts = urlsplit(url)
+    dropped = ("$where", "$select") if limit else ("$where", "$select", "$limit")
+    params = [(k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if k not in dropped]
+    params = [("$select", ":*, *")] + ([("$where", where)] if where else []) + params
+    return urlunsplit(parts._replace(query=urlencode(params, quote_via=quote, safe="$:*,'")))
+
+
+def _split_status(where: str):
+    """Split a $where into (the rest of it, {column: value} of its filters on MUTABLE_COLUMNS)."""
+    kept, status = [], {}
+    for predicate in _CONJUNCTS.split(where) if where else []:
+        match = _EQUALS.match(predicate.strip())
+        if match and match.group(1) in MUTABLE_COLUMNS:
+            status[match.group(1)] = match.group(2).replace("''", "'")
+        else:
+            kept.append(predicate)
+    return " AND ".join(kept), status
+
+
+def _fetch_rows_incremental(url: str):
+    key, where, date_range = _split_query(url)
+    end = date_range.group(3) if date_range else None
+    params = dict(parse_qsl(urlsplit(url).query))
+    limit = params.get("$limit")
+    fetched_at = datetime.now().isoformat(timespec="seconds")
+    entry = delta_cache.get(key)
+
+    # A cached entry can be topped up if it already covers the requested dates: either it ran up to
+    # the day it was fetched, or the new end date falls inside what it covered. An entry without a
+    # high-water mark came back empty, and refetching it costs no more than a delta would
+    usable = entry is not None and entry["high_water_mark"] is not None and (end is None or entry["covered_to_now"] or end <= entry["end"])
+    if usable:
+        covered_end = max(end, entry["end"]) if end else None
+        if date_range:
+            where = where.replace(date_range.group(0), f"{date_range.group(1)} between '{date_range.group(2)}' and '{covered_end}'")
+        # Status filters are left out of the delta and checked here, so a cached row updated out of them
+        # (a violation complied with, a permit expired) comes back in the delta and is dropped
+        unfiltered, status = _split_status(where)
+        since = f":updated_at > '{entry['high_water_mark']}'"
+        status_code, delta = _get_rows(_with_where(url, f"{unfiltered} AND {since}" if unfiltered else since, limit=False))
+        if status_code != 200:
+            return status_code, None
+        rows = {r[":id"]: r for r in entry["rows"]}
+        evicted = 0
+        for r in delta:
+            if all(r.get(column) == value for column, value in status.items()):
+                rows[r[":id"]] = r
+            elif rows.pop(r[":id"], None) is not None:
+                evicted += 1
+        metrics.record(cache="hit", delta_rows=len(delta), evicted_rows=evicted)
+        # An entry cut off at $limit has no rows past it to take the place of the dropped ones
+        if evicted and limit and len(entry["rows"]) >= int(limit):
+            usable = False
+    if not usable:
+        covered_end = end
+        delta = []
+        status_code, fetched = _get_rows(_with_where(url, where))
+        if status_code != 200:
+            return status_code, None
+        rows = {r[":id"]: r for r in fetched}
+        metrics.record(cache="miss")
+
+    # The high-water mark is the newest :updated_at the portal sent, in its own clock, including rows
+    # dropped above; the local clock isn't comparable with it
+    updated = [r[":updated_at"].rstrip("Z") for r in [*rows.values(), *delta] if r.get(":updated_at")]
+    previous = entry["high_water_mark"] if usable else None
+    high_water_mark = max(updated + ([previous] if previous else []), default=None)
+
+    # Changed and new rows were merged in at the end, so the query's order and limit are applied again
+    rows = list(rows.values())
+    order = params.get("$order", "").split()
+    if order:
+        rows.sort(key=lambda r: r.get(order[0]) or "", reverse=order[-1].upper() == "DESC")
+    if limit:
+        rows = rows[:int(limit)]
+
+    delta_cache.set(key, {
+        "rows": rows,
+        "high_water_mark": high_water_mark,
+        "end": covered_end,
+        "covered_to_now": covered_end is None or covered_end >= fetched_at,
+    })
+
+    date_field = date_range.group(1) if date_range else None
+    return status_code, [
+        {k: v for k, v in r.items() if not k.startswith(":")}
+        for r in rows
+        if not end or (r.get(date_field) or "") <= end
+    ]
@@ -1,74 +1,77 @@
 
-import requests
 from datetime import datetime
-import os
-from dotenv import load_dotenv
 from .write_results import write_results_file
+from .mural_catalog import mural_catalog, METERS_PER_MILE
+from .render import render_rows, output_format
 
-load_dotenv()
-OPEN_DATA_APP_TOKEN = os.getenv("OPEN_DATA_APP_TOKEN")
+# (label, column) pairs shown to the LLM for each mural
+MURAL_FIELDS = [
+    ("Mural Registration ID", "mural_registration_id"),
+    ("Year Installed", "year_installed"),
+    ("Artist Credit", "artist_credit"),
+    ("Artwork Title", "artwork_title"),
+    ("Location Description", "location_description"),
+    ("Street Address", "street_address"),
+    ("Description", "description"),
+    ("Media", "media"),
+    ("Organization", "affiliated_or_commissioning"),
+]
 
 
 
-def search_coordinates_murals(coordinate_boundaries:dict, start_date:str = None,  end_date: str = None, write_results: bool = False):
-    """Search for public murals within the bounds of a set of geocoordinates (north, south, east, and west) with optional date filtering on the date the work was created.
+def search_coordinates_murals(coordinate_boundaries: dict = None, start_date: str = None, end_date: str = None, latitude: float = None, longitude: float = None,
+                              radius_miles: float = None, write_results: bool = False):
+    """Search for public murals within the bounds of a set of geocoordinates (north, south, east, and west) or within a radius of a point,
+    with optional date filtering on the year the work was installed. Answered from a local copy of the mural registry.
 
     Args:
-        coordinate_boundaries: The dict of the coordinate boundaries in format {"north":north_bound, "south":south_bound, "east":east_bound, "west": west_bound}
-        start_date: Optional start date in YYYY-MM-DD format (e.g., '2024-01-01')
+        coordinate_boundaries: Optional dict of the coordinate boundaries in format {"north":north_bound, "south":south_bound, "east":east_bound, "west": west_bound}
+        start_date: Optional start date in YYYY-MM-DD format (e.g., '2024-01-01'); murals are matched on the year installed
         end_date: Optional end date in YYYY-MM-DD format (e.g., '2024-12-31')
+        latitude: Optional latitude of a point to search around, with longitude and radius_miles
+        longitude: Optional longitude of a point to search around
+        radius_miles: Optional radius in miles around the point
         write_results: Optional, set to True when the user wants the full results saved to a CSV file.
 
     Returns:
         A text summary including: artist name/credit, artwork title, year installed, medium, and street address
     """
-    # Build where clause with date filtering if provided
-    where_clause = f"latitude%20between%20{coordinate_boundaries['south']}%20and%20{coordinate_boundaries['north']}%20AND%20longitude%20between%20{coordinate_boundaries['west']}%20and%20{coordinate_boundaries['east']}"
-
-    print(f"Retrieving public murals within {coordinate_boundaries}")
-
-    if start_date and end_date:
-        where_clause += f" AND violation_date between '{start_date}T00:00:00' and '{end_date}T23:59:59'"
-        print(f"Date range: {start_date} - {end_date}")
-    elif start_date:
-        end_date = datetime.now().strftime("%Y-%m-%d")
-        where_clause += f" AND violation_date between '{start_date}T00:00:00' and '{end_date}T23:59:59'"
+    if radius_miles is not None and (latitude is None or longitude is None):
+        raise Exception("A radius search needs both latitude and longitude")
+    if not coordinate_boundaries and radius_miles is None and not start_date:
+        raise Exception("Either coordinates, a point and radius, or a start date is necessary to find murals")
+
+    if coordinate_boundaries:
+        area = f"at {coordinate_boundaries}"
+    elif radius_miles is not None:
+        area = f"within {radius_miles} mile(s) of ({latitude}, {longitude})"
+    else:
+        area = "in Chicago"
+    print(f"Retrieving public murals {area}")
+
+    if start_date:
+        end_date = end_date or datetime.now().strftime("%Y-%m-%d")
         print(f"Date range: {start_date} - {end_date}")
 
-    url = f"https://data.cityofchicago.org/resource/we8h-apcf.json?$where={where_clause}&$$app_token={OPEN_DATA_APP_TOKEN}"
-
     try:
-        response = requests.get(url)
-        if response.status_code == 200:
-            murals = response.json()
-            if write_results:
-                write_results_file(murals, outputname="murals")
-
-            if not murals:
-                return f"No murals found at {coordinate_boundaries} during date range selected."
-
-            # Format as string summary to make it easier for the LLM to understand
-            summary = f"Found {len(murals)} mural(s) at {coordinate_boundaries} during date range selected:\n\n"
-            for v in murals:
-                summary += f"- Mural Registration ID #{v.get('mural_registration_id', 'N/A')}\n"
-                summary += f"  Year Installed: {v.get('year_installed', 'Unknown')}\n"
-                summary += f"  Artist Credit: {v.get('artist_credit', 'Unknown')}\n"
-                summary += f"  Artwork Title: {v.get('artwork_title', 'Unknown')}\n"
-                summary += f"  Location Description: {v.get('location_description', 'Unknown')}\n"
-                summary += f"  Street Address: {v.get('street_address', 'Unknown')}\n"
-                summary += f"  Description: {v.get('description', 'Unknown')}\n"
-                summary += f"  Media: {v.get('media', 'Unknown')}\n"
-                summary += f"  Organization: {v.get('affiliated_or_commissioning', 'Unknown')}\n"
-                
-
-            if len(summary) > 10000:
-                return summary[:10000] + "\n This query returned a huge amount of data and had to be truncated, so it's probably incomplete."
-
-            else:
-                return summary
-        else:
-            print(response)
-            return f"Error retrieving data: {response.status_code}"
+        murals = mural_catalog().search(
+            coordinate_boundaries=coordinate_boundaries,
+            latitude=latitude,
+            longitude=longitude,
+            radius_m=radius_miles * METERS_PER_MILE if radius_miles is not None else None,
+            # The registry only records the year a mural was installed
+            start_year=int(start_date[:4]) if start_date else None,
+            end_year=int(end_date[:4]) if end_date else None,
+        )
+        if write_results:
+            write_results_file(murals, outputname="murals")
+
+        if not murals:
+            return f"No murals found {area} during date range selected."
+
+        # Format as string summary to make it easier for the LLM to understand
+        order = "nearest first" if radius_miles is not None else "most recently installed first"
+        header = f"Found {len(murals)} mural(s) {area} during date range selected, {order}:\n\n"
+        return render_rows(header, murals, MURAL_FIELDS, output_format("search_coordinates_murals"))
     except Exception as e:
         return f"Error: {e}"
-
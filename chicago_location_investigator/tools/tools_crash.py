@@ -1,13 +1,118 @@
-import requests
 from datetime import datetime
+import math
 import os
+import numpy as np
+import pandas as pd
 from dotenv import load_dotenv
-from langchain.tools import tool
 from .write_results import write_results_file
+from .socrata import fetch_rows, iter_pages, SOCRATA_BASE_URL, SocrataError, soql_order_limit
+from .render import render_rows, output_format, group_rows, should_group, row_limit, count_label, truncate_summary
 
 load_dotenv()
 OPEN_DATA_APP_TOKEN = os.getenv("OPEN_DATA_APP_TOKEN")
 
+# (label, column or function of the row) pairs shown to the LLM for each crash
+CRASH_FIELDS = [
+    ("Crash address", lambda v: " ".join(filter(None, [v.get("street_no"), v.get("street_direction"), v.get("street_name")]))),
+    ("Traffic control device in place", "traffic_control_device"),
+    ("Traffic control device condition", "device_condition"),
+    ("Weather", "weather_condition"),
+    ("Lighting", "lighting_condition"),
+    ("Date", "crash_date"),
+    ("Road type", "trafficway_type"),
+    ("Crash type", "crash_type"),
+    ("Crash was related to an intersection", "intersection_related_i"),
+    ("Crash was dooring of a cyclist", "dooring_i"),
+    ("Total injuries", "injuries_total"),
+    ("Most severe injury", "most_severe_injury"),
+    ("Number of fatalities", "injuries_fatal"),
+    ("Whether the incident was a hit-and-run", "hit_and_run_i"),
+    ("Latitude", "latitude"),
+    ("Longitude", "longitude"),
+]
+
+# Columns for one line per block when crashes are grouped
+CRASH_GROUP_FIELDS = [
+    ("Block", "group"),
+    ("Crashes", "count"),
+    ("First", "first"),
+    ("Last", "last"),
+    ("Most common crash types", "top"),
+    ("Total injuries", "injuries"),
+    ("Fatalities", "fatalities"),
+    ("Hit-and-runs", "hit_and_runs"),
+    ("Coordinate boundaries", "bounds"),
+]
+
+
+def _block(crash: dict):
+    """The hundred block of a crash, e.g. '1600 W CHICAGO AVE'. The dataset has no cross street, so blocks stand in for intersections."""
+    try:
+        number = f"{int(crash.get('street_no')) // 100 * 100}"
+    except (TypeError, ValueError):
+        number = None
+    return " ".join(filter(None, [number, crash.get("street_direction"), crash.get("street_name")])) or None
+
+
+def _total(column: str):
+    return lambda crashes: sum(int(float(c.get(column) or 0)) for c in crashes)
+
+
+def _bounds(crashes: list):
+    """The coordinate boundaries around a group's crashes, to pass back to search_coordinates_crash for the full rows."""
+    points = [(float(c["latitude"]), float(c["longitude"])) for c in crashes if c.get("latitude") and c.get("longitude")]
+    if not points:
+        return None
+    lats, lons = zip(*points)
+    return {"north": round(max(lats), 5), "south": round(min(lats), 5), "east": round(max(lons), 5), "west": round(min(lons), 5)}
+
+
+# Columns for one line per grid cell in search_crash_hotspots
+HOTSPOT_FIELDS = [
+    ("Rank", "rank"),
+    ("Busiest block", "block"),
+    ("Crashes", "count"),
+    ("Total injuries", "injuries"),
+    ("Fatalities", "fatalities"),
+    ("Hit-and-run share", "hit_and_run_share"),
+    ("Center", "center"),
+    ("Coordinate boundaries", "bounds"),
+]
+METERS_PER_DEGREE_LATITUDE = 111320
+# The portal adds up crashes per hundred block (street number rounded down to the hundred; %25 is an encoded
+# modulo), placed at the mean position of its crashes, so the whole city comes down as a few thousand rows
+HOTSPOT_BLOCK_NUMBER = "street_no - street_no %25 100"
+HOTSPOT_SELECT = (
+    f"{HOTSPOT_BLOCK_NUMBER} as block_no, street_direction, street_name, avg(latitude) as latitude, avg(longitude) as longitude, "
+    "count(*) as crashes, sum(injuries_total) as injuries, sum(injuries_fatal) as fatalities, "
+    "sum(case(hit_and_run_i = 'Y', 1, true, 0)) as hit_and_runs"
+)
+HOTSPOT_GROUP = f"{HOTSPOT_BLOCK_NUMBER}, street_direction, street_name"
+
+# Only the columns crash_statistics counts are downloaded, so the full matching set stays small
+STATISTICS_SELECT = "crash_date, weather_condition, lighting_condition, crash_type, most_severe_injury, dooring_i, hit_and_run_i, injuries_total, injuries_fatal"
+# (label, column) pairs broken down by value in crash_statistics, most common first
+STATISTICS_BREAKDOWNS = [
+    ("Weather", "weather_condition"),
+    ("Lighting", "lighting_condition"),
+    ("Crash type", "crash_type"),
+    ("Most severe injury", "most_severe_injury"),
+]
+# (label, column) pairs of Y/N flags counted in crash_statistics
+STATISTICS_FLAGS = [
+    ("Dooring of a cyclist", "dooring_i"),
+    ("Hit-and-run", "hit_and_run_i"),
+]
+WEEKDAYS = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+
+
+CRASH_GROUP_AGGREGATES = {
+    "injuries": _total("injuries_total"),
+    "fatalities": _total("injuries_fatal"),
+    "hit_and_runs": lambda crashes: sum(c.get("hit_and_run_i") == "Y" for c in crashes),
+    "bounds": _bounds,
+}
+
 def search_address_crash(address: str = None, coordinate_boundaries: dict=None, start_date: str = None, end_date: str = None, write_results: bool = False
 ) -> str:
     """Search for any recent car crash locations by address or coordinate boundaries.
@@ -42,42 +147,23 @@ def search_address_crash(address: str = None, coordinate_boundaries: dict=None,
         where_clause += f" AND crash_date between '{start_date}T00:00:00' and '{end_date}T23:59:59'"
         print(f"Date range: {start_date} - {end_date}")
     
-    url = f"https://data.cityofchicago.org/resource/85ca-t3if.json?$where={where_clause}&$$app_token={OPEN_DATA_APP_TOKEN}"
+    limit = row_limit(write_results)
+    url = f"{SOCRATA_BASE_URL}/85ca-t3if.json?$where={where_clause}{soql_order_limit('crash_date DESC', limit)}&$$app_token={OPEN_DATA_APP_TOKEN}"
     try:
-        response = requests.get(url)
-        if response.status_code == 200:
-            crashes = response.json()
+        status_code, crashes = fetch_rows(url)
+        if status_code == 200:
             if write_results:
                 write_results_file(crashes, outputname="crashes")
 
             # Format as string summary to make it easier for the LLM to understand
-            summary = f"Found {len(crashes)} crashes for {address}:\n\n"
-            for v in crashes:
-                summary += f"  Crash address: {v.get('address', 'Unknown')}\n"
-                summary += f"  Traffic control device in place: {v.get('traffic_control_device', 'Unknown')}\n"
-                summary += f"  Traffic control device condition: {v.get('device_condition', 'Unknown')}\n"
-                summary += f"  Weather: {v.get('weather_condition', 'Unknown')}\n"
-                summary += f"  Lighting: {v.get('lighting_condition', 'Unknown')}\n"
-                summary += f"  Date: {v.get('crash_date', 'Unknown')}\n"
-                summary += f"  Road type: {v.get('trafficway_type', 'Unknown')}\n"
-                summary += f"  Crash type: {v.get('crash_type', 'Unknown')}\n"
-                summary += f"  Crash was related to an intersection: {v.get('intersection_related_i', 'Unknown')}\n"
-                summary += f"  Crash was dooring of a cyclist: {v.get('dooring_i', 'Unknown')}\n"
-                summary += f"  Total injuries: {v.get('injuries_total', 'Unknown')}\n"
-                summary += f"  Most severe injury: {v.get('most_severe_injury', 'Unknown')}\n"
-                summary += f"  Number of fatalities: {v.get('injuries_fatal', 'Unknown')}\n"
-
-            if len(summary) > 10000:
-                return summary[:10000] + "\n This query returned a huge amount of data and had to be truncated, so it's probably incomplete."
-
-            else:
-                return summary
+            header = f"Found {count_label(len(crashes), limit)} crashes for {address}, most recent first:\n\n"
+            return render_rows(header, crashes, CRASH_FIELDS, output_format("search_address_crash"))
         else:
-            return f"Error retrieving data: {response.status_code}"
+            return f"Error retrieving data: {status_code}"
     except Exception as e:
         return f"Error: {e}"
     
-def search_coordinates_crash(coordinate_boundaries: dict, start_date: str = None, end_date: str = None, write_results: bool = False
+def search_coordinates_crash(coordinate_boundaries: dict, start_date: str = None, end_date: str = None, group_by_block: bool = None, write_results: bool = False
 ) -> str:
     """Search for any results of recent car crashes within the bounds of a geocoordinate range.
 
@@ -85,6 +171,9 @@ def search_coordinates_crash(coordinate_boundaries: dict, start_date: str = None
         coordinate_boundaries: The dict of the coordinate boundaries in format {"north":north_bound, "south":south_bound, "east":east_bound, "west": west_bound}
         start_date: Optional start date in YYYY-MM-DD format (e.g., '2024-01-01')
         end_date: Optional end date in YYYY-MM-DD format (e.g., '2024-12-31')
+        group_by_block: Optional. By default, when several crashes happened on the same block they are collapsed into one line per block
+            with the count, date span, most common crash types, injuries and the coordinate boundaries around them.
+            Set to False to list every crash separately, e.g. with one block's coordinate boundaries to see its crashes in full.
         write_results: Optional - set to true if the end user requests that files be saved
 
     Returns:
@@ -101,41 +190,202 @@ def search_coordinates_crash(coordinate_boundaries: dict, start_date: str = None
         where_clause += f" AND crash_date between '{start_date}T00:00:00' and '{end_date}T23:59:59'"
         print(f"Date range: {start_date} - {end_date}")
     
-    url = f"https://data.cityofchicago.org/resource/85ca-t3if.json?$where={where_clause}&$$app_token={OPEN_DATA_APP_TOKEN}"
+    # Grouping needs every row to count them, so only cap the rows when listing them one by one. Without a
+    # $limit fetch_rows pages to the last row, so the counts and date spans cover the whole area
+    limit = row_limit(write_results) if group_by_block is False else None
+    url = f"{SOCRATA_BASE_URL}/85ca-t3if.json?$where={where_clause}{soql_order_limit('crash_date DESC', limit)}&$$app_token={OPEN_DATA_APP_TOKEN}"
     try:
-        response = requests.get(url)
-        if response.status_code == 200:
-            crashes = response.json()
+        status_code, crashes = fetch_rows(url)
+        if status_code == 200:
             if write_results:
                 write_results_file(crashes, outputname="crashes")
 
             # Format as string summary to make it easier for the LLM to understand
-            summary = f"Found {len(crashes)} crashes:\n\n"
-            for v in crashes:
-                summary += f"  Crash Address: {v.get('street_no', 'Unknown')} {v.get('street_direction', 'Unknown')} {v.get('street_name', 'Unknown')}\n"
-                summary += f"  Traffic control device in place: {v.get('traffic_control_device', 'Unknown')}\n"
-                summary += f"  Traffic control device condition: {v.get('device_condition', 'Unknown')}\n"
-                summary += f"  Weather: {v.get('weather_condition', 'Unknown')}\n"
-                summary += f"  Lighting: {v.get('lighting_condition', 'Unknown')}\n"
-                summary += f"  Date: {v.get('crash_date', 'Unknown')}\n"
-                summary += f"  Road type: {v.get('trafficway_type', 'Unknown')}\n"
-                summary += f"  Crash type: {v.get('crash_type', 'Unknown')}\n"
-                summary += f"  Crash was related to an intersection: {v.get('intersection_related_i', 'Unknown')}\n"
-                summary += f"  Crash was dooring of a cyclist: {v.get('dooring_i', 'Unknown')}\n"
-                summary += f"  Total injuries: {v.get('injuries_total', 'Unknown')}\n"
-                summary += f"  Most severe injury: {v.get('most_severe_injury', 'Unknown')}\n"
-                summary += f"  Number of fatalities: {v.get('injuries_fatal', 'Unknown')}\n"
-                summary += f"  Whether the incident was a hit-and-run: {v.get('hit_and_run_i', 'No')}\n"
-                summary += f"  Latitude: {v.get('latitude', 'Unknown')}\n"
-                summary += f"  Longitude: {v.get('longitude', 'Unknown')}\n"
-
-
-            if len(summary) > 10000:
-                return summary[:10000] + "\n This query returned a huge amount of data and had to be truncated, so it's probably incomplete."
-
-            else:
-                return summary
+            fmt = output_format("search_coordinates_crash")
+            groups = group_rows(crashes, _block, "crash_date", category_field="crash_type", extra=CRASH_GROUP_AGGREGATES)
+            if should_group(crashes, groups, group_by_block):
+                header = (
+                    f"Found {len(crashes)} crashes on {len(groups)} block(s). To see one block's crashes in full, search again "
+                    "with its coordinate boundaries and group_by_block=False:\n\n"
+                )
+                return render_rows(header, groups, CRASH_GROUP_FIELDS, fmt)
+
+            header = f"Found {count_label(len(crashes), limit)} crashes, most recent first:\n\n"
+            return render_rows(header, crashes, CRASH_FIELDS, fmt)
         else:
-            return f"Error retrieving data: {response.status_code}"
+            return f"Error retrieving data: {status_code}"
     except Exception as e:
-        return f"Error: {e}"
\ No newline at end of file
+        return f"Error: {e}"
+
+
+def _area_where_clause(coordinate_boundaries: dict, start_date: str = None, end_date: str = None) -> str:
+    """The $where for crashes inside coordinate boundaries, optionally between two dates (end date defaulting to today)."""
+    where_clause = f"latitude%20between%20{coordinate_boundaries['south']}%20and%20{coordinate_boundaries['north']}%20AND%20longitude%20between%20{coordinate_boundaries['west']}%20and%20{coordinate_boundaries['east']}"
+    if start_date:
+        end_date = end_date or datetime.now().strftime("%Y-%m-%d")
+        where_clause += f" AND crash_date between '{start_date}T00:00:00' and '{end_date}T23:59:59'"
+        print(f"Date range: {start_date} - {end_date}")
+    return where_clause
+
+
+def rank_hotspots(points: list, coordinate_boundaries: dict, cell_meters: float = 150, top_n: int = 10) -> list:
+    """Bin crash locations into square grid cells and rank the cells by crashes, then injuries.
+
+    Args:
+        points: Dicts with latitude, longitude, crashes, injuries, fatalities, hit_and_runs and block,
+            each standing for `crashes` crashes on one block, as returned by the grouped hotspot query.
+        coordinate_boundaries: The search area; the grid starts at its south-west corner
+        cell_meters: Width and height of a grid cell in meters
+        top_n: How many cells to return
+
+    Returns:
+        One dict per cell, busiest first, with the fields in HOTSPOT_FIELDS.
+    """
+    points = [p for p in points if p.get("latitude") and p.get("longitude")]
+    if not points:
+        return []
+    lat = np.fromiter((float(p["latitude"]) for p in points), float, len(points))
+    lon = np.fromiter((float(p["longitude"]) for p in points), float, len(points))
+    crashes = np.fromiter((float(p.get("crashes") or 0) for p in points), float, len(points))
+    injuries = np.fromiter((float(p.get("injuries") or 0) for p in points), float, len(points))
+    fatalities = np.fromiter((float(p.get("fatalities") or 0) for p in points), float, len(points))
+    hit_and_runs = np.fromiter((float(p.get("hit_and_runs") or 0) for p in points), float, len(points))
+
+    south, west = float(coordinate_boundaries["south"]), float(coordinate_boundaries["west"])
+    cell_lat = cell_meters / METERS_PER_DEGREE_LATITUDE
+    cell_lon = cell_meters / (METERS_PER_DEGREE_LATITUDE * math.cos(math.radians(south + cell_lat / 2)))
+    rows, cols = np.floor((lat - south) / cell_lat).astype(np.int64), np.floor((lon - west) / cell_lon).astype(np.int64)
+    cells, cell_of_point = np.unique(np.stack([rows, cols], axis=1), axis=0, return_inverse=True)
+    cell_of_point = cell_of_point.ravel()
+    totals = {name: np.bincount(cell_of_point, weights=values, minlength=len(cells))
+              for name, values in [("count", crashes), ("injuries", injuries), ("fatalities", fatalities), ("hit_and_runs", hit_and_runs)]}
+    ranked = np.lexsort((-totals["injuries"], -totals["count"]))[:top_n]
+
+    hotspots = []
+    for rank, cell in enumerate(ranked, start=1):
+        row, col = cells[cell]
+        blocks = {}
+        for i in np.flatnonzero(cell_of_point == cell):
+            block = points[i].get("block")
+            if block:
+                blocks[block] = blocks.get(block, 0) + crashes[i]
+        cell_south, cell_west = south + row * cell_lat, west + col * cell_lon
+        count = int(totals["count"][cell])
+        hotspots.append({
+            "rank": rank,
+            "block": max(blocks, key=blocks.get) if blocks else None,
+            "count": count,
+            "injuries": int(totals["injuries"][cell]),
+            "fatalities": int(totals["fatalities"][cell]),
+            "hit_and_run_share": f"{totals['hit_and_runs'][cell] / count:.0%}" if count else None,
+            "center": {"latitude": round(cell_south + cell_lat / 2, 5), "longitude": round(cell_west + cell_lon / 2, 5)},
+            "bounds": {"north": round(cell_south + cell_lat, 5), "south": round(cell_south, 5),
+                       "east": round(cell_west + cell_lon, 5), "west": round(cell_west, 5)},
+        })
+    return hotspots
+
+
+def search_crash_hotspots(coordinate_boundaries: dict, start_date: str = None, end_date: str = None, cell_meters: float = 150, top_n: int = 10
+) -> str:
+    """Find the most dangerous spots for car crashes within coordinate boundaries, which can be as large as the whole city.
+    Crashes are counted in a grid of square cells and the busiest cells are returned, without listing the crashes themselves.
+
+    Args:
+        coordinate_boundaries: The dict of the coordinate boundaries in format {"north":north_bound, "south":south_bound, "east":east_bound, "west": west_bound}
+        start_date: Optional start date in YYYY-MM-DD format (e.g., '2024-01-01')
+        end_date: Optional end date in YYYY-MM-DD format (e.g., '2024-12-31')
+        cell_meters: Optional width of a grid cell in meters. The default of 150 is about one intersection.
+        top_n: Optional number of hotspots to return, 10 by default
+
+    Returns:
+        A text summary ranking the hotspots: the busiest block in each, crash count, injuries, fatalities, hit-and-run share,
+        and the cell's coordinate boundaries to pass to search_coordinates_crash for its crashes in full.
+    """
+
+    where_clause = _area_where_clause(coordinate_boundaries, start_date, end_date)
+    url = f"{SOCRATA_BASE_URL}/85ca-t3if.json?$select={HOTSPOT_SELECT}&$where={where_clause}&$group={HOTSPOT_GROUP}{soql_order_limit(HOTSPOT_GROUP)}&$$app_token={OPEN_DATA_APP_TOKEN}"
+    try:
+        points = [
+            {**row, "block": _block({**row, "street_no": row.get("block_no")})}
+            for row in iter_pages(url)
+        ]
+        hotspots = rank_hotspots(points, coordinate_boundaries, cell_meters, top_n)
+        total = sum(int(float(p.get("crashes") or 0)) for p in points)
+        header = (
+            f"Found {total} crashes in the area. The {len(hotspots)} busiest {cell_meters:g}m grid cells, most crashes first "
+            "(search_coordinates_crash with a cell's coordinate boundaries lists its crashes):\n\n"
+        )
+        return render_rows(header, hotspots, HOTSPOT_FIELDS, output_format("search_crash_hotspots"))
+    except SocrataError as e:
+        return f"Error retrieving data: {e.status_code}"
+    except Exception as e:
+        return f"Error: {e}"
+
+
+def crash_statistics(crashes: list, top_n: int = 6) -> str:
+    """Count crashes and break them down by hour, weekday, conditions, type, severity and flags.
+
+    Args:
+        crashes: Crash rows with at least the STATISTICS_SELECT columns
+        top_n: How many values of each condition, type and severity breakdown to list before lumping the rest together
+
+    Returns:
+        A few lines of exact counts, one per breakdown.
+    """
+    df = pd.DataFrame(crashes, columns=[c.strip() for c in STATISTICS_SELECT.split(",")])
+    total = len(df)
+    if not total:
+        return "Crashes: 0"
+
+    def share(n) -> str:
+        return f"{int(n)} ({n / total:.0%})"
+
+    dates = pd.to_datetime(df["crash_date"], errors="coerce")
+    injuries = pd.to_numeric(df["injuries_total"], errors="coerce").fillna(0)
+    fatalities = pd.to_numeric(df["injuries_fatal"], errors="coerce").fillna(0)
+    injury_line = f"Injuries: {int(injuries.sum())} in {share((injuries > 0).sum())} crashes; fatalities: {int(fatalities.sum())}"
+    # Without a single readable crash_date there is no date range or time of day to break down
+    if dates.notna().any():
+        lines = [
+            f"Crashes: {total}, from {dates.min():%Y-%m-%d} to {dates.max():%Y-%m-%d}",
+            injury_line,
+            "By hour of day: " + ", ".join(f"{hour}h {n}" for hour, n in dates.dt.hour.value_counts().sort_index().items()),
+            "By weekday: " + ", ".join(f"{WEEKDAYS[day]} {n}" for day, n in dates.dt.dayofweek.value_counts().sort_index().items()),
+        ]
+    else:
+        lines = [f"Crashes: {total}", injury_line]
+    for label, column in STATISTICS_BREAKDOWNS:
+        counts = df[column].fillna("UNKNOWN").value_counts()
+        listed = [f"{value} {share(n)}" for value, n in counts.head(top_n).items()]
+        if len(counts) > top_n:
+            listed.append(f"other {share(counts.iloc[top_n:].sum())}")
+        lines.append(f"{label}: " + ", ".join(listed))
+    for label, column in STATISTICS_FLAGS:
+        lines.append(f"{label}: {share((df[column] == 'Y').sum())}")
+    return "\n".join(lines)
+
+
+def search_crash_statistics(coordinate_boundaries: dict, start_date: str = None, end_date: str = None) -> str:
+    """Get exact crash statistics within coordinate boundaries: totals, injuries and fatalities, and breakdowns by hour of day,
+    weekday, weather, lighting, crash type, injury severity, cyclist dooring and hit-and-run. Every matching crash is counted,
+    so use this instead of counting crashes from search_coordinates_crash.
+
+    Args:
+        coordinate_boundaries: The dict of the coordinate boundaries in format {"north":north_bound, "south":south_bound, "east":east_bound, "west": west_bound}
+        start_date: Optional start date in YYYY-MM-DD format (e.g., '2024-01-01')
+        end_date: Optional end date in YYYY-MM-DD format (e.g., '2024-12-31')
+
+    Returns:
+        A short table of crash counts, one line per breakdown.
+    """
+
+    where_clause = _area_where_clause(coordinate_boundaries, start_date, end_date)
+    url = f"{SOCRATA_BASE_URL}/85ca-t3if.json?$select={STATISTICS_SELECT}&$where={where_clause}{soql_order_limit(':id')}&$$app_token={OPEN_DATA_APP_TOKEN}"
+    try:
+        crashes = list(iter_pages(url))
+        summary = "Crash statistics for the area:\n\n" + crash_statistics(crashes)
+        return truncate_summary(summary, rows_rendered=0)
+    except SocrataError as e:
+        return f"Error retrieving data: {e.status_code}"
+    except Exception as e:
+        return f"Error: {e}"
@@ -1,20 +1,73 @@
-import requests
 from datetime import datetime
 import os
+import pandas as pd
 from dotenv import load_dotenv
-from langchain.tools import tool
 from .write_results import write_results_file
+from .socrata import fetch_rows, fetch_batches, date_window_clause, iter_pages, SOCRATA_BASE_URL, SocrataError, chunk_values, soql_in, soql_order_limit
+from .name_index import name_index
+from .render import render_rows, render_groups, group_by_address, output_format, row_limit, count_label
 
 load_dotenv()
 OPEN_DATA_APP_TOKEN = os.getenv("OPEN_DATA_APP_TOKEN")
 
+# (label, column) pairs shown to the LLM for each inspection
+INSPECTION_FIELDS = [
+    ("Business name", "dba_name"),
+    ("Business address", "address"),
+    ("Results", "results"),
+    ("Date", "inspection_date"),
+    ("Violation", "violations"),
+    ("Risk Level", "risk"),
+]
+# The same, for results already grouped by address
+INSPECTION_FIELDS_BY_ADDRESS = [field for field in INSPECTION_FIELDS if field[1] != "address"]
+# One line per establishment in search_food_establishments
+ESTABLISHMENT_FIELDS = [
+    ("Business name", "dba_name"),
+    ("Business address", "address"),
+    ("Facility type", "facility_type"),
+    ("License", "license"),
+    ("Inspections", "inspections"),
+    ("Passed", "passes"),
+    ("Failed", "failures"),
+    ("Latest result", "latest_result"),
+    ("Latest inspection", "latest_inspection"),
+    ("Last failure", "last_failure"),
+]
+# Only the columns establishment_summaries needs are downloaded
+ESTABLISHMENT_SELECT = "license_, dba_name, address, facility_type, inspection_date, results"
+
+
+def _name_clause(name: str) -> str:
+    """The $where for a business name: the license numbers of the closest names in the local name index, or the
+    portal's own `like` match when the index has nothing close or can't be built."""
+    try:
+        matches = name_index().resolve(name)
+    except Exception as e:
+        print(f"Name index unavailable, matching {name} on the portal: {e}")
+        matches = []
+    if not matches:
+        return f"dba_name like '%{name}%'"
+    print(f"{name} matched {', '.join(m['name'] for m in matches)}")
+    licenses = [license_id for m in matches for license_id in m["licenses"]]
+    # Chains have hundreds of licenses, more than fit in a URL, but exact names are still cheap to match,
+    # in every spelling the index has seen; past a URL's worth of those, the portal's `like` does the matching
+    if licenses and len(list(chunk_values(licenses))) == 1:
+        return soql_in("license_", licenses)
+    spellings = [spelling for m in matches for spelling in m["spellings"]]
+    if len(list(chunk_values(spellings))) == 1:
+        # The query goes into the URL as it is, so "&" and "#" in a name would end the $where early
+        return soql_in("dba_name", spellings).replace("&", "%26").replace("#", "%23")
+    return f"dba_name like '%{name}%'"
+
+
 def search_address_food_inspections(name: str = None, address: str = None, coordinate_boundaries: dict=None, start_date: str = None, end_date: str = None, write_results: bool = False
 ) -> str:
     """Search for any results of recent health department inspections of restaurants by address or name.
 
     Args:
         address: optional, The building address in all-caps format (e.g., '1601 W CHICAGO AVE')
-        name: optional, the business name
+        name: optional, the business name. Close spellings match too (e.g. "DANTES" for "DANTE'S", "&" for "AND").
         start_date: Optional start date in YYYY-MM-DD format (e.g., '2024-01-01')
         end_date: Optional end date in YYYY-MM-DD format (e.g., '2024-12-31')
         write_results: Optional, set to True when the user wants the full results saved to a CSV file.
@@ -30,7 +83,7 @@ def search_address_food_inspections(name: str = None, address: str = None, coord
         address_or_name = " ".join(filter(None, [name, address]))
         
         where_clause = " AND ".join(filter(None, [
-            f"dba_name like '%{name}%'" if name else None,
+            _name_clause(name) if name else None,
             f"address='{address}'" if address else None
         ]))
     else:
@@ -45,31 +98,19 @@ def search_address_food_inspections(name: str = None, address: str = None, coord
         where_clause += f" AND inspection_date between '{start_date}T00:00:00' and '{end_date}T23:59:59'"
         print(f"Date range: {start_date} - {end_date}")
     
-    url = f"https://data.cityofchicago.org/resource/4ijn-s7e5.json?$where={where_clause}&$$app_token={OPEN_DATA_APP_TOKEN}"
+    limit = row_limit(write_results)
+    url = f"{SOCRATA_BASE_URL}/4ijn-s7e5.json?$where={where_clause}{soql_order_limit('inspection_date DESC', limit)}&$$app_token={OPEN_DATA_APP_TOKEN}"
     try:
-        response = requests.get(url)
-        if response.status_code == 200:
-            inspections = response.json()
+        status_code, inspections = fetch_rows(url)
+        if status_code == 200:
             if write_results:
                 write_results_file(inspections, outputname="food_inspections")
 
             # Format as string summary to make it easier for the LLM to understand
-            summary = f"Found {len(inspections)} inspections for {address_or_name}:\n\n"
-            for v in inspections:
-                summary += f"  Business name: {v.get('dba_name', 'Unknown')}\n"
-                summary += f"  Business address: {v.get('address', 'Unknown')}\n"
-                summary += f"  Results: {v.get('results', 'Unknown')}\n"
-                summary += f"  Date: {v.get('inspection_date', 'Unknown')}\n"
-                summary += f"  Violation: {v.get('violations', 'Unknown')}\n"
-                summary += f"  Risk Level: {v.get('risk', 'Unknown')}\n"
-
-            if len(summary) > 10000:
-                return summary[:10000] + "\n This query returned a huge amount of data and had to be truncated, so it's probably incomplete."
-
-            else:
-                return summary
+            header = f"Found {count_label(len(inspections), limit)} inspections for {address_or_name}, most recent first:\n\n"
+            return render_rows(header, inspections, INSPECTION_FIELDS, output_format("search_address_food_inspections"))
         else:
-            return f"Error retrieving data: {response.status_code}"
+            return f"Error retrieving data: {status_code}"
     except Exception as e:
         return f"Error: {e}"
     
@@ -102,29 +143,159 @@ def search_coordinates_food_inspections(coordinate_boundaries: dict, type: str=N
         where_clause += f" AND results='{type}'"
         
     
-    url = f"https://data.cityofchicago.org/resource/4ijn-s7e5.json?$where={where_clause}&$$app_token={OPEN_DATA_APP_TOKEN}"
+    limit = row_limit(write_results)
+    url = f"{SOCRATA_BASE_URL}/4ijn-s7e5.json?$where={where_clause}{soql_order_limit('inspection_date DESC', limit)}&$$app_token={OPEN_DATA_APP_TOKEN}"
     try:
-        response = requests.get(url)
-        if response.status_code == 200:
-            inspections = response.json()
+        status_code, inspections = fetch_rows(url)
+        if status_code == 200:
             if write_results:
                 write_results_file(inspections, outputname="food_inspections")
 
             # Format as string summary to make it easier for the LLM to understand
-            summary = f"Found {len(inspections)} inspections:\n\n"
-            for v in inspections:
-                summary += f"  Business name: {v.get('dba_name', 'Unknown')}\n"
-                summary += f"  Business address: {v.get('address', 'Unknown')}\n"
-                summary += f"  Results: {v.get('results', 'Unknown')}\n"
-                summary += f"  Date: {v.get('inspection_date', 'Unknown')}\n"
-                summary += f"  Violation: {v.get('violations', 'Unknown')}\n"
-
-            if len(summary) > 10000:
-                return summary[:10000] + "\n This query returned a huge amount of data and had to be truncated, so it's probably incomplete."
-
-            else:
-                return summary
+            header = f"Found {count_label(len(inspections), limit)} inspections, most recent first:\n\n"
+            return render_rows(header, inspections, INSPECTION_FIELDS[:5], output_format("search_coordinates_food_inspections"))
         else:
-            return f"Error retrieving data: {response.status_code}"
+            return f"Error retrieving data: {status_code}"
+    except Exception as e:
+        return f"Error: {e}"
+
+
+def search_addresses_food_inspections(addresses: list, start_date: str = None, end_date: str = None, write_results: bool = False
+) -> str:
+    """Search for health department inspections of restaurants at several addresses at once, with optional date filtering.
+    Use this instead of calling search_address_food_inspections once per address. Returns inspections grouped by address.
+
+    Args:
+        addresses: List of building addresses in all-caps format (e.g., ['1601 W CHICAGO AVE', '1751 W AUGUSTA BLVD'])
+        start_date: Optional start date in YYYY-MM-DD format (e.g., '2024-01-01')
+        end_date: Optional end date in YYYY-MM-DD format (e.g., '2024-12-31')
+        write_results: Optional, set to True when the user wants the full results saved to a CSV file.
+
+    Returns:
+        A text summary for each address including: details and date.
+    """
+    addresses = list(dict.fromkeys(" ".join(a.split()) for a in addresses))
+    print(f"Retrieving food inspections for {len(addresses)} addresses")
+    date_clause = date_window_clause("inspection_date", start_date, end_date)
+
+    def url_for_batch(batch):
+        where_clause = " AND ".join(filter(None, [soql_in("address", batch), date_clause]))
+        return f"{SOCRATA_BASE_URL}/4ijn-s7e5.json?$where={where_clause}{soql_order_limit('inspection_date DESC')}&$$app_token={OPEN_DATA_APP_TOKEN}"
+
+    try:
+        status_code, inspections = fetch_batches(addresses, url_for_batch)
+        if status_code != 200:
+            return f"Error retrieving data: {status_code}"
+
+        if write_results:
+            write_results_file(inspections, outputname="food_inspections")
+
+        if not inspections:
+            return f"No inspections found at {', '.join(addresses)} during date range selected."
+
+        found, missing = group_by_address(addresses, inspections, lambda v: " ".join((v.get("address") or "").split()))
+
+        # Format as string summary to make it easier for the LLM to understand
+        header = f"Found {len(inspections)} inspections at {len(found)} of {len(addresses)} address(es).\n"
+        if missing:
+            header += f"No inspections at: {', '.join(missing)}\n"
+        return render_groups(header, found, INSPECTION_FIELDS_BY_ADDRESS, output_format("search_addresses_food_inspections"), noun="inspection")
+    except Exception as e:
+        return f"Error: {e}"
+
+
+def establishment_summaries(inspections: list) -> pd.DataFrame:
+    """Collapse inspections into one row per establishment (license number, or name and address when the license is missing).
+
+    Returns:
+        A DataFrame with dba_name, address, facility_type, license, inspections, passes, failures, latest_result,
+        latest_inspection and last_failure, most recently inspected first. "Pass w/ Conditions" counts as a pass.
+    """
+    columns = [c.strip() for c in ESTABLISHMENT_SELECT.split(",")]
+    df = pd.DataFrame(inspections, columns=columns).rename(columns={"license_": "license"})
+    df["inspection_date"] = df["inspection_date"].str[:10]
+    df["address"] = df["address"].fillna("").str.split().str.join(" ")
+    df["key"] = df["license"].where(~df["license"].isin([None, "", "0"]), df["dba_name"] + " @ " + df["address"])
+    results = df["results"].fillna("")
+    df["passed"] = results.str.startswith("Pass")
+    df["failed"] = results.eq("Fail")
+    df["failure_date"] = df["inspection_date"].where(df["failed"])
+
+    df = df.sort_values("inspection_date")
+    summaries = df.groupby("key", sort=False).agg(
+        dba_name=("dba_name", "last"),
+        address=("address", "last"),
+        facility_type=("facility_type", "last"),
+        license=("license", "last"),
+        inspections=("inspection_date", "size"),
+        passes=("passed", "sum"),
+        failures=("failed", "sum"),
+        latest_result=("results", "last"),
+        latest_inspection=("inspection_date", "last"),
+        last_failure=("failure_date", "max"),
+    )
+    summaries = summaries.sort_values(["latest_inspection", "dba_name"], ascending=[False, True]).reset_index(drop=True)
+    return summaries.astype(object).where(summaries.notna(), None)
+
+
+def search_food_establishments(coordinate_boundaries: dict = None, name: str = None, address: str = None, start_date: str = None, end_date: str = None,
+                               no_failures_since: str = None, latest_result: str = None
+) -> str:
+    """Summarize health inspections per restaurant or food business instead of listing every inspection: for each establishment,
+    its latest result, how many inspections it passed and failed in the date range, and its last failure. Use this for questions like
+    "restaurants near X that haven't failed an inspection since October". Only establishments inspected in the date range are listed.
+
+    Args:
+        coordinate_boundaries: Optional dict of the coordinate boundaries in format {"north":north_bound, "south":south_bound, "east":east_bound, "west": west_bound}
+        name: Optional business name in all-caps; close spellings match too
+        address: Optional building address in all-caps format (e.g., '1601 W CHICAGO AVE')
+        start_date: Optional start date of the inspections to count, in YYYY-MM-DD format (e.g., '2024-01-01'). Defaults to no_failures_since.
+        end_date: Optional end date in YYYY-MM-DD format (e.g., '2024-12-31')
+        no_failures_since: Optional date in YYYY-MM-DD format; only list establishments with no failed inspection on or after it
+        latest_result: Optional, only list establishments whose latest inspection had this result. Options: "Pass", "Fail"
+
+    Returns:
+        A text summary with one line per establishment, most recently inspected first.
+    """
+
+    if not address and not name and not coordinate_boundaries:
+        raise Exception("Either name, coordinates, or address is necessary to find a restaurant")
+
+    where_clause = " AND ".join(filter(None, [
+        f"latitude between {coordinate_boundaries['south']} and {coordinate_boundaries['north']} AND longitude between {coordinate_boundaries['west']} and {coordinate_boundaries['east']}" if coordinate_boundaries else None,
+        _name_clause(name) if name else None,
+        f"address='{address}'" if address else None,
+    ]))
+
+    start_date = start_date or no_failures_since
+    if start_date:
+        end_date = end_date or datetime.now().strftime("%Y-%m-%d")
+        where_clause += f" AND inspection_date between '{start_date}T00:00:00' and '{end_date}T23:59:59'"
+        print(f"Date range: {start_date} - {end_date}")
+
+    url = f"{SOCRATA_BASE_URL}/4ijn-s7e5.json?$select={ESTABLISHMENT_SELECT}&$where={where_clause}{soql_order_limit(':id')}&$$app_token={OPEN_DATA_APP_TOKEN}"
+    try:
+        inspections = list(iter_pages(url))
+        if not inspections:
+            return "No inspections found during date range selected."
+        establishments = establishment_summaries(inspections)
+        total = len(establishments)
+
+        if no_failures_since:
+            establishments = establishments[establishments["last_failure"].isna() | (establishments["last_failure"] < no_failures_since)]
+        if latest_result:
+            establishments = establishments[establishments["latest_result"].fillna("").str.startswith(latest_result)]
+
+        # Format as string summary to make it easier for the LLM to understand
+        conditions = list(filter(None, [
+            f"no failed inspection since {no_failures_since}" if no_failures_since else None,
+            f"a latest result of {latest_result}" if latest_result else None,
+        ]))
+        header = f"{len(establishments)} of {total} establishment(s) inspected{f' since {start_date}' if start_date else ''}"
+        header += f" had {' and '.join(conditions)}" if conditions else ""
+        header += ", most recently inspected first:\n\n"
+        return render_rows(header, establishments.to_dict("records"), ESTABLISHMENT_FIELDS, output_format("search_food_establishments"))
+    except SocrataError as e:
+        return f"Error retrieving data: {e.status_code}"
     except Exception as e:
-        return f"Error: {e}"
\ No newline at end of file
+        return f"Error: {e}"
@@ -6,38 +6,45 @@ OPEN_DATA_APP_TOKEN = os.getenv("OPEN_DATA_APP_TOKEN")
 
 from geopy.geocoders import Nominatim, ArcGIS
 import math
-import time
 from geopy.exc import GeocoderTimedOut, GeocoderUnavailable, GeocoderQuotaExceeded, GeocoderServiceError
 from diskcache import Cache
 from pathlib import Path
+from . import metrics, ratelimit
 
 _CACHE_DIR = Path(__file__).resolve().parent.parent / ".geocode_cache"
 geocode_cache = Cache(str(_CACHE_DIR))
 
-@geocode_cache.memoize()
-def _geocode_address_cached(address: str):    
+ARCGIS_HOST = "geocode.arcgis.com"
+
+
+def _arcgis_geocode(query: str):
+    """Geocode with ArcGIS under the shared rate limit for its host, backing off with jitter (or for as
+    long as a rate-limited response asks) when it times out, throttles or fails."""
     # app = Nominatim(user_agent="chicago_location_investigator")
     app = ArcGIS(timeout=10)
-    
-    max_retries = 3
-    retry_delay = 4  # seconds
-    
-    for attempt in range(max_retries):
+    bucket = ratelimit.limiter(ARCGIS_HOST)
+
+    for attempt in range(ratelimit.MAX_RETRIES + 1):
         try:
-            print(f"Geocoding location {address}")
-            location = app.geocode(address)#.raw
+            with metrics.span("http", "arcgis", host=ARCGIS_HOST, retries=attempt) as s:
+                s["rate_limit_wait_s"] = bucket.acquire()
+                location = app.geocode(query)#.raw
+                s["rows_returned"] = 0 if location is None else 1
             if location is None:
-                raise ValueError(f"Could not geocode {address}.")
+                raise ValueError(f"Could not geocode {query}.")
 
             return (location.latitude, location.longitude) #(float(location['lat']), float(location['lon']))
-        except (GeocoderTimedOut, GeocoderUnavailable, GeocoderQuotaExceeded, GeocoderServiceError):
-            if attempt < max_retries - 1:
-                time.sleep(retry_delay)
-                retry_delay *= 2 
-            else:
-                raise 
-        except Exception as e:
-            raise e
+        except (GeocoderTimedOut, GeocoderUnavailable, GeocoderQuotaExceeded, GeocoderServiceError) as e:
+            if attempt == ratelimit.MAX_RETRIES:
+                raise
+            # GeocoderRateLimited carries the server's Retry-After
+            bucket.pause(ratelimit.retry_delay(attempt, getattr(e, "retry_after", None)))
+
+
+@geocode_cache.memoize()
+def _geocode_address_cached(address: str):
+    print(f"Geocoding location {address}")
+    return _arcgis_geocode(address)
 
 def geocode_address(address: str):
     """Provide an address including city and state, and this function will return geocoordinates for this location.
@@ -48,35 +55,17 @@ def geocode_address(address: str):
     Returns: 
         Latitude, Longitude as tuple
     """
+    address = " ".join(address.split()).upper()
+    metrics.record(cache="hit" if _geocode_address_cached.__cache_key__(address) in geocode_cache else "miss")
     try:
-        return _geocode_address_cached(" ".join(address.split()).upper())
+        return _geocode_address_cached(address)
     except ValueError as e:
         return str(e)
     
 @geocode_cache.memoize()
-def _geocode_intersection_cached(street_1: str, street_2: str):    
-    app = ArcGIS(timeout=10)
-    
-    max_retries = 3
-    retry_delay = 4  # seconds
-    
-    for attempt in range(max_retries):
-        try:
-            print(f"Geocoding intersection of {street_1} and {street_2}")
-            location = app.geocode(f"{street_1} and {street_2}, CHICAGO, IL")
-
-            if location is None:
-                raise ValueError(f"Could not geocode {street_1} and {street_2}, CHICAGO, IL.")
-
-            return (location.latitude, location.longitude)
-        except (GeocoderTimedOut, GeocoderUnavailable, GeocoderQuotaExceeded, GeocoderServiceError):
-            if attempt < max_retries - 1:
-                time.sleep(retry_delay)
-                retry_delay *= 2 
-            else:
-                raise 
-        except Exception as e:
-            raise e
+def _geocode_intersection_cached(street_1: str, street_2: str):
+    print(f"Geocoding intersection of {street_1} and {street_2}")
+    return _arcgis_geocode(f"{street_1} and {street_2}, CHICAGO, IL")
 
 def geocode_intersection(street_1: str, street_2: str):
     """Get coordinates for a street intersection / corner (e.g. 'the corner of Monroe and State').
@@ -89,8 +78,10 @@ def geocode_intersection(street_1: str, street_2: str):
     Returns: 
         Latitude, Longitude as tuple
     """
+    street_1, street_2 = street_1.upper(), street_2.upper()
+    metrics.record(cache="hit" if _geocode_intersection_cached.__cache_key__(street_1, street_2) in geocode_cache else "miss")
     try:
-        return _geocode_intersection_cached(street_1.upper(), street_2.upper())
+        return _geocode_intersection_cached(street_1, street_2)
     except ValueError as e:
         return str(e)
 
@@ -1,22 +1,78 @@
 
-import requests
-from datetime import datetime
 import os
 from dotenv import load_dotenv
 from .write_results import write_results_file
+from .socrata import fetch_rows, fetch_batches, date_window_clause, SOCRATA_BASE_URL, soql_in, soql_order_limit
+from .render import render_rows, render_groups, group_by_address, output_format, row_limit, count_label
 
 load_dotenv()
 OPEN_DATA_APP_TOKEN = os.getenv("OPEN_DATA_APP_TOKEN")
 
+# (label, column or function of the row) pairs shown to the LLM for each permit
+PERMIT_FIELDS = [
+    ("Permit", "permit_"),
+    ("Permit Type", "permit_type"),
+    ("Date", "issue_date"),
+    ("Work Description", "work_description"),
+    ("Issued To", "contact_1_name"),
+    ("Address", lambda v: permit_address(v)),
+]
 
-def search_address_active_building_permits(house_number:str, cardinal_direction: str, street: str, write_results: bool = False) -> str:
-    """Search for active building permits issued for a specific address.
-    Returns permit details.
+DIRECTIONS = {"N", "S", "E", "W"}
+
+
+def split_address(address: str):
+    """Split '830 N MARSHFIELD AVE' into the permit dataset's (street_number, street_direction, street_name)."""
+    number, _, rest = " ".join(address.split()).partition(" ")
+    direction, _, street = rest.partition(" ")
+    if direction not in DIRECTIONS or not street:
+        direction, street = None, rest
+    return number, direction, street
+
+
+def permit_address(permit: dict) -> str:
+    """Join a permit's split address columns back into '830 N MARSHFIELD AVE'."""
+    return " ".join(filter(None, [permit.get("street_number"), permit.get("street_direction"), permit.get("street_name")]))
+
+
+def permit_address_clause(addresses: list) -> str:
+    """A SoQL filter matching permits at any of the addresses. It matches on number and street name
+    columns separately, so it can also match other pairings; keep exact matches with permit_address."""
+    numbers, streets = set(), set()
+    for address in addresses:
+        number, _, street = split_address(address)
+        numbers.add(number)
+        streets.add(street)
+    return f"{soql_in('street_number', sorted(numbers))} AND {soql_in('street_name', sorted(streets))}"
+
+
+def requested_address(addresses: list):
+    """A function from a permit to the address it was asked for under, or None for a permit at none of them.
+    An address without a direction ('830 MARSHFIELD AVE') gets the permits at that number on that street."""
+    wanted = {split_address(address): address for address in addresses}
+
+    def match(permit: dict):
+        number, street = permit.get("street_number"), permit.get("street_name")
+        return wanted.get((number, permit.get("street_direction"), street)) or wanted.get((number, None, street))
+
+    return match
+
+
+def issue_date_clause(start_date: str = None, end_date: str = None):
+    """The SoQL filter on a permit's issue date, or None without a start date."""
+    return date_window_clause("issue_date", start_date, end_date, label="Issue date range")
+
+
+def search_address_active_building_permits(house_number:str, cardinal_direction: str, street: str, start_date: str = None, end_date: str = None, write_results: bool = False) -> str:
+    """Search for active building permits issued for a specific address, with optional filtering on the issue date.
+    Returns permit details, most recently issued first.
 
     Args:
         house_number: The number of the house or building on that street (e.g., "123")
         cardinal_direction: The direction of the street, single character, in all caps format. One of N, S, E, or W.
         street: The street name in all-caps format (e.g., 'MAIN ST')
+        start_date: Optional, only permits issued on or after this date, in YYYY-MM-DD format (e.g., '2024-01-01')
+        end_date: Optional, only permits issued on or before this date, in YYYY-MM-DD format (e.g., '2024-12-31')
         write_results: Optional, set to True when the user wants the full results saved to a CSV file.
 
     Returns:
@@ -26,48 +82,37 @@ def search_address_active_building_permits(house_number:str, cardinal_direction:
     # Build where clause with date filtering if provided
     where_clause = f"street_name='{street}' AND street_number='{house_number}' AND street_direction='{cardinal_direction}'"
     print(f"Retrieving active permits for address {house_number} {cardinal_direction} {street}")
+    where_clause = " AND ".join(filter(None, [where_clause, "permit_status='ACTIVE'", issue_date_clause(start_date, end_date)]))
 
-    url = f"https://data.cityofchicago.org/resource/ydr8-5enu.json?$where={where_clause}&$$app_token={OPEN_DATA_APP_TOKEN}"
+    limit = row_limit(write_results)
+    url = f"{SOCRATA_BASE_URL}/ydr8-5enu.json?$where={where_clause}{soql_order_limit('issue_date DESC', limit)}&$$app_token={OPEN_DATA_APP_TOKEN}"
     try:
-        response = requests.get(url)
-        if response.status_code == 200:
-            permits = response.json()
+        status_code, active_permits = fetch_rows(url)
+        if status_code == 200:
             if write_results:
-                write_results_file(permits, outputname="building_permits")
-
-            active_permits = [
-                x for x in permits if x.get("permit_status") == "ACTIVE"
-            ]
+                write_results_file(active_permits, outputname="building_permits")
 
             if not active_permits:
                 return f"No active permits found for {house_number} {cardinal_direction} {street}."
 
             # Format as string summary to make it easier for the LLM to understand
-            summary = f"Found {len(active_permits)} active permit(s) issued for {house_number} {cardinal_direction} {street}:\n\n"
-            for v in active_permits:
-                summary += f"- Permit #{v.get('permit#', 'N/A')}\n"
-                summary += f"  Permit Type: {v.get('permit_type', 'N/A')}"
-                summary += f"  Date: {v.get('issue_date', 'Unknown')}\n"
-                summary += f"  Work Description: {v.get('work_description', 'Unknown')}\n"
-                summary += f"  Issued To: {v.get('contact_1_name', 'Unknown')}\n\n"
-
-            if len(summary) > 10000:
-                return summary[:10000] + "\n This query returned a huge amount of data aand had to be truncated, so it's probably incomplete."
-
-            else:
-                return summary
+            # Every row is at the same address, so leave that column out
+            header = f"Found {count_label(len(active_permits), limit)} active permit(s) issued for {house_number} {cardinal_direction} {street}, most recent first:\n\n"
+            return render_rows(header, active_permits, PERMIT_FIELDS[:5], output_format("search_address_active_building_permits"))
         else:
-            return f"Error retrieving data: {response.status_code}"
+            return f"Error retrieving data: {status_code}"
     except Exception as e:
         return f"Error: {e}"
     
 
-def search_coordinates_active_building_permits(coordinate_boundaries:dict, write_results: bool = False) -> str:
-    """Search for active building permits issued within a set of coordinates.
-    Returns permit details.
+def search_coordinates_active_building_permits(coordinate_boundaries:dict, start_date: str = None, end_date: str = None, write_results: bool = False) -> str:
+    """Search for active building permits issued within a set of coordinates, with optional filtering on the issue date.
+    Returns permit details, most recently issued first.
 
     Args:
         coordinate_boundaries: The dict of the coordinate boundaries in format {"north":north_bound, "south":south_bound, "east":east_bound, "west": west_bound}
+        start_date: Optional, only permits issued on or after this date, in YYYY-MM-DD format (e.g., '2024-01-01')
+        end_date: Optional, only permits issued on or before this date, in YYYY-MM-DD format (e.g., '2024-12-31')
         write_results: Optional, set to True when the user wants the full results saved to a CSV file.
 
     Returns:
@@ -78,38 +123,68 @@ def search_coordinates_active_building_permits(coordinate_boundaries:dict, write
     where_clause = f"latitude%20between%20{coordinate_boundaries['south']}%20and%20{coordinate_boundaries['north']}%20AND%20longitude%20between%20{coordinate_boundaries['west']}%20and%20{coordinate_boundaries['east']}"
 
     print(f"Retrieving active permits within {coordinate_boundaries}")
+    where_clause = " AND ".join(filter(None, [where_clause, "permit_status='ACTIVE'", issue_date_clause(start_date, end_date)]))
 
-    url = f"https://data.cityofchicago.org/resource/ydr8-5enu.json?$where={where_clause}&$$app_token={OPEN_DATA_APP_TOKEN}"
+    limit = row_limit(write_results)
+    url = f"{SOCRATA_BASE_URL}/ydr8-5enu.json?$where={where_clause}{soql_order_limit('issue_date DESC', limit)}&$$app_token={OPEN_DATA_APP_TOKEN}"
     try:
-        response = requests.get(url)
-        if response.status_code == 200:
-            permits = response.json()
+        status_code, active_permits = fetch_rows(url)
+        if status_code == 200:
             if write_results:
-                write_results_file(permits, outputname="building_permits")
-            active_permits = [
-                x for x in permits if x.get("permit_status") == "ACTIVE"
-            ]
+                write_results_file(active_permits, outputname="building_permits")
 
             if not active_permits:
                 return f"No active permits found within {coordinate_boundaries}."
 
             # Format as string summary to make it easier for the LLM to understand
-            summary = f"Found {len(active_permits)} active permit(s) issued in {coordinate_boundaries}:\n\n"
-            for v in active_permits:
-                summary += f"- Permit #{v.get('permit_', 'N/A')}\n"
-                summary += f"  Permit Type: {v.get('permit_type', 'N/A')}"
-                summary += f"  Date: {v.get('issue_date', 'Unknown')}\n"
-                summary += f"  Work Description: {v.get('work_description', 'Unknown')}\n"
-                summary += f"  Issued To: {v.get('contact_1_name', 'Unknown')}\n"
-                summary += f"  Address: {v.get('street_number')} {v.get('street_direction')} {v.get('street_name')}\n\n"
-
-            if len(summary) > 10000:
-                return summary[:10000] + "\n This query returned a huge amount of data and had to be truncated, so it's probably incomplete."
-
-            else:
-                return summary
+            header = f"Found {count_label(len(active_permits), limit)} active permit(s) issued in {coordinate_boundaries}, most recent first:\n\n"
+            return render_rows(header, active_permits, PERMIT_FIELDS, output_format("search_coordinates_active_building_permits"))
         else:
-            return f"Error retrieving data: {response.status_code}"
+            return f"Error retrieving data: {status_code}"
+    except Exception as e:
+        return f"Error: {e}"
+
+
+def search_addresses_active_building_permits(addresses: list, start_date: str = None, end_date: str = None, write_results: bool = False) -> str:
+    """Search for active building permits issued for several addresses at once, with optional filtering on the issue date.
+    Use this instead of calling search_address_active_building_permits once per address. Returns permit details grouped by address.
+
+    Args:
+        addresses: List of building addresses in all-caps format, with a one-letter direction where known (e.g., ['830 N MARSHFIELD AVE', '1601 W CHICAGO AVE'])
+        start_date: Optional, only permits issued on or after this date, in YYYY-MM-DD format (e.g., '2024-01-01')
+        end_date: Optional, only permits issued on or before this date, in YYYY-MM-DD format (e.g., '2024-12-31')
+        write_results: Optional, set to True when the user wants the full results saved to a CSV file.
+
+    Returns:
+        A text summary for each address including: permit number, status
+    """
+    addresses = list(dict.fromkeys(" ".join(a.split()) for a in addresses))
+    print(f"Retrieving active permits for {len(addresses)} addresses")
+    date_clause = issue_date_clause(start_date, end_date)
+
+    def url_for_batch(batch):
+        where_clause = " AND ".join(filter(None, [permit_address_clause(batch), "permit_status='ACTIVE'", date_clause]))
+        return f"{SOCRATA_BASE_URL}/ydr8-5enu.json?$where={where_clause}{soql_order_limit('issue_date DESC')}&$$app_token={OPEN_DATA_APP_TOKEN}"
+
+    try:
+        status_code, permits = fetch_batches(addresses, url_for_batch)
+        if status_code != 200:
+            return f"Error retrieving data: {status_code}"
+
+        match = requested_address(addresses)
+        active_permits = [x for x in permits if match(x)]
+        if write_results:
+            write_results_file(active_permits, outputname="building_permits")
+
+        if not active_permits:
+            return f"No active permits found for {', '.join(addresses)}."
+
+        found, missing = group_by_address(addresses, active_permits, match)
+
+        # Format as string summary to make it easier for the LLM to understand
+        header = f"Found {len(active_permits)} active permit(s) at {len(found)} of {len(addresses)} address(es).\n"
+        if missing:
+            header += f"No active permits at: {', '.join(missing)}\n"
+        return render_groups(header, found, PERMIT_FIELDS[:5], output_format("search_addresses_active_building_permits"), noun="active permit")
     except Exception as e:
         return f"Error: {e}"
-    
\ No newline at end of file
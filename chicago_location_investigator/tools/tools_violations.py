@@ -1,14 +1,37 @@
 
-import requests
 from datetime import datetime
 import os
 from dotenv import load_dotenv
 from .write_results import write_results_file
+from .socrata import fetch_rows, fetch_batches, date_window_clause, SOCRATA_BASE_URL, soql_in, soql_order_limit
+from .render import truncate_summary, render_rows, render_groups, group_by_address, output_format, group_rows, should_group, row_limit, count_label
 
 load_dotenv()
 OPEN_DATA_APP_TOKEN = os.getenv("OPEN_DATA_APP_TOKEN")
 
-def search_coordinates_violations(coordinate_boundaries:dict, start_date:str = None,  end_date: str = None, write_results: bool = False):
+# (label, column) pairs shown to the LLM for each violation row
+VIOLATION_FIELDS = [
+    ("Violation", "id"),
+    ("Date", "violation_date"),
+    ("Address", "address"),
+]
+
+# Columns for one line per address when violations are grouped
+VIOLATION_GROUP_FIELDS = [
+    ("Address", "group"),
+    ("Violations", "count"),
+    ("First", "first"),
+    ("Last", "last"),
+    ("Most common", "top"),
+    ("Violation ids", "ids"),
+]
+
+
+def _short_description(violation: dict):
+    description = violation.get("violation_description")
+    return description[:60] if description else None
+
+def search_coordinates_violations(coordinate_boundaries:dict, start_date:str = None,  end_date: str = None, group_by_address: bool = None, write_results: bool = False):
     """Search for building code violations within the bounds of a set of geocoordinates (north, south, east, and west) with optional date filtering.
     Returns violation numbers and dates.
 
@@ -16,6 +39,8 @@ def search_coordinates_violations(coordinate_boundaries:dict, start_date:str = N
         coordinate_boundaries: The dict of the coordinate boundaries in format {"north":north_bound, "south":south_bound, "east":east_bound, "west": west_bound}
         start_date: Optional start date in YYYY-MM-DD format (e.g., '2024-01-01')
         end_date: Optional end date in YYYY-MM-DD format (e.g., '2024-12-31')
+        group_by_address: Optional. By default, when several violations share an address they are collapsed into one line per address
+            with the count, date span, most common violations and violation ids. Set to False to list every violation separately.
         write_results: Optional, set to True when the user wants the full results saved to a CSV file.
 
     Returns:
@@ -33,37 +58,36 @@ def search_coordinates_violations(coordinate_boundaries:dict, start_date:str = N
         end_date = datetime.now().strftime("%Y-%m-%d")
         where_clause += f" AND violation_date between '{start_date}T00:00:00' and '{end_date}T23:59:59'"
         print(f"Date range: {start_date} - {end_date}")
+    where_clause += " AND inspection_status='FAILED'"
 
-    url = f"https://data.cityofchicago.org/resource/22u3-xenr.json?$where={where_clause}&$$app_token={OPEN_DATA_APP_TOKEN}"
+    # Grouping needs every row to count them, so only cap the rows when listing them one by one. Without a
+    # $limit fetch_rows pages to the last row, so the counts and date spans cover the whole area
+    limit = row_limit(write_results) if group_by_address is False else None
+    url = f"{SOCRATA_BASE_URL}/22u3-xenr.json?$where={where_clause}{soql_order_limit('violation_date DESC', limit)}&$$app_token={OPEN_DATA_APP_TOKEN}"
 
     try:
-        response = requests.get(url)
-        if response.status_code == 200:
-            inspections = response.json()
+        status_code, violations = fetch_rows(url)
+        if status_code == 200:
             if write_results:
-                write_results_file(inspections, outputname="violations")
-            violations = [
-                x for x in inspections if x.get("inspection_status") == "FAILED"
-            ]
+                write_results_file(violations, outputname="violations")
 
             if not violations:
                 return f"No violations found at {coordinate_boundaries} during date range selected."
 
             # Format as string summary to make it easier for the LLM to understand
-            summary = f"Found {len(violations)} violation(s) at {coordinate_boundaries} during date range selected:\n\n"
-            for v in violations:
-                summary += f"- Violation #{v.get('id', 'N/A')}\n"
-                summary += f"  Date: {v.get('violation_date', 'Unknown')}\n"
-                summary += f"  Address: {v.get('address', 'Unknown')}\n"
-
-            if len(summary) > 10000:
-                return summary[:10000] + "\n This query returned a huge amount of data aand had to be truncated, so it's probably incomplete."
-
-            else:
-                return summary
+            fmt = output_format("search_coordinates_violations")
+            groups = group_rows(violations, "address", "violation_date", category_field=_short_description, id_field="id")
+            if should_group(violations, groups, group_by_address):
+                header = (
+                    f"Found {len(violations)} violation(s) at {len(groups)} address(es) in {coordinate_boundaries} during date range selected. "
+                    "Use search_address_violations to list one address's violations, or get_violation_details for one violation id:\n\n"
+                )
+                return render_rows(header, groups, VIOLATION_GROUP_FIELDS, fmt)
+
+            header = f"Found {count_label(len(violations), limit)} violation(s) at {coordinate_boundaries} during date range selected, most recent first:\n\n"
+            return render_rows(header, violations, VIOLATION_FIELDS, fmt)
         else:
-            print(response)
-            return f"Error retrieving data: {response.status_code}"
+            return f"Error retrieving data: {status_code}"
     except Exception as e:
         return f"Error: {e}"
 
@@ -94,35 +118,71 @@ def search_address_violations(
         end_date = datetime.now().strftime("%Y-%m-%d")
         where_clause += f" AND violation_date between '{start_date}T00:00:00' and '{end_date}T23:59:59'"
         print(f"Date range: {start_date} - {end_date}")
+    where_clause += " AND inspection_status='FAILED'"
 
-    url = f"https://data.cityofchicago.org/resource/22u3-xenr.json?$where={where_clause}&$$app_token={OPEN_DATA_APP_TOKEN}"
+    limit = row_limit(write_results)
+    url = f"{SOCRATA_BASE_URL}/22u3-xenr.json?$where={where_clause}{soql_order_limit('violation_date DESC', limit)}&$$app_token={OPEN_DATA_APP_TOKEN}"
 
     try:
-        response = requests.get(url)
-        if response.status_code == 200:
-            inspections = response.json()
+        status_code, violations = fetch_rows(url)
+        if status_code == 200:
             if write_results:
-                write_results_file(inspections, outputname="violations")
-            violations = [
-                x for x in inspections if x.get("inspection_status") == "FAILED"
-            ]
+                write_results_file(violations, outputname="violations")
 
             if not violations:
                 return f"No violations found at {address} during date range selected."
 
             # Format as string summary to make it easier for the LLM to understand
-            summary = f"Found {len(violations)} violation(s) at {address} during date range selected:\n\n"
-            for v in violations:
-                summary += f"- Violation #{v.get('id', 'N/A')}\n"
-                summary += f"  Date: {v.get('violation_date', 'Unknown')}\n"
+            # Every row is at the same address, so leave that column out
+            header = f"Found {count_label(len(violations), limit)} violation(s) at {address} during date range selected, most recent first:\n\n"
+            return render_rows(header, violations, VIOLATION_FIELDS[:2], output_format("search_address_violations"))
+        else:
+            return f"Error retrieving data: {status_code}"
+    except Exception as e:
+        return f"Error: {e}"
 
-            if len(summary) > 10000:
-                return summary[:10000] + "\n This query returned a huge amount of data and had to be truncated, so it's probably incomplete."
 
-            else:
-                return summary
-        else:
-            return f"Error retrieving data: {response.status_code}"
+def search_addresses_violations(
+    addresses: list, start_date: str = None, end_date: str = None, write_results: bool = False
+) -> str:
+    """Search for building code violations at several addresses at once, with optional date filtering.
+    Use this instead of calling search_address_violations once per address. Returns violation numbers and dates grouped by address.
+
+    Args:
+        addresses: List of building addresses in all-caps format (e.g., ['1601 W CHICAGO AVE', '1751 W AUGUSTA BLVD'])
+        start_date: Optional start date in YYYY-MM-DD format (e.g., '2024-01-01')
+        end_date: Optional end date in YYYY-MM-DD format (e.g., '2024-12-31')
+        write_results: Optional, set to True when the user wants the full results saved to a CSV file.
+
+    Returns:
+        A text summary for each address including: violation numbers, dates, and status
+    """
+    addresses = list(dict.fromkeys(" ".join(a.split()) for a in addresses))
+    print(f"Retrieving building violations for {len(addresses)} addresses")
+    date_clause = date_window_clause("violation_date", start_date, end_date)
+
+    def url_for_batch(batch):
+        where_clause = " AND ".join(filter(None, [soql_in("address", batch), date_clause, "inspection_status='FAILED'"]))
+        return f"{SOCRATA_BASE_URL}/22u3-xenr.json?$where={where_clause}{soql_order_limit('violation_date DESC')}&$$app_token={OPEN_DATA_APP_TOKEN}"
+
+    try:
+        status_code, violations = fetch_batches(addresses, url_for_batch)
+        if status_code != 200:
+            return f"Error retrieving data: {status_code}"
+
+        if write_results:
+            write_results_file(violations, outputname="violations")
+
+        if not violations:
+            return f"No violations found at {', '.join(addresses)} during date range selected."
+
+        found, missing = group_by_address(addresses, violations, lambda v: " ".join((v.get("address") or "").split()))
+
+        # Format as string summary to make it easier for the LLM to understand
+        header = f"Found {len(violations)} violation(s) at {len(found)} of {len(addresses)} address(es) during date range selected.\n"
+        if missing:
+            header += f"No violations at: {', '.join(missing)}\n"
+        return render_groups(header, found, VIOLATION_FIELDS[:2], output_format("search_addresses_violations"), noun="violation")
     except Exception as e:
         return f"Error: {e}"
 
@@ -136,14 +196,13 @@ def get_violation_details(violation_id_number: str) -> str:
     Returns:
         Detailed information about the specific violation including description and inspector notes
     """
-    url = f"https://data.cityofchicago.org/resource/22u3-xenr.json?id={violation_id_number}&$$app_token={OPEN_DATA_APP_TOKEN}"
+    url = f"{SOCRATA_BASE_URL}/22u3-xenr.json?id={violation_id_number}&$$app_token={OPEN_DATA_APP_TOKEN}"
 
     print(f"Retrieving details for violation #{violation_id_number}")
 
     try:
-        response = requests.get(url)
-        if response.status_code == 200:
-            violations = response.json()
+        status_code, violations = fetch_rows(url)
+        if status_code == 200:
             if not violations:
                 return f"No inspection found with number {violation_id_number}"
 
@@ -160,12 +219,8 @@ def get_violation_details(violation_id_number: str) -> str:
             details += "Violation status notes: Open means it has not been remedied, Complied means it has been remedied."
             details += f"\n Today's date is {datetime.now().strftime('%Y-%m-%d')}"
 
-            if len(details) > 10000:
-                return details[:10000] + "\n This query returned a huge amount of data aand had to be truncated, so it's probably incomplete."
-
-            else:
-                return details
+            return truncate_summary(details, rows_rendered=1)
         else:
-            return f"Error: {response.status_code}"
+            return f"Error: {status_code}"
     except Exception as e:
         return f"Error: {e}"
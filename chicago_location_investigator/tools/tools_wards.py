@@ -1,10 +1,32 @@
-import requests
 import os
 from dotenv import load_dotenv
+from .socrata import fetch_rows, SOCRATA_BASE_URL
+from .mirror import Mirror, MIRROR_DATASETS, mirror_path
+from .render import render_rows, output_format, count_label, MAX_RENDERED_ROWS
+from .tools_violations import VIOLATION_FIELDS
+from .tools_permits import PERMIT_FIELDS
+from .tools_food import INSPECTION_FIELDS
+from .tools_crash import CRASH_FIELDS
+from .tools_art import MURAL_FIELDS
 
 load_dotenv()
 OPEN_DATA_APP_TOKEN = os.getenv("OPEN_DATA_APP_TOKEN")
 
+# The fields each dataset's own tools show, reused for records read from the mirror
+MIRROR_FIELDS = {
+    "violations": VIOLATION_FIELDS,
+    "permits": PERMIT_FIELDS,
+    "food_inspections": INSPECTION_FIELDS,
+    "crashes": CRASH_FIELDS,
+    "murals": MURAL_FIELDS,
+}
+# The mirror holds records of every status; the ward search shows the same ones as the other violation and permit tools
+MIRROR_MATCHING = {
+    "violations": {"inspection_status": "FAILED"},
+    "permits": {"permit_status": "ACTIVE"},
+}
+
+
 def search_ward_for_point(latitude: float, longitude: float) -> str:
     """Identify which Chicago ward contains a specific geocoordinate point.
 
@@ -17,16 +39,54 @@ def search_ward_for_point(latitude: float, longitude: float) -> str:
     """
     # NOTE: WKT is 'POINT (longitude latitude)' — longitude FIRST.
     where_clause = f"intersects(the_geom, 'POINT ({longitude} {latitude})')"
-    url = f"https://data.cityofchicago.org/resource/p293-wvbd.json?$where={where_clause}&$$app_token={OPEN_DATA_APP_TOKEN}"
+    url = f"{SOCRATA_BASE_URL}/p293-wvbd.json?$where={where_clause}&$$app_token={OPEN_DATA_APP_TOKEN}"
     try:
-        response = requests.get(url)
-        if response.status_code == 200:
-            wards = response.json()
+        status_code, wards = fetch_rows(url)
+        if status_code == 200:
             if not wards:
                 return f"No ward found containing point ({latitude}, {longitude})."
             w = wards[0]
             return f"Point ({latitude}, {longitude}) is in Ward {w.get('ward', 'Unknown')}."
         else:
-            return f"Error retrieving data: {response.status_code}"
+            return f"Error retrieving data: {status_code}"
+    except Exception as e:
+        return f"Error: {e}"
+
+
+def search_ward_records(ward: int, dataset: str, start_date: str = None, end_date: str = None) -> str:
+    """Get every record of one kind inside a Chicago ward, from the local mirror of the data portal.
+    Use this for questions about a whole ward (e.g. "violations in Ward 27 this year") instead of coordinate boundaries.
+    Like the other tools, violations are only failed inspections and permits only active ones.
+
+    Args:
+        ward: The ward number (e.g., 27)
+        dataset: Which records to get. Options: "violations", "permits", "food_inspections", "crashes", "murals"
+        start_date: Optional start date in YYYY-MM-DD format (e.g., '2024-01-01')
+        end_date: Optional end date in YYYY-MM-DD format (e.g., '2024-12-31')
+
+    Returns:
+        A text summary of the ward's records, most recent first.
+    """
+    if dataset not in MIRROR_DATASETS:
+        raise Exception(f"dataset must be one of {', '.join(MIRROR_DATASETS)}")
+    if not mirror_path().exists():
+        return "Error: there is no local mirror to search by ward. Run sync_mirror.py first."
+
+    try:
+        mirror = Mirror()
+        try:
+            if mirror.high_water_mark(dataset) is None:
+                return f"Error: {dataset} haven't been synced to the local mirror. Run sync_mirror.py --datasets {dataset} first."
+            records = mirror.records(
+                dataset, start_date, end_date, limit=MAX_RENDERED_ROWS, matching=MIRROR_MATCHING.get(dataset), ward=int(ward)
+            )
+        finally:
+            mirror.close()
+
+        if not records:
+            return f"No {dataset.replace('_', ' ')} found in Ward {ward} during date range selected."
+        # Format as string summary to make it easier for the LLM to understand
+        header = f"Found {count_label(len(records), MAX_RENDERED_ROWS)} {dataset.replace('_', ' ')} in Ward {ward}, most recent first:\n\n"
+        return render_rows(header, records, MIRROR_FIELDS[dataset], output_format("search_ward_records"))
     except Exception as e:
         return f"Error: {e}"
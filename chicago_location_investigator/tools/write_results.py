@@ -1,15 +1,35 @@
-import pandas as pd
+import csv
+import tempfile
 from pathlib import Path
 from datetime import datetime
 
 
 
 def write_results_file(response, outputname):
-    """Write the API results to file, for later user access."""
+    """Write the API results to a CSV file, for later user access.
+
+    Rows are written as they come, so `response` can be a generator (see socrata.stream_rows) and the
+    export never holds more than one row. Columns are every key seen, in order of first appearance.
+    """
 
     OUTPUT_DIR = Path(__file__).resolve().parent.parent / "output"
     OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+    path = OUTPUT_DIR / f"{outputname}_{datetime.now():%Y%m%d_%H%M%S}.csv"
 
-    pd.DataFrame(response).to_csv(f"{OUTPUT_DIR}/{outputname}_{datetime.now():%Y%m%d_%H%M%S}.csv", index=False)
+    # The header isn't known until the last row, so the body goes to a temporary file first
+    columns = {}
+    with tempfile.TemporaryFile("w+", newline="") as body:
+        writer = csv.writer(body)
+        for row in response:
+            for column in row:
+                columns.setdefault(column, len(columns))
+            writer.writerow([row.get(column) for column in columns])
+        body.seek(0)
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(columns)
+            for line in csv.reader(body):
+                # Rows written before a later column first appeared are padded out to the full width
+                writer.writerow(line + [""] * (len(columns) - len(line)))
 
-    print(f"File written to {OUTPUT_DIR}/{outputname}_{datetime.now():%Y%m%d_%H%M%S}.csv")
+    print(f"File written to {path}")
@@ -0,0 +1,178 @@
+"""Watch a list of addresses for new building violations, building permits and failed food inspections.
+
+Each poll asks every dataset only for rows changed since the last poll (`:updated_at` past the stored
+high-water mark), for all watched addresses at once with batched `address in (...)` queries, so a few
+hundred addresses take a handful of requests. Only new or changed events are written, one JSON object
+per line:
+
+    uv run python chicago_location_investigator/watch.py watchlist.txt --out events.jsonl
+    uv run python chicago_location_investigator/watch.py watchlist.txt --out events.jsonl --interval 3600
+
+The watchlist has one address per line in the same format the tools use (e.g. '1601 W CHICAGO AVE');
+blank lines and lines starting with # are skipped. The first poll of a dataset only records where the
+data stands, unless --since asks for everything changed after a date.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+from urllib.parse import quote
+
+from dotenv import load_dotenv
+
+from tools import metrics
+from tools.socrata import SOCRATA_BASE_URL, SocrataError, chunk_values, fetch_pages, iter_pages, soql_in, soql_quote
+from tools.tools_permits import permit_address, permit_address_clause
+
+load_dotenv()
+OPEN_DATA_APP_TOKEN = os.getenv("OPEN_DATA_APP_TOKEN")
+
+# What to watch in each dataset: how to match addresses, which rows count as events, and what to report
+WATCHES = {
+    "violations": {
+        "dataset_id": "22u3-xenr",
+        "address_clause": lambda addresses: soql_in("address", addresses),
+        "address": lambda row: " ".join((row.get("address") or "").split()),
+        "filter": "inspection_status='FAILED'",
+        "id_field": "id",
+        "date_field": "violation_date",
+        "summary": lambda row: row.get("violation_description"),
+    },
+    "permits": {
+        "dataset_id": "ydr8-5enu",
+        "address_clause": permit_address_clause,
+        "address": permit_address,
+        "filter": None,
+        "id_field": "permit_",
+        "date_field": "issue_date",
+        "summary": lambda row: " - ".join(filter(None, [row.get("permit_type"), row.get("work_description")])),
+    },
+    "food_inspections": {
+        "dataset_id": "4ijn-s7e5",
+        "address_clause": lambda addresses: soql_in("address", addresses),
+        "address": lambda row: " ".join((row.get("address") or "").split()),
+        "filter": "results='Fail'",
+        "id_field": "inspection_id",
+        "date_field": "inspection_date",
+        "summary": lambda row: row.get("dba_name"),
+    },
+}
+
+
+def read_watchlist(path: str) -> list:
+    """Addresses from the watchlist file, normalized to the all-caps, single-spaced form the datasets use."""
+    addresses = []
+    for line in Path(path).read_text().splitlines():
+        line = " ".join(line.split()).upper()
+        if line and not line.startswith("#"):
+            addresses.append(line)
+    return sorted(set(addresses))
+
+
+def _query_url(dataset_id: str, where: str, select: str = ":*, *") -> str:
+    return (
+        f"{SOCRATA_BASE_URL}/{dataset_id}.json?$select={quote(select, safe=':*,()')}"
+        f"&$where={quote(where, safe=chr(39) + '(),=:')}&$order=:id&$$app_token={OPEN_DATA_APP_TOKEN}"
+    )
+
+
+def current_high_water_mark(dataset_id: str):
+    """The newest `:updated_at` in a dataset, used as the starting point for a first poll."""
+    url = f"{SOCRATA_BASE_URL}/{dataset_id}.json?$select={quote('max(:updated_at) as high_water_mark', safe=':()')}&$$app_token={OPEN_DATA_APP_TOKEN}"
+    status_code, rows = fetch_pages(url)
+    if status_code != 200 or not rows:
+        raise RuntimeError(f"Could not read the latest update time of {dataset_id}: {status_code}")
+    return rows[0]["high_water_mark"].rstrip("Z")
+
+
+def poll(addresses: list, state: dict, since: str = None) -> list:
+    """Run one poll of every watched dataset, returning the new events and moving the high-water marks forward."""
+    marks = state.setdefault("high_water_marks", {})
+    watched = set(addresses)
+    events = []
+    for name, watch in WATCHES.items():
+        dataset_id = watch["dataset_id"]
+        if dataset_id not in marks:
+            if not since:
+                marks[dataset_id] = current_high_water_mark(dataset_id)
+                print(f"{name}: first poll, watching for changes after {marks[dataset_id]}", file=sys.stderr)
+                continue
+            marks[dataset_id] = f"{since}T00:00:00"
+
+        high_water_mark = marks[dataset_id]
+        newest = high_water_mark
+        dataset_events = []
+        for batch in chunk_values(addresses):
+            where = " AND ".join(filter(None, [
+                watch["address_clause"](batch),
+                watch["filter"],
+                f":updated_at > {soql_quote(high_water_mark)}",
+            ]))
+            try:
+                # Rows are matched as they are read, so a large backlog of changes isn't held in memory
+                for row in iter_pages(_query_url(dataset_id, where)):
+                    address = watch["address"](row)
+                    if address not in watched:
+                        continue
+                    updated_at = (row.get(":updated_at") or "").rstrip("Z")
+                    newest = max(newest, updated_at)
+                    created_at = (row.get(":created_at") or "").rstrip("Z")
+                    dataset_events.append({
+                        "dataset": name,
+                        "event": "new" if created_at > high_water_mark else "updated",
+                        "address": address,
+                        "id": row.get(watch["id_field"]),
+                        "date": row.get(watch["date_field"]),
+                        "summary": watch["summary"](row),
+                        "updated_at": updated_at,
+                        "record": {k: v for k, v in row.items() if not k.startswith(":")},
+                    })
+            except SocrataError as e:
+                # Drop this dataset's events and keep the old mark, so the next poll reports them once
+                print(f"{name}: error retrieving data: {e.status_code}", file=sys.stderr)
+                newest, dataset_events = high_water_mark, []
+                break
+        events.extend(dataset_events)
+        marks[dataset_id] = newest
+    return events
+
+
+def run(watchlist: str, out: str, state_path: str, since: str = None):
+    addresses = read_watchlist(watchlist)
+    state_file = Path(state_path)
+    state = json.loads(state_file.read_text()) if state_file.exists() else {}
+
+    metrics.reset()
+    events = poll(addresses, state, since)
+    requests_made = sum(1 for s in metrics.get_spans() if s["kind"] == "http")
+
+    lines = "".join(json.dumps(e, default=str) + "\n" for e in events)
+    if out == "-":
+        sys.stdout.write(lines)
+    else:
+        with open(out, "a") as f:
+            f.write(lines)
+    state["last_poll"] = datetime.now().isoformat(timespec="seconds")
+    state_file.write_text(json.dumps(state, indent=2))
+    print(f"Polled {len(addresses)} addresses with {requests_made} requests: {len(events)} new event(s)", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Watch a list of addresses for new violations, permits and failed food inspections")
+    parser.add_argument("watchlist", type=str, help="File with one address per line, e.g. '1601 W CHICAGO AVE'")
+    parser.add_argument("--out", type=str, default="-", help="JSONL file to append new events to (default: stdout)")
+    parser.add_argument("--state", type=str, required=False, help="Where to keep the high-water marks between polls (default: <watchlist>.state.json)")
+    parser.add_argument("--since", type=str, required=False, help="On the first poll, report everything changed after this date (YYYY-MM-DD) instead of starting from now")
+    parser.add_argument("--interval", type=int, required=False, help="Keep polling every this many seconds instead of polling once")
+    args = parser.parse_args()
+
+    state_path = args.state or f"{args.watchlist}.state.json"
+    while True:
+        run(args.watchlist, args.out, state_path, args.since)
+        if not args.interval:
+            break
+        time.sleep(args.interval)
@@ -115,7 +115,7 @@ def agent():
 
 
 @pytest.mark.parametrize("run", range(num_runs))
-@patch("chicago_location_investigator.tools.tools_violations.requests.get")
+@patch("chicago_location_investigator.tools.socrata.requests.get")
 def test_agent_formats_address_correctly(mock_get, agent, run):
     mock_response = MagicMock()
     mock_response.status_code = 200
@@ -141,7 +141,7 @@ def test_agent_formats_address_correctly(mock_get, agent, run):
 
 
 @pytest.mark.parametrize("run", range(num_runs))
-@patch("chicago_location_investigator.tools.tools_violations.requests.get")
+@patch("chicago_location_investigator.tools.socrata.requests.get")
 def test_agent_formats_address_correctly2(mock_get, agent, run):
     """If the address has no direction or no street type, it should still work"""
     mock_response = MagicMock()
@@ -165,7 +165,7 @@ def test_agent_formats_address_correctly2(mock_get, agent, run):
 
 
 @pytest.mark.parametrize("run", range(num_runs))
-@patch("chicago_location_investigator.tools.tools_violations.requests.get")
+@patch("chicago_location_investigator.tools.socrata.requests.get")
 def test_agent_formats_address_correctly3(mock_get, agent, run):
 
     mock_response = MagicMock()
@@ -202,7 +202,7 @@ def mock_multi_tool_response(url, *args, **kwargs):
 
 
 @pytest.mark.parametrize("run", range(num_runs))
-@patch("chicago_location_investigator.tools.tools_violations.requests.get")
+@patch("chicago_location_investigator.tools.socrata.requests.get")
 def test_agent_calls_multiple_tools_in_order(mock_get, agent, run):
     mock_response = MagicMock()
     mock_response.status_code = 200
@@ -230,7 +230,7 @@ def test_agent_calls_multiple_tools_in_order(mock_get, agent, run):
 
 
 @pytest.mark.parametrize("run", range(num_runs))
-@patch("chicago_location_investigator.tools.tools_violations.requests.get")
+@patch("chicago_location_investigator.tools.socrata.requests.get")
 def test_agent_handles_date_filtering(mock_get, agent, run):
     mock_response = MagicMock()
     mock_response.status_code = 200
@@ -270,7 +270,7 @@ def mock_violation_details_response(url, *args, **kwargs):
 
 
 @pytest.mark.parametrize("run", range(num_runs))
-@patch("chicago_location_investigator.tools.tools_violations.requests.get")
+@patch("chicago_location_investigator.tools.socrata.requests.get")
 def test_agent_handles_extra_detail_filtering(mock_get, agent, run):
     mock_response = MagicMock()
     mock_response.status_code = 200
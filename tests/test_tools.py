@@ -46,7 +46,7 @@ MOCK_DETAILS_RESPONSE2 = [
 # Tests for Building Code Violations tools
 #================================================
 
-@patch("chicago_location_investigator.tools.tools_violations.requests.get")
+@patch("chicago_location_investigator.tools.socrata.requests.get")
 def test_get_violations_basic(mock_get):
     mock_response = MagicMock()
     mock_response.status_code = 200
@@ -61,7 +61,7 @@ def test_get_violations_basic(mock_get):
     assert "12345" in result
 
 
-@patch("chicago_location_investigator.tools.tools_violations.requests.get")
+@patch("chicago_location_investigator.tools.socrata.requests.get")
 def test_get_violation_details(mock_get):
     mock_response = MagicMock()
     mock_response.status_code = 200
@@ -76,6 +76,87 @@ def test_get_violation_details(mock_get):
     assert "Missing door frame" in result
 
 
+@patch("chicago_location_investigator.tools.socrata.requests.get")
+def test_get_violations_coords_grouped_by_address(mock_get):
+    mock_response = MagicMock()
+    mock_response.status_code = 200
+    mock_response.json.return_value = MOCK_DETAILS_RESPONSE + MOCK_DETAILS_RESPONSE2
+    mock_get.return_value = mock_response
+
+    from chicago_location_investigator.tools.tools_violations import search_coordinates_violations
+
+    box = {"north": 41.9, "south": 41.8, "east": -87.7, "west": -87.6}
+    result = search_coordinates_violations(coordinate_boundaries=box)
+
+    # Both violations share an address, so it is printed once with the count, date span and ids
+    assert result.count("123 N MAIN ST") == 1
+    assert "Violations: 2" in result
+    assert "2023-01-01" in result and "2023-02-01" in result
+    assert "12345 12365" in result
+
+    result = search_coordinates_violations(coordinate_boundaries=box, group_by_address=False)
+    assert result.count("123 N MAIN ST") == 2
+
+
+@patch("chicago_location_investigator.tools.socrata.requests.get")
+def test_grouped_area_summaries_count_every_page(mock_get, monkeypatch):
+    from chicago_location_investigator.tools import socrata
+    from chicago_location_investigator.tools.tools_violations import search_coordinates_violations
+    from chicago_location_investigator.tools.tools_crash import search_coordinates_crash
+
+    # Totals, per-group counts and date spans come from every row, not just the first page
+    monkeypatch.setattr(socrata, "PAGE_ROWS", 2)
+    older = dict(MOCK_DETAILS_RESPONSE[0], id="12300", violation_date="2022-06-01")
+    pages = [MOCK_DETAILS_RESPONSE2 + MOCK_DETAILS_RESPONSE, [older]]
+    mock_get.side_effect = [MagicMock(status_code=200, **{"json.return_value": page}) for page in pages]
+    box = {"north": 41.9, "south": 41.8, "east": -87.7, "west": -87.6}
+
+    result = search_coordinates_violations(coordinate_boundaries=box)
+    assert "Found 3 violation(s) at 1 address(es)" in result
+    assert "Violations: 3" in result and "2022-06-01" in result
+
+    pages = [MOCK_CRASH_RESPONSE * 2, MOCK_CRASH_RESPONSE]
+    mock_get.side_effect = [MagicMock(status_code=200, **{"json.return_value": page}) for page in pages]
+    result = search_coordinates_crash(coordinate_boundaries=box)
+    assert "Found 3 crashes on 1 block(s)" in result
+
+
+@patch("chicago_location_investigator.tools.socrata.requests.get")
+def test_get_violations_for_several_addresses(mock_get):
+    mock_response = MagicMock()
+    mock_response.status_code = 200
+    mock_response.json.return_value = MOCK_DETAILS_RESPONSE + MOCK_DETAILS_RESPONSE2
+    mock_get.return_value = mock_response
+
+    from chicago_location_investigator.tools.tools_violations import search_addresses_violations
+
+    result = search_addresses_violations(["123 N MAIN ST", "456 S STATE ST"])
+
+    # One request for both addresses, and results grouped under each address
+    assert mock_get.call_count == 1
+    assert "address in ('123 N MAIN ST', '456 S STATE ST')" in mock_get.call_args.args[0]
+    assert "123 N MAIN ST: 2 violation(s)" in result
+    assert "No violations at: 456 S STATE ST" in result
+    assert "12345" in result and "12365" in result
+
+
+@patch("chicago_location_investigator.tools.socrata.requests.get")
+def test_address_batches_are_read_to_the_last_page(mock_get, monkeypatch):
+    from chicago_location_investigator.tools import socrata
+    from chicago_location_investigator.tools.tools_violations import search_addresses_violations
+
+    # The second address's rows come after the first page; they mustn't be reported as missing
+    monkeypatch.setattr(socrata, "PAGE_ROWS", 2)
+    other = dict(MOCK_DETAILS_RESPONSE[0], id="12399", address="456 S STATE ST")
+    pages = [MOCK_DETAILS_RESPONSE + MOCK_DETAILS_RESPONSE2, [other]]
+    mock_get.side_effect = [MagicMock(status_code=200, **{"json.return_value": page}) for page in pages]
+
+    result = search_addresses_violations(["123 N MAIN ST", "456 S STATE ST"])
+
+    assert mock_get.call_count == 2
+    assert "456 S STATE ST: 1 violation(s)" in result and "No violations at" not in result
+
+
 #================================================
 # Tests for Food Inspection tools
 #================================================
@@ -106,7 +187,7 @@ MOCK_FOOD_RESPONSE = [
 ]
 
 
-@patch("chicago_location_investigator.tools.tools_food.requests.get")
+@patch("chicago_location_investigator.tools.socrata.requests.get")
 def test_get_food_details_address(mock_get):
     mock_response = MagicMock()
     mock_response.status_code = 200
@@ -133,7 +214,7 @@ def test_get_food_details_address_missing():
     )
 
 
-@patch("chicago_location_investigator.tools.tools_food.requests.get")
+@patch("chicago_location_investigator.tools.socrata.requests.get")
 def test_get_food_details_coords(mock_get):
     mock_response = MagicMock()
     mock_response.status_code = 200
@@ -155,6 +236,119 @@ def test_get_food_details_coords(mock_get):
     assert "INSECTS" in result
 
 
+@patch("chicago_location_investigator.tools.socrata.requests.get")
+def test_search_food_establishments_latest_status(mock_get):
+    mock_response = MagicMock()
+    mock_response.status_code = 200
+    mock_response.json.return_value = [
+        {"license_": "1", "dba_name": "PUFFY CAKES", "address": "1651 W CHICAGO AVE ", "inspection_date": "2025-10-02T00:00:00.000", "results": "Fail"},
+        {"license_": "1", "dba_name": "PUFFY CAKES", "address": "1651 W CHICAGO AVE", "inspection_date": "2025-12-04T00:00:00.000", "results": "Pass w/ Conditions"},
+        {"license_": "2", "dba_name": "TACO PLACE", "address": "1700 W CHICAGO AVE", "inspection_date": "2025-11-10T00:00:00.000", "results": "Pass"},
+        {"license_": "2", "dba_name": "TACO PLACE", "address": "1700 W CHICAGO AVE", "inspection_date": "2025-08-01T00:00:00.000", "results": "Fail"},
+        {"license_": "0", "dba_name": "POP-UP", "address": "1710 W CHICAGO AVE", "inspection_date": "2025-10-20T00:00:00.000", "results": "Pass"},
+    ]
+    mock_get.return_value = mock_response
+
+    from chicago_location_investigator.tools.tools_food import search_food_establishments
+
+    box = {"north": 41.9, "south": 41.8, "east": -87.6, "west": -87.7}
+    result = search_food_establishments(coordinate_boundaries=box, start_date="2025-06-01", no_failures_since="2025-10-01")
+
+    assert "$select=license_, dba_name" in mock_get.call_args.args[0]
+    assert "2 of 3 establishment(s) inspected since 2025-06-01 had no failed inspection since 2025-10-01" in result
+    assert "PUFFY CAKES" not in result
+    taco, pop_up = result.split("- Business name: ")[1:]
+    assert "TACO PLACE" in taco and "Passed: 1" in taco and "Failed: 1" in taco and "Last failure: 2025-08-01" in taco
+    assert "POP-UP" in pop_up and "Last failure: Unknown" in pop_up
+
+    result = search_food_establishments(coordinate_boundaries=box, start_date="2025-06-01", latest_result="Pass")
+    assert "3 of 3 establishment(s)" in result
+    assert "Latest result: Pass w/ Conditions" in result and "Latest inspection: 2025-12-04" in result
+
+
+def test_name_index_ranks_fuzzy_matches():
+    from chicago_location_investigator.tools.name_index import NameIndex
+
+    index = NameIndex.from_rows([
+        {"dba_name": "DANTE'S PIZZERIA & GRILL", "license_": "11"},
+        {"dba_name": "DANTES PIZZERIA AND GRILL", "license_": "12"},
+        {"dba_name": "DANTE'S PIZZERIA & GRILL", "license_": "11"},
+        {"dba_name": "PIZZA PALACE", "license_": "13"},
+        {"dba_name": "PUFFY CAKES", "license_": "0"},
+    ])
+
+    best, = index.resolve("dantes pizzeria and grill")
+    assert best == {
+        "name": "DANTE'S PIZZERIA & GRILL", "score": 1.0, "licenses": ["11", "12"],
+        "spellings": ["DANTE'S PIZZERIA & GRILL", "DANTES PIZZERIA AND GRILL"],
+    }
+    assert index.search("PUFY CAKES")[0]["name"] == "PUFFY CAKES"
+    assert index.search("PUFFY CAKES")[0]["licenses"] == []
+    assert index.search("NOODLE HOUSE") == []
+
+
+def test_name_index_resolves_every_spelling_of_a_business():
+    from chicago_location_investigator.tools.name_index import NameIndex
+
+    index = NameIndex.from_rows(
+        [{"dba_name": "MC DONALD'S", "license_": "21"}, {"dba_name": "MCDONALDS #4521", "license_": "22"}]
+        + [{"dba_name": f"SUBWAY #{n}", "license_": str(100 + n)} for n in range(8)]
+        + [{"dba_name": "SUBWAY SANDWICHES", "license_": "200"}, {"dba_name": "DANTE'S PIZZERIA", "license_": "31"}]
+    )
+
+    assert {m["name"] for m in index.resolve("MCDONALDS")} == {"MC DONALD'S", "MCDONALDS #4521"}
+    assert len(index.resolve("SUBWAY")) == 9
+    assert [m["name"] for m in index.resolve("DANTES")] == ["DANTE'S PIZZERIA"]
+
+
+@patch("chicago_location_investigator.tools.socrata.requests.get")
+def test_name_index_is_rebuilt_once_expired(mock_get, tmp_path, monkeypatch):
+    from chicago_location_investigator.tools import name_index as index_module
+
+    mock_response = MagicMock()
+    mock_response.status_code = 200
+    mock_response.json.return_value = [{"dba_name": "PUFFY CAKES", "license_": "2952342"}]
+    mock_get.return_value = mock_response
+    monkeypatch.setattr(index_module, "_index", None)
+    monkeypatch.setattr(index_module, "_NAME_INDEX_DIR", tmp_path)
+
+    index = index_module.name_index()
+    assert index_module.name_index() is index
+    assert mock_get.call_count == 1
+
+    # A long-lived process doesn't keep serving an index older than the TTL
+    index.fetched_at -= index_module.NAME_INDEX_TTL_S + 1
+    assert index_module.name_index(ttl_s=index_module.NAME_INDEX_TTL_S) is not index
+
+
+@patch("chicago_location_investigator.tools.tools_food.name_index")
+@patch("chicago_location_investigator.tools.socrata.requests.get")
+def test_food_name_search_resolves_licenses(mock_get, mock_name_index):
+    from chicago_location_investigator.tools.name_index import NameIndex
+    from chicago_location_investigator.tools.tools_food import search_address_food_inspections
+
+    mock_name_index.return_value = NameIndex.from_rows([{"dba_name": "PUFFY CAKES", "license_": "2952342"}])
+    mock_response = MagicMock()
+    mock_response.status_code = 200
+    mock_response.json.return_value = MOCK_FOOD_RESPONSE
+    mock_get.return_value = mock_response
+
+    result = search_address_food_inspections(name="PUFFY CAKE")
+    assert "license_ in ('2952342')" in mock_get.call_args.args[0]
+    assert "dba_name like" not in mock_get.call_args.args[0]
+    assert "PUFFY CAKES" in result
+
+    search_address_food_inspections(name="NOODLE HOUSE")
+    assert "dba_name like '%NOODLE HOUSE%'" in mock_get.call_args.args[0]
+
+    # Without usable license numbers, every spelling of the name is matched
+    mock_name_index.return_value = NameIndex.from_rows([
+        {"dba_name": "PUFFY CAKES & CO", "license_": "0"}, {"dba_name": "PUFFY CAKES AND CO", "license_": "0"},
+    ])
+    search_address_food_inspections(name="PUFFY CAKES")
+    assert "dba_name in ('PUFFY CAKES %26 CO', 'PUFFY CAKES AND CO')" in mock_get.call_args.args[0]
+
+
 #================================================
 # Tests for Geocoding tools
 #================================================
@@ -263,7 +457,7 @@ MOCK_PERMIT_RESPONSE = [
 ]
 
 
-@patch("chicago_location_investigator.tools.tools_permits.requests.get")
+@patch("chicago_location_investigator.tools.socrata.requests.get")
 def test_get_permit_details_address(mock_get):
     mock_response = MagicMock()
     mock_response.status_code = 200
@@ -277,7 +471,57 @@ def test_get_permit_details_address(mock_get):
     assert "GARAGE W/ ROOF DECK" in result
     assert "PERMIT" in result
 
-@patch("chicago_location_investigator.tools.tools_permits.requests.get")
+@patch("chicago_location_investigator.tools.tools_permits.write_results_file")
+@patch("chicago_location_investigator.tools.socrata.requests.get")
+def test_permit_filters_pushed_into_query(mock_get, mock_write):
+    mock_response = MagicMock()
+    mock_response.status_code = 200
+    mock_response.json.return_value = MOCK_PERMIT_RESPONSE
+    mock_get.return_value = mock_response
+
+    from chicago_location_investigator.tools.tools_permits import search_address_active_building_permits
+    from chicago_location_investigator.tools.render import MAX_RENDERED_ROWS
+
+    search_address_active_building_permits("830", "N", "MARSHFIELD AVE", start_date="2024-01-01", end_date="2024-12-31")
+
+    # Status, issue date, ordering and row cap are all left to the portal
+    url = mock_get.call_args.args[0]
+    assert "permit_status='ACTIVE'" in url
+    assert "issue_date between '2024-01-01T00:00:00' and '2024-12-31T23:59:59'" in url
+    assert f"$order=issue_date DESC&$limit={MAX_RENDERED_ROWS}" in url
+
+    # Rows written to a file aren't capped at what fits in the prompt, they are paged
+    search_address_active_building_permits("830", "N", "MARSHFIELD AVE", write_results=True)
+    assert f"$limit={MAX_RENDERED_ROWS}&" not in mock_get.call_args.args[0]
+    assert mock_get.call_args.args[0].endswith("&$limit=50000&$offset=0")
+
+@patch("chicago_location_investigator.tools.socrata.requests.get")
+def test_get_permits_for_several_addresses(mock_get):
+    mock_response = MagicMock()
+    mock_response.status_code = 200
+    # The number/street filter can also match another pairing of the same columns, which is dropped
+    mock_response.json.return_value = MOCK_PERMIT_RESPONSE + [dict(MOCK_PERMIT_RESPONSE[0], street_number="1601", street_name="MARSHFIELD AVE", permit_="999")]
+    mock_get.return_value = mock_response
+
+    from chicago_location_investigator.tools.tools_permits import search_addresses_active_building_permits, split_address
+
+    assert split_address("830 N MARSHFIELD AVE") == ("830", "N", "MARSHFIELD AVE")
+    assert split_address("830 MARSHFIELD AVE") == ("830", None, "MARSHFIELD AVE")
+
+    result = search_addresses_active_building_permits(["830 N MARSHFIELD AVE", "1601 W CHICAGO AVE"])
+
+    assert mock_get.call_count == 1
+    assert "street_number in ('1601', '830') AND street_name in ('CHICAGO AVE', 'MARSHFIELD AVE')" in mock_get.call_args.args[0]
+    assert "830 N MARSHFIELD AVE: 1 active permit(s)" in result
+    assert "No active permits at: 1601 W CHICAGO AVE" in result
+    assert "999" not in result
+
+    # An address without a direction still gets its permits, whichever direction they were filed under
+    result = search_addresses_active_building_permits(["830 MARSHFIELD AVE"])
+    assert "830 MARSHFIELD AVE: 1 active permit(s)" in result
+    assert "999" not in result
+
+@patch("chicago_location_investigator.tools.socrata.requests.get")
 def test_get_food_details_coords(mock_get):
     mock_response = MagicMock()
     mock_response.status_code = 200
@@ -316,7 +560,7 @@ MOCK_CRASH_RESPONSE = [
 ]
 
 
-@patch("chicago_location_investigator.tools.tools_crash.requests.get")
+@patch("chicago_location_investigator.tools.socrata.requests.get")
 def test_get_crash_address(mock_get):
     mock_response = MagicMock()
     mock_response.status_code = 200
@@ -331,7 +575,7 @@ def test_get_crash_address(mock_get):
     assert "CLEAR" in result
 
 
-@patch("chicago_location_investigator.tools.tools_crash.requests.get")
+@patch("chicago_location_investigator.tools.socrata.requests.get")
 def test_get_crash_coords(mock_get):
     mock_response = MagicMock()
     mock_response.status_code = 200
@@ -348,6 +592,32 @@ def test_get_crash_coords(mock_get):
     assert "CHICAGO AVE" in result
 
 
+@patch("chicago_location_investigator.tools.socrata.requests.get")
+def test_get_crash_coords_compact(mock_get):
+    mock_response = MagicMock()
+    mock_response.status_code = 200
+    mock_response.json.return_value = MOCK_CRASH_RESPONSE
+    mock_get.return_value = mock_response
+
+    from chicago_location_investigator.tools import render
+    from chicago_location_investigator.tools.tools_crash import search_coordinates_crash
+
+    render.set_output_formats("search_coordinates_crash=compact")
+    try:
+        result = search_coordinates_crash(
+            coordinate_boundaries={"north": 41.9, "south": 41.8, "east": -87.7, "west": -87.6}
+        )
+    finally:
+        render.set_output_formats("search_coordinates_crash=verbose")
+
+    # Column names appear once, each crash is one delimited line, and columns with no data are dropped
+    assert result.count("Weather") == 1
+    assert "INJURY AND / OR TOW" in result
+    assert "CHICAGO AVE" in result
+    assert "Unknown" not in result
+    assert "Latitude" not in result
+
+
 def test_search_address_crash_missing_args():
     from chicago_location_investigator.tools.tools_crash import search_address_crash
 
@@ -357,11 +627,127 @@ def test_search_address_crash_missing_args():
     assert "Either coordinates or address is necessary" in str(excinfo.value)
 
 
+@patch("chicago_location_investigator.tools.socrata.requests.get")
+def test_search_crash_hotspots_ranks_grid_cells(mock_get):
+    mock_response = MagicMock()
+    mock_response.status_code = 200
+    # Already grouped by the portal: one row per hundred block, at the mean position of its crashes
+    mock_response.json.return_value = [
+        {"latitude": "41.89600", "longitude": "-87.66900", "block_no": "1600", "street_direction": "W", "street_name": "CHICAGO AVE",
+         "hit_and_runs": "3", "crashes": "8", "injuries": "5", "fatalities": "1"},
+        {"latitude": "41.89610", "longitude": "-87.66920", "block_no": "1700", "street_direction": "W", "street_name": "CHICAGO AVE",
+         "hit_and_runs": "0", "crashes": "1", "injuries": "0", "fatalities": "0"},
+        {"latitude": "41.85000", "longitude": "-87.62000", "block_no": "200", "street_direction": "S", "street_name": "STATE ST",
+         "hit_and_runs": "0", "crashes": "2", "injuries": "0", "fatalities": "0"},
+        {"latitude": None, "longitude": None, "crashes": "8"},
+    ]
+    mock_get.return_value = mock_response
+
+    from chicago_location_investigator.tools.tools_crash import search_crash_hotspots
+
+    result = search_crash_hotspots(
+        coordinate_boundaries={"north": 41.9, "south": 41.8, "east": -87.6, "west": -87.7}, start_date="2025-01-01", end_date="2025-06-30"
+    )
+
+    url = mock_get.call_args.args[0]
+    assert "$group=street_no - street_no %25 100, street_direction, street_name&" in url and "count(*) as crashes" in url
+    assert "crash_date between '2025-01-01T00:00:00' and '2025-06-30T23:59:59'" in url
+    assert "Found 19 crashes" in result
+    first, second = result.split("- Rank: ")[1:]
+    assert "Busiest block: 1600 W CHICAGO AVE" in first and "Crashes: 9" in first
+    assert "Total injuries: 5" in first and "Fatalities: 1" in first and "Hit-and-run share: 33%" in first
+    assert "200 S STATE ST" in second and "Crashes: 2" in second
+
+
+@patch("chicago_location_investigator.tools.socrata.requests.get")
+def test_search_crash_statistics_counts_every_crash(mock_get):
+    mock_response = MagicMock()
+    mock_response.status_code = 200
+    mock_response.json.return_value = [
+        {"crash_date": "2025-03-03T17:15:00.000", "weather_condition": "CLEAR", "lighting_condition": "DAYLIGHT", "crash_type": "INJURY AND / OR TOW DUE TO CRASH",
+         "most_severe_injury": "NONINCAPACITATING INJURY", "dooring_i": "Y", "injuries_total": "2", "injuries_fatal": "0"},
+        {"crash_date": "2025-03-04T17:40:00.000", "weather_condition": "RAIN", "lighting_condition": "DARKNESS, LIGHTED ROAD", "crash_type": "NO INJURY / DRIVE AWAY",
+         "most_severe_injury": "NO INDICATION OF INJURY", "hit_and_run_i": "Y", "injuries_total": "0", "injuries_fatal": "0"},
+        {"crash_date": "2025-03-09T02:05:00.000", "weather_condition": "CLEAR", "crash_type": "NO INJURY / DRIVE AWAY",
+         "most_severe_injury": "NO INDICATION OF INJURY", "hit_and_run_i": "Y", "injuries_total": "0", "injuries_fatal": "0"},
+    ]
+    mock_get.return_value = mock_response
+
+    from chicago_location_investigator.tools.tools_crash import search_crash_statistics
+
+    result = search_crash_statistics(coordinate_boundaries={"north": 41.9, "south": 41.8, "east": -87.6, "west": -87.7})
+
+    assert "$select=crash_date, weather_condition" in mock_get.call_args.args[0]
+    assert "Crashes: 3, from 2025-03-03 to 2025-03-09" in result
+    assert "Injuries: 2 in 1 (33%) crashes; fatalities: 0" in result
+    assert "By hour of day: 2h 1, 17h 2" in result
+    assert "By weekday: Mon 1, Tue 1, Sun 1" in result
+    assert "Weather: CLEAR 2 (67%), RAIN 1 (33%)" in result
+    assert "Lighting: DAYLIGHT 1 (33%), DARKNESS, LIGHTED ROAD 1 (33%), UNKNOWN 1 (33%)" in result
+    assert "Dooring of a cyclist: 1 (33%)" in result
+    assert "Hit-and-run: 2 (67%)" in result
+
+    # Without a readable crash date the time breakdowns are left out rather than failing
+    mock_response.json.return_value = [dict(row, crash_date=None) for row in mock_response.json.return_value]
+    result = search_crash_statistics(coordinate_boundaries={"north": 41.9, "south": 41.8, "east": -87.6, "west": -87.7})
+    assert "Crashes: 3\n" in result and "By hour of day" not in result and "Weather: CLEAR 2 (67%)" in result
+
+
+#================================================
+# Tests for Mural tools
+#================================================
+MOCK_MURALS = [
+    {"mural_registration_id": "1", "artwork_title": "OLD WALL", "year_installed": "1998", "latitude": "41.8960", "longitude": "-87.6690"},
+    {"mural_registration_id": "2", "artwork_title": "NEAR WALL", "year_installed": "2021", "latitude": "41.8955", "longitude": "-87.6695"},
+    {"mural_registration_id": "3", "artwork_title": "FAR WALL", "year_installed": "2022", "latitude": "41.9500", "longitude": "-87.7500"},
+    {"mural_registration_id": "4", "artwork_title": "NO PLACE", "year_installed": "2023"},
+]
+
+
+@patch("chicago_location_investigator.tools.socrata.requests.get")
+def test_mural_catalog_loads_once_and_answers_locally(mock_get, tmp_path, monkeypatch):
+    from chicago_location_investigator.tools import metrics, mural_catalog as catalog_module
+    from chicago_location_investigator.tools.tools_art import search_coordinates_murals
+
+    mock_response = MagicMock()
+    mock_response.status_code = 200
+    mock_response.json.return_value = MOCK_MURALS
+    mock_get.return_value = mock_response
+    monkeypatch.setattr(catalog_module, "_catalog", None)
+    monkeypatch.setattr(catalog_module, "_MURAL_CATALOG_DIR", tmp_path)
+
+    box = {"north": 41.9, "south": 41.89, "east": -87.66, "west": -87.67}
+    result = search_coordinates_murals(coordinate_boundaries=box)
+    assert mock_get.call_count == 1
+    assert "violation_date" not in mock_get.call_args.args[0]
+    assert "Found 2 mural(s)" in result
+    assert result.index("NEAR WALL") < result.index("OLD WALL")
+
+    # Date filters match the year installed, and radius searches come back nearest first, all without another request
+    result = search_coordinates_murals(coordinate_boundaries=box, start_date="2020-01-01")
+    assert "NEAR WALL" in result and "OLD WALL" not in result
+    result = search_coordinates_murals(latitude=41.8955, longitude=-87.6695, radius_miles=0.25)
+    assert "Found 2 mural(s)" in result and result.index("NEAR WALL") < result.index("OLD WALL")
+    result = search_coordinates_murals(start_date="2022-01-01", end_date="2023-12-31")
+    assert "FAR WALL" in result and "NO PLACE" in result and "NEAR WALL" not in result
+    assert mock_get.call_count == 1
+
+    # A new process loads the catalog from disk
+    monkeypatch.setattr(catalog_module, "_catalog", None)
+    assert len(catalog_module.mural_catalog().search(start_year=1990)) == 4
+    assert mock_get.call_count == 1
+
+    # Searches answered from the catalog still note the mural dataset they drew on
+    metrics.reset()
+    metrics.instrument_tool(search_coordinates_murals)(coordinate_boundaries=box)
+    assert metrics.datasets_used() == ["we8h-apcf"]
+
+
 #================================================
 # Tests for the write_results CSV export path
 #================================================
 @patch("chicago_location_investigator.tools.tools_crash.write_results_file")
-@patch("chicago_location_investigator.tools.tools_crash.requests.get")
+@patch("chicago_location_investigator.tools.socrata.requests.get")
 def test_write_results_true_exports(mock_get, mock_write):
     mock_response = MagicMock()
     mock_response.status_code = 200
@@ -379,7 +765,7 @@ def test_write_results_true_exports(mock_get, mock_write):
 
 
 @patch("chicago_location_investigator.tools.tools_crash.write_results_file")
-@patch("chicago_location_investigator.tools.tools_crash.requests.get")
+@patch("chicago_location_investigator.tools.socrata.requests.get")
 def test_write_results_defaults_off(mock_get, mock_write):
     mock_response = MagicMock()
     mock_response.status_code = 200
@@ -395,10 +781,27 @@ def test_write_results_defaults_off(mock_get, mock_write):
     mock_write.assert_not_called()
 
 
+@patch("chicago_location_investigator.tools.tools_crash.write_results_file")
+@patch("chicago_location_investigator.tools.socrata.requests.get")
+def test_write_results_pages_past_the_portal_default(mock_get, mock_write, monkeypatch):
+    from chicago_location_investigator.tools import socrata
+    from chicago_location_investigator.tools.tools_crash import search_coordinates_crash
+
+    # Without a $limit the portal stops at 1000 rows, so an export reads page after page until a short one
+    monkeypatch.setattr(socrata, "PAGE_ROWS", 2)
+    pages = [MOCK_CRASH_RESPONSE * 2, MOCK_CRASH_RESPONSE * 2, MOCK_CRASH_RESPONSE]
+    mock_get.side_effect = [MagicMock(status_code=200, **{"json.return_value": page}) for page in pages]
+
+    search_coordinates_crash(coordinate_boundaries={"north": 41.9, "south": 41.8, "east": -87.7, "west": -87.6}, write_results=True)
+
+    assert [call.args[0].split("&$limit=")[1] for call in mock_get.call_args_list] == ["2&$offset=0", "2&$offset=2", "2&$offset=4"]
+    mock_write.assert_called_once_with(MOCK_CRASH_RESPONSE * 5, outputname="crashes")
+
+
 #================================================
 # Tests for Ward lookup tool
 #================================================
-@patch("chicago_location_investigator.tools.tools_wards.requests.get")
+@patch("chicago_location_investigator.tools.socrata.requests.get")
 def test_search_ward_for_point(mock_get):
     mock_response = MagicMock()
     mock_response.status_code = 200
@@ -412,7 +815,7 @@ def test_search_ward_for_point(mock_get):
     assert "Ward 27" in result
 
 
-@patch("chicago_location_investigator.tools.tools_wards.requests.get")
+@patch("chicago_location_investigator.tools.socrata.requests.get")
 def test_search_ward_for_point_lon_lat_order(mock_get):
     """The WKT point must be POINT(longitude latitude) - longitude first."""
     mock_response = MagicMock()
@@ -428,7 +831,7 @@ def test_search_ward_for_point_lon_lat_order(mock_get):
     assert "POINT (-87.6743 41.8907)" in called_url
 
 
-@patch("chicago_location_investigator.tools.tools_wards.requests.get")
+@patch("chicago_location_investigator.tools.socrata.requests.get")
 def test_search_ward_for_point_none(mock_get):
     mock_response = MagicMock()
     mock_response.status_code = 200
@@ -442,6 +845,96 @@ def test_search_ward_for_point_none(mock_get):
     assert "No ward found" in result
 
 
+def _square(west, south, east, north):
+    return {"type": "MultiPolygon", "coordinates": [[[[west, south], [east, south], [east, north], [west, north], [west, south]]]]}
+
+
+@patch("chicago_location_investigator.tools.socrata.requests.get")
+def test_mirror_sync_tags_wards_for_ward_queries(mock_get, tmp_path, monkeypatch):
+    from chicago_location_investigator.tools.mirror import Mirror, MIRROR_DATASETS
+    from chicago_location_investigator.tools.tools_wards import search_ward_records
+
+    wards = [
+        {"ward": "27", "the_geom": _square(-87.70, 41.88, -87.65, 41.91)},
+        {"ward": "1", "the_geom": _square(-87.70, 41.91, -87.65, 41.94)},
+    ]
+    violations = [
+        {":id": "row-1", ":updated_at": "2025-06-01T00:00:00.000Z", "id": "1", "violation_date": "2025-05-01T00:00:00.000",
+         "address": "1601 W CHICAGO AVE", "latitude": "41.8960", "longitude": "-87.6690", "inspection_status": "FAILED"},
+        {":id": "row-2", ":updated_at": "2025-06-02T00:00:00.000Z", "id": "2", "violation_date": "2025-05-02T00:00:00.000",
+         "address": "1750 W NORTH AVE", "latitude": "41.9105", "longitude": "-87.6720", "inspection_status": "FAILED"},
+        {":id": "row-3", ":updated_at": "2025-06-03T00:00:00.000Z", "id": "3", "violation_date": "2025-05-03T00:00:00.000",
+         "address": "NOWHERE", "latitude": None, "longitude": None},
+    ]
+    changed = [dict(violations[1], latitude="41.8950", address="1750 W CHICAGO AVE", **{":updated_at": "2025-07-01T00:00:00.000Z"})]
+    pages = {"p293-wvbd": [wards], "22u3-xenr": [violations, changed]}
+
+    def respond(url, **kwargs):
+        response = MagicMock(status_code=200)
+        dataset_id = next(d for d in pages if d in url)
+        response.json.return_value = pages[dataset_id].pop(0) if len(pages[dataset_id]) > 1 else pages[dataset_id][0]
+        return response
+
+    mock_get.side_effect = respond
+    monkeypatch.setenv("SOCRATA_MIRROR", str(tmp_path / "mirror.sqlite"))
+
+    mirror = Mirror()
+    assert mirror.sync(["violations"], since="2025-01-01") == {"violations": 3}
+    assert "violation_date >= '2025-01-01T00:00:00'" in mock_get.call_args.args[0].replace("%20", " ")
+    assert [r["id"] for r in mirror.records("violations", ward="27")] == ["1"]
+    assert [r["id"] for r in mirror.records("violations", ward="1")] == ["2"]
+
+    # The next sync only asks for changed rows, and a row that moved is re-tagged
+    assert mirror.sync(["violations"]) == {"violations": 1}
+    assert ":updated_at > '2025-06-03T00:00:00.000Z'" in mock_get.call_args.args[0].replace("%20", " ")
+    assert [r["id"] for r in mirror.records("violations", ward="27")] == ["2", "1"]
+    assert mirror.records("violations", ward="1") == []
+    mirror.close()
+
+    result = search_ward_records(ward=27, dataset="violations", start_date="2025-05-02")
+    assert "Found 1 violations in Ward 27" in result and "1750 W CHICAGO AVE" in result
+
+    # Like the other violation tools, the ward search only shows failed inspections
+    mirror = Mirror()
+    mirror._upsert("violations", MIRROR_DATASETS["violations"], [dict(violations[0], inspection_status="COMPLIED")], {"ward": mirror.region_index("ward")})
+    assert [r["id"] for r in mirror.records("violations", ward="27")] == ["2", "1"]
+    mirror.close()
+    assert "Found 1 violations in Ward 27" in search_ward_records(ward=27, dataset="violations")
+    assert "haven't been synced" in search_ward_records(ward=27, dataset="crashes")
+
+
+@patch("chicago_location_investigator.tools.socrata.requests.get")
+def test_mirror_adding_a_region_layer_keeps_and_backfills_tags(mock_get, tmp_path):
+    from chicago_location_investigator.tools.mirror import Mirror
+
+    wards = [{"ward": "27", "the_geom": _square(-87.70, 41.88, -87.65, 41.91)}]
+    areas = [{"area_numbe": "24", "the_geom": _square(-87.70, 41.88, -87.60, 41.95)}]
+    violations = [
+        {":id": "row-1", ":updated_at": "2025-06-01T00:00:00.000Z", "id": "1", "violation_date": "2025-05-01T00:00:00.000",
+         "latitude": "41.8960", "longitude": "-87.6690"},
+        {":id": "row-2", ":updated_at": "2025-06-02T00:00:00.000Z", "id": "2", "violation_date": "2025-05-02T00:00:00.000",
+         "latitude": "41.8970", "longitude": "-87.6680"},
+    ]
+    changed = [dict(violations[1], **{":updated_at": "2025-07-01T00:00:00.000Z"})]
+    pages = {"p293-wvbd": [wards], "igwz-8jzy": [areas], "22u3-xenr": [violations, changed]}
+
+    def respond(url, **kwargs):
+        response = MagicMock(status_code=200)
+        dataset_id = next(d for d in pages if d in url)
+        response.json.return_value = pages[dataset_id].pop(0) if len(pages[dataset_id]) > 1 else pages[dataset_id][0]
+        return response
+
+    mock_get.side_effect = respond
+    mirror = Mirror(tmp_path / "mirror.sqlite")
+    mirror.sync(["violations"], layers=("ward",))
+    mirror.sync(["violations"], layers=("community_area",))
+
+    # The re-synced row keeps its ward, and the row that didn't change is tagged with the new layer too
+    assert [r["id"] for r in mirror.records("violations", ward="27")] == ["2", "1"]
+    assert [r["id"] for r in mirror.records("violations", community_area="24")] == ["2", "1"]
+    mirror.close()
+
+
 #================================================
 # Tests for intersection geocoding (ArcGIS)
 #================================================
@@ -472,4 +965,554 @@ def test_geocode_intersection_not_found(mock_arcgis):
 
     result = geocode_intersection("NOWHERE", "NOPLACE")
 
-    assert "Could not geocode" in result
\ No newline at end of file
+    assert "Could not geocode" in result
+
+#================================================
+# Tests for run instrumentation
+#================================================
+@patch("chicago_location_investigator.tools.socrata.requests.get")
+def test_metrics_records_tool_and_http_spans(mock_get):
+    mock_response = MagicMock()
+    mock_response.status_code = 200
+    mock_response.content = b'[{"id": "12345"}, {"id": "12365"}]'
+    mock_response.json.return_value = MOCK_SEARCH_RESPONSE
+    mock_get.return_value = mock_response
+
+    from chicago_location_investigator.tools import metrics
+    from chicago_location_investigator.tools.tools_violations import search_address_violations
+
+    metrics.reset()
+    metrics.instrument_tool(search_address_violations)("123 N MAIN ST")
+
+    tool_span, = [s for s in metrics.get_spans() if s["kind"] == "tool"]
+    http_span, = [s for s in metrics.get_spans() if s["kind"] == "http"]
+    assert tool_span["name"] == "search_address_violations"
+    assert tool_span["rows_rendered"] == 2
+    assert tool_span["truncated"] is False
+    assert http_span["parent_id"] == tool_span["id"]
+    assert http_span["name"] == "22u3-xenr"
+    assert http_span["status"] == 200
+    assert http_span["bytes"] == len(mock_response.content)
+    assert http_span["rows_returned"] == 2
+
+
+def test_metrics_summary_marks_truncation():
+    from chicago_location_investigator.tools import metrics
+    from chicago_location_investigator.tools.render import truncate_summary, MAX_SUMMARY_CHARS
+
+    metrics.reset()
+    with metrics.span("tool", "big_tool"):
+        result = truncate_summary("x" * (MAX_SUMMARY_CHARS + 1), rows_rendered=500)
+
+    assert "truncated" in result
+    summary = metrics.summarize()["tool:big_tool"]
+    assert summary["calls"] == 1
+    assert summary["truncated"] == 1
+    assert "tool:big_tool" in metrics.summary_table()
+
+
+@patch("chicago_location_investigator.tools.socrata.requests.get")
+def test_tool_memo_answers_repeated_calls(mock_get):
+    mock_response = MagicMock()
+    mock_response.status_code = 200
+    mock_response.json.return_value = MOCK_SEARCH_RESPONSE
+    mock_get.return_value = mock_response
+
+    from chicago_location_investigator.tools import metrics
+    from chicago_location_investigator.tools.memo import ToolMemo
+    from chicago_location_investigator.tools.tools_violations import search_address_violations
+
+    metrics.reset()
+    tool = metrics.instrument_tool(ToolMemo().wrap(search_address_violations))
+    first = tool("123 N MAIN ST")
+    summary = metrics.summarize()["tool:search_address_violations"]
+    metrics.reset()
+    # Same call with the defaults spelled out and extra whitespace
+    second = tool(address=" 123 N MAIN ST", start_date=None)
+
+    assert first == second
+    assert mock_get.call_count == 1
+    assert summary["memo_misses"] == 1
+    assert metrics.summarize()["tool:search_address_violations"]["memo_hits"] == 1
+    # A hit makes no request, but the answer it goes into still drew on the violations dataset
+    assert metrics.datasets_used() == ["22u3-xenr"]
+
+    # Errors are not remembered, so the call is retried
+    mock_response.status_code = 500
+    tool("456 N MAIN ST")
+    tool("456 N MAIN ST")
+    assert mock_get.call_count == 3
+
+
+def test_answer_cache_expires_with_freshest_dataset(tmp_path):
+    from chicago_location_investigator.answer_cache import AnswerCache, DATASET_TTL_S
+
+    cache = AnswerCache(tmp_path)
+    assert cache.get("Violations at 1601 W CHICAGO AVE?", "claude") is None
+
+    ttl = cache.put("Violations at 1601 W CHICAGO AVE?", "claude", "Two open violations.", ["p293-wvbd", "22u3-xenr"])
+    assert ttl == DATASET_TTL_S["22u3-xenr"]
+
+    # Case, spacing and trailing punctuation don't matter; the model does
+    hit = cache.get("violations at  1601 w chicago ave", "claude")
+    assert hit["answer"] == "Two open violations."
+    assert hit["cached"] is True
+    assert hit["age_s"] >= 0
+    assert cache.get("Violations at 1601 W CHICAGO AVE?", "llama3.1") is None
+
+
+@patch("chicago_location_investigator.tools.socrata.requests.get")
+def test_delta_cache_fetches_only_changed_rows(mock_get, tmp_path):
+    from urllib.parse import unquote
+    from chicago_location_investigator.tools import socrata
+    from chicago_location_investigator.tools.tools_violations import search_address_violations
+
+    first = MagicMock(status_code=200)
+    first.json.return_value = [
+        {":id": "row-1", ":updated_at": "2025-01-02T00:00:00.000", **MOCK_DETAILS_RESPONSE[0]},
+        {":id": "row-2", ":updated_at": "2025-02-02T00:00:00.000", **MOCK_DETAILS_RESPONSE2[0]},
+    ]
+    delta = MagicMock(status_code=200)
+    delta.json.return_value = [
+        {":id": "row-3", ":updated_at": "2025-03-02T00:00:00.000", **MOCK_DETAILS_RESPONSE[0], "id": "12399", "violation_date": "2025-03-01"},
+    ]
+    mock_get.side_effect = [first, delta]
+
+    socrata.enable_delta_cache(tmp_path)
+    try:
+        search_address_violations("123 N MAIN ST", start_date="2023-01-01")
+        result = search_address_violations("123 N MAIN ST", start_date="2023-01-01")
+    finally:
+        socrata.delta_cache = None
+
+    # The re-query only asks for rows changed since the newest one it already has, and merges them in
+    delta_url = mock_get.call_args_list[1].args[0]
+    assert ":updated_at > '2025-02-02T00:00:00.000'" in unquote(delta_url)
+    assert "12345" in result and "12365" in result and "12399" in result
+    assert ":id" not in result
+    # Merged rows come back in the query's order, newest violation first
+    assert result.index("12399") < result.index("12365") < result.index("12345")
+
+
+@patch("chicago_location_investigator.tools.socrata.requests.get")
+def test_delta_cache_drops_rows_updated_out_of_the_filters(mock_get, tmp_path):
+    from urllib.parse import unquote
+    from chicago_location_investigator.tools import socrata
+    from chicago_location_investigator.tools.tools_violations import search_address_violations
+
+    first = MagicMock(status_code=200)
+    first.json.return_value = [
+        {":id": "row-1", ":updated_at": "2025-01-02T00:00:00.000Z", **MOCK_DETAILS_RESPONSE[0]},
+        {":id": "row-2", ":updated_at": "2025-02-02T00:00:00.000Z", **MOCK_DETAILS_RESPONSE2[0]},
+    ]
+    # row-1 has since been complied with, so it no longer matches inspection_status='FAILED'
+    delta = MagicMock(status_code=200)
+    delta.json.return_value = [{":id": "row-1", ":updated_at": "2025-03-02T00:00:00.000Z", **MOCK_DETAILS_RESPONSE[0], "inspection_status": "COMPLIED"}]
+    second_delta = MagicMock(status_code=200)
+    second_delta.json.return_value = []
+    mock_get.side_effect = [first, delta, second_delta]
+
+    socrata.enable_delta_cache(tmp_path)
+    try:
+        search_address_violations("123 N MAIN ST", start_date="2023-01-01")
+        result = search_address_violations("123 N MAIN ST", start_date="2023-01-01")
+        search_address_violations("123 N MAIN ST", start_date="2023-01-01")
+    finally:
+        socrata.delta_cache = None
+
+    # One delta request per re-query: the status filter is checked locally, not sent
+    assert mock_get.call_count == 3
+    delta_url = unquote(mock_get.call_args_list[1].args[0])
+    assert "address='123 N MAIN ST'" in delta_url and "inspection_status" not in delta_url
+    assert "12365" in result and "12345" not in result
+    # The high-water mark is the newest :updated_at the portal sent, including the dropped row's
+    assert ":updated_at > '2025-03-02T00:00:00.000'" in unquote(mock_get.call_args_list[2].args[0])
+
+
+@patch("chicago_location_investigator.tools.socrata.requests.get")
+def test_area_cache_answers_searches_inside_a_fetched_box(mock_get):
+    from chicago_location_investigator.tools import socrata
+    from chicago_location_investigator.tools.tools_food import search_coordinates_food_inspections
+
+    near = dict(MOCK_FOOD_RESPONSE[0], inspection_id="1", dba_name="NEAR DINER", results="Fail")
+    far = dict(MOCK_FOOD_RESPONSE[0], inspection_id="2", dba_name="FAR CAFE", latitude="41.95", longitude="-87.75")
+    mock_response = MagicMock(status_code=200)
+    mock_response.json.return_value = [near, far]
+    mock_get.return_value = mock_response
+
+    wide = {"north": 42.0, "south": 41.8, "east": -87.6, "west": -87.8}
+    narrow = {"north": 41.9, "south": 41.89, "east": -87.66, "west": -87.68}
+    cache = socrata.enable_area_cache()
+    try:
+        search_coordinates_food_inspections(wide, start_date="2025-01-01", end_date="2025-12-31")
+        inside = search_coordinates_food_inspections(narrow, start_date="2025-06-01", end_date="2025-12-31")
+        failed = search_coordinates_food_inspections(narrow, type="Fail", start_date="2025-06-01", end_date="2025-12-31")
+        # Starts before the cached date range, so it isn't contained
+        search_coordinates_food_inspections(narrow, start_date="2024-01-01", end_date="2025-12-31")
+    finally:
+        socrata.area_cache = None
+
+    assert mock_get.call_count == 2
+    assert "NEAR DINER" in inside and "FAR CAFE" not in inside
+    assert "NEAR DINER" in failed
+    assert cache.stats() == {"hits": 2, "misses": 2, "entries": 2, "hit_rate": 0.5}
+
+
+@patch("chicago_location_investigator.tools.socrata.requests.get")
+def test_interval_cache_fetches_only_missing_dates(mock_get, tmp_path):
+    from urllib.parse import unquote
+    from chicago_location_investigator.tools import socrata
+    from chicago_location_investigator.tools.interval_cache import missing_intervals
+    from chicago_location_investigator.tools.tools_violations import search_address_violations
+
+    assert missing_intervals("2025-01-01T00:00:00", "2025-12-31T23:59:59", [("2025-06-01T00:00:00", "2025-07-31T23:59:59")]) == [
+        ("2025-01-01T00:00:00", "2025-05-31T23:59:59"),
+        ("2025-08-01T00:00:00", "2025-12-31T23:59:59"),
+    ]
+
+    since_june = MagicMock(status_code=200)
+    since_june.json.return_value = [dict(MOCK_DETAILS_RESPONSE[0], id="2", violation_date="2025-07-01T00:00:00.000")]
+    before_june = MagicMock(status_code=200)
+    before_june.json.return_value = [dict(MOCK_DETAILS_RESPONSE[0], id="1", violation_date="2025-02-01T00:00:00.000")]
+    mock_get.side_effect = [since_june, before_june]
+
+    socrata.enable_interval_cache(tmp_path)
+    try:
+        search_address_violations("123 N MAIN ST", start_date="2025-06-01", end_date="2025-12-31")
+        result = search_address_violations("123 N MAIN ST", start_date="2025-01-01", end_date="2025-12-31")
+        # Entirely inside what has been fetched, so no request at all
+        search_address_violations("123 N MAIN ST", start_date="2025-03-01", end_date="2025-09-30")
+    finally:
+        socrata.interval_cache = None
+
+    # The wider range only asks for the months not fetched yet, and is stitched newest first
+    assert mock_get.call_count == 2
+    assert "violation_date between '2025-01-01T00:00:00' and '2025-05-31T23:59:59'" in unquote(mock_get.call_args_list[1].args[0])
+    assert result.index("2025-07-01") < result.index("2025-02-01")
+
+
+def test_interval_cache_only_keeps_gaps_under_the_portal_default_cap(tmp_path):
+    from chicago_location_investigator.tools.interval_cache import IntervalCache
+
+    cache = IntervalCache(tmp_path)
+    url = "https://example.org/x.json?$where=violation_date between '2025-01-01T00:00:00' and '2025-01-31T23:59:59'&$order=violation_date DESC"
+    calls = []
+
+    def get_rows(gap_url):
+        calls.append(gap_url)
+        return 200, [{"violation_date": "2025-01-15T00:00:00.000"}] * (1000 if len(calls) == 1 else 3)
+
+    # 1000 rows without a $limit may be the portal's cap, so that range isn't stored; 3 rows are
+    cache.fetch(url, get_rows)
+    cache.fetch(url, get_rows)
+    cache.fetch(url, get_rows)
+    assert len(calls) == 2
+
+
+@patch("chicago_location_investigator.tools.socrata.requests.get")
+def test_fast_json_decodes_response_bytes(mock_get, monkeypatch):
+    import json
+    from chicago_location_investigator.tools import socrata
+    from chicago_location_investigator.tools.tools_violations import search_address_violations
+
+    mock_response = MagicMock(status_code=200, content=json.dumps(MOCK_SEARCH_RESPONSE).encode())
+    mock_get.return_value = mock_response
+    monkeypatch.setattr(socrata, "fast_json", True)
+
+    result = search_address_violations("123 N MAIN ST")
+
+    assert not mock_response.json.called
+    assert "12345" in result and "12365" in result
+
+
+@patch("chicago_location_investigator.tools.socrata.requests.get")
+def test_stream_pages_parses_rows_split_across_chunks(mock_get, monkeypatch):
+    import json
+    from chicago_location_investigator.tools import metrics, socrata
+
+    rows = [{"violation_id": str(n), "address": "123 N MAIN ST", "violation_description": "CAFÉ SIGN"} for n in range(5)]
+    body = json.dumps(rows).encode()
+    first_page = MagicMock(status_code=200)
+    # 7-byte chunks split rows, and the two-byte É, across reads
+    first_page.iter_content.return_value = [body[i:i + 7] for i in range(0, len(body), 7)]
+    second_page = MagicMock(status_code=200)
+    second_page.iter_content.return_value = [b" [ ", b"]"]
+    mock_get.side_effect = [first_page, second_page]
+    monkeypatch.setattr(socrata, "stream", True)
+
+    metrics.reset()
+    streamed = list(socrata.iter_pages("https://data.cityofchicago.org/resource/22u3-xenr.json?$order=:id", page_size=5))
+
+    assert streamed == rows
+    assert mock_get.call_args_list[0].kwargs == {"stream": True}
+    assert "$offset=5" in mock_get.call_args.args[0]
+    assert [s["rows_returned"] for s in metrics.get_spans()] == [5, 0]
+    with pytest.raises(ValueError):
+        list(socrata.iter_json_array([body[:-1]]))
+
+
+def test_chunk_values_keeps_in_clauses_short():
+    from chicago_location_investigator.tools.socrata import chunk_values, soql_in
+
+    addresses = [f"{n} W CHICAGO AVE" for n in range(1000, 1300)]
+    batches = list(chunk_values(addresses, max_chars=1000))
+
+    assert [a for batch in batches for a in batch] == addresses
+    assert len(batches) == 7
+    assert all(len(soql_in("address", batch)) < 1000 + len("address in ()") for batch in batches)
+    assert soql_in("dba_name", ["DANTE'S PIZZERIA"]) == "dba_name in ('DANTE''S PIZZERIA')"
+
+
+#================================================
+# Tests for the shared rate limiter
+#================================================
+def test_token_bucket_paces_threads_and_tasks():
+    import asyncio
+    import time
+    from concurrent.futures import ThreadPoolExecutor
+    from chicago_location_investigator.tools.ratelimit import TokenBucket
+
+    bucket = TokenBucket(rate=50, burst=1)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(4) as pool:
+        list(pool.map(lambda _: bucket.acquire(), range(4)))
+
+    async def tasks():
+        await asyncio.gather(*(bucket.acquire_async() for _ in range(4)))
+
+    asyncio.run(tasks())
+    # 8 requests at 50/s with a burst of 1: at least 7 intervals of 20ms
+    assert time.perf_counter() - start >= 0.13
+    stats = bucket.stats()
+    assert stats["requests"] == 8
+    assert stats["max_waiting"] >= 2
+    assert stats["waiting"] == 0
+
+
+@patch("chicago_location_investigator.tools.socrata.requests.get")
+def test_socrata_retries_after_429(mock_get):
+    throttled = MagicMock(status_code=429, headers={"Retry-After": "0"})
+    ok = MagicMock(status_code=200)
+    ok.json.return_value = MOCK_SEARCH_RESPONSE
+    mock_get.side_effect = [throttled, ok]
+
+    from chicago_location_investigator.tools import metrics
+    from chicago_location_investigator.tools.socrata import fetch_rows
+
+    metrics.reset()
+    status_code, rows = fetch_rows("https://data.cityofchicago.org/resource/22u3-xenr.json?$where=address='123 N MAIN ST'")
+
+    assert status_code == 200
+    assert rows == MOCK_SEARCH_RESPONSE
+    assert mock_get.call_count == 2
+    throttled.close.assert_called_once()
+    http_span, = metrics.get_spans()
+    assert http_span["retries"] == 1
+
+
+def test_retry_delay_is_capped():
+    from chicago_location_investigator.tools.ratelimit import MAX_RETRY_DELAY_S, parse_retry_after, retry_delay
+
+    assert retry_delay(0, parse_retry_after("86400")) == MAX_RETRY_DELAY_S
+    assert retry_delay(0, 2.5) == 2.5
+    assert all(retry_delay(20) <= MAX_RETRY_DELAY_S for _ in range(50))
+
+
+#================================================
+# Tests for the address watcher
+#================================================
+def watch_portal(rows_by_dataset: dict, high_water_marks: dict, failures: list = None):
+    """A requests.get stand-in for the watcher: serves each dataset's rows changed after the query's
+    :updated_at mark, the newest mark for max(:updated_at), and any queued failure statuses first."""
+    import re
+    from urllib.parse import unquote
+
+    failures = list(failures or [])
+
+    def get(url, **kwargs):
+        url = unquote(url)
+        if failures:
+            return MagicMock(status_code=failures.pop(0), headers={"Retry-After": "0"})
+        dataset_id = re.search(r"/(\w{4}-\w{4})\.json", url).group(1)
+        if "max(:updated_at)" in url:
+            rows = [{"high_water_mark": high_water_marks[dataset_id]}]
+        else:
+            since = re.search(r":updated_at > '([^']+)'", url).group(1)
+            offset = int(re.search(r"\$offset=(\d+)", url).group(1))
+            rows = [r for r in rows_by_dataset.get(dataset_id, []) if r[":updated_at"].rstrip("Z") > since][offset:]
+        return MagicMock(status_code=200, **{"json.return_value": rows})
+
+    return get
+
+
+def last_violations_url(mock_get) -> str:
+    from urllib.parse import unquote
+    return unquote([c.args[0] for c in mock_get.call_args_list if "22u3-xenr" in c.args[0]][-1])
+
+
+def import_watch():
+    # The watcher runs as a script next to the tools package, which it imports as `tools`
+    sys.path.insert(0, str(Path(__file__).parent.parent / "chicago_location_investigator"))
+    import watch
+    return watch
+
+
+@patch("chicago_location_investigator.tools.socrata.requests.get")
+def test_watch_first_poll_records_the_high_water_marks(mock_get, tmp_path):
+    watch = import_watch()
+    marks = {w["dataset_id"]: "2026-03-01T08:00:00.000Z" for w in watch.WATCHES.values()}
+    mock_get.side_effect = watch_portal({}, marks)
+    (tmp_path / "watchlist.txt").write_text("# corner store\n1601 w  chicago ave\n\n")
+    state_path, out = tmp_path / "watchlist.txt.state.json", tmp_path / "events.jsonl"
+
+    watch.run(str(tmp_path / "watchlist.txt"), str(out), str(state_path))
+
+    import json
+    state = json.loads(state_path.read_text())
+    assert state["high_water_marks"] == {dataset_id: "2026-03-01T08:00:00.000" for dataset_id in marks}
+    assert out.read_text() == ""
+    # Only the max(:updated_at) lookups, no row queries
+    assert mock_get.call_count == len(watch.WATCHES)
+
+
+@patch("chicago_location_investigator.tools.socrata.requests.get")
+def test_watch_poll_reports_new_and_updated_rows_and_advances_the_mark(mock_get):
+    watch = import_watch()
+    mark = "2026-03-01T08:00:00.000"
+    state = {"high_water_marks": {w["dataset_id"]: mark for w in watch.WATCHES.values()}}
+    violations = [
+        {":id": "row-1", ":created_at": "2026-03-02T09:00:00.000Z", ":updated_at": "2026-03-02T09:00:00.000Z",
+         "id": "7001", "address": "1601 W CHICAGO AVE", "violation_date": "2026-03-02T00:00:00.000", "violation_description": "MAINTAIN DOOR"},
+        {":id": "row-2", ":created_at": "2025-11-20T09:00:00.000Z", ":updated_at": "2026-03-03T10:30:00.000Z",
+         "id": "6001", "address": "1601  W CHICAGO AVE", "violation_date": "2025-11-20T00:00:00.000", "violation_description": "REPAIR STAIRS"},
+        # Matched by the batch but not on the watchlist
+        {":id": "row-3", ":created_at": "2026-03-04T09:00:00.000Z", ":updated_at": "2026-03-04T09:00:00.000Z",
+         "id": "7002", "address": "1603 W CHICAGO AVE", "violation_date": "2026-03-04T00:00:00.000"},
+    ]
+    mock_get.side_effect = watch_portal({"22u3-xenr": violations}, {})
+
+    events = watch.poll(["1601 W CHICAGO AVE"], state)
+
+    assert [(e["id"], e["event"]) for e in events] == [("7001", "new"), ("6001", "updated")]
+    assert events[0]["summary"] == "MAINTAIN DOOR" and "violation_description" in events[0]["record"]
+    assert ":id" not in events[0]["record"]
+    assert state["high_water_marks"]["22u3-xenr"] == "2026-03-03T10:30:00.000"
+    # Datasets without changes keep their mark
+    assert state["high_water_marks"]["ydr8-5enu"] == mark
+
+    # The next poll asks only for changes past the new mark, so nothing is reported twice
+    assert watch.poll(["1601 W CHICAGO AVE"], state) == []
+    assert "> '2026-03-03T10:30:00.000'" in last_violations_url(mock_get)
+
+
+@patch("chicago_location_investigator.tools.socrata.requests.get")
+def test_watch_poll_keeps_the_mark_on_errors_and_retries_throttling(mock_get):
+    watch = import_watch()
+    mark = "2026-03-01T08:00:00.000"
+    state = {"high_water_marks": {w["dataset_id"]: mark for w in watch.WATCHES.values()}}
+    violations = [
+        {":id": "row-1", ":created_at": "2026-03-02T09:00:00.000Z", ":updated_at": "2026-03-02T09:00:00.000Z",
+         "id": "7001", "address": "1601 W CHICAGO AVE"},
+    ]
+
+    # A failed query drops that dataset's events and keeps its old mark
+    mock_get.side_effect = watch_portal({"22u3-xenr": violations}, {}, failures=[500])
+    assert watch.poll(["1601 W CHICAGO AVE"], state) == []
+    assert state["high_water_marks"]["22u3-xenr"] == mark
+
+    # so the next poll reports them, here after retrying a 429
+    mock_get.side_effect = watch_portal({"22u3-xenr": violations}, {}, failures=[429])
+    events = watch.poll(["1601 W CHICAGO AVE"], state)
+    assert [e["id"] for e in events] == ["7001"]
+    assert state["high_water_marks"]["22u3-xenr"] == "2026-03-02T09:00:00.000"
+
+
+#================================================
+# Tests for LLM usage accounting
+#================================================
+def test_llm_usage_tracker_attributes_tool_tokens():
+    from uuid import uuid4
+    from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+    from langchain_core.outputs import ChatGeneration, LLMResult
+    from chicago_location_investigator.models.usage import LLMUsageTracker, usage_table
+
+    def model_turn(tracker, prompt, reply):
+        run_id = uuid4()
+        tracker.on_chat_model_start({}, [prompt], run_id=run_id)
+        tracker.on_llm_end(LLMResult(generations=[[ChatGeneration(message=reply)]]), run_id=run_id)
+
+    tracker = LLMUsageTracker()
+    question = HumanMessage("What violations are at 123 N MAIN ST?")
+    first_reply = AIMessage(
+        "",
+        tool_calls=[{"name": "search_address_violations", "args": {"address": "123 N MAIN ST"}, "id": "call_1"}],
+        usage_metadata={"input_tokens": 1000, "output_tokens": 20, "total_tokens": 1020},
+    )
+    tool_result = ToolMessage("Found 2 violation(s)", name="search_address_violations", tool_call_id="call_1")
+    final_reply = AIMessage("There are 2 violations.", usage_metadata={"input_tokens": 1320, "output_tokens": 10, "total_tokens": 1330})
+
+    model_turn(tracker, [question], first_reply)
+    model_turn(tracker, [question, first_reply, tool_result], final_reply)
+
+    report = tracker.report(run_wall_time_s=10.0, tool_time_s=2.0)
+    assert report["llm_calls"] == 2
+    assert report["input_tokens"] == 2320
+    assert report["output_tokens"] == 30
+    assert report["calls"][0]["tool_calls_requested"] == ["search_address_violations"]
+    assert report["tool_output_tokens"] == {"search_address_violations": 300}
+    assert report["time_share"]["tools"] == 0.2
+    assert "search_address_violations" in usage_table(report)
+
+
+#================================================
+# Tests for cassette record/replay
+#================================================
+def test_cassette_records_and_replays_http(tmp_path):
+    import requests
+    from chicago_location_investigator.cassette import use_cassette, CassetteMiss
+    from chicago_location_investigator.tools.tools_wards import search_ward_for_point
+
+    def fake_send(adapter, request, **kwargs):
+        response = requests.Response()
+        response.status_code = 200
+        response._content = b'[{"ward": "27"}]'
+        response.headers["Content-Type"] = "application/json"
+        response.url = request.url
+        response.request = request
+        return response
+
+    cassette_path = tmp_path / "wards.json"
+    with patch("requests.adapters.HTTPAdapter.send", fake_send):
+        with use_cassette(cassette_path, "record"):
+            recorded = search_ward_for_point(latitude=41.8907, longitude=-87.6743)
+
+    with patch("requests.adapters.HTTPAdapter.send", side_effect=AssertionError("network used in replay")):
+        with use_cassette(cassette_path, "replay") as cassette:
+            replayed = search_ward_for_point(latitude=41.8907, longitude=-87.6743)
+            with pytest.raises(CassetteMiss):
+                requests.get("https://data.cityofchicago.org/resource/p293-wvbd.json?$where=other")
+
+    assert recorded == replayed == "Point (41.8907, -87.6743) is in Ward 27."
+    assert cassette.hits == 1
+    assert "app_token" not in cassette_path.read_text()
+
+
+def test_cassette_replays_llm_generations(tmp_path):
+    from langchain_core.messages import AIMessage, HumanMessage
+    from langchain_core.load import dumps
+    from langchain_core.outputs import ChatGeneration
+    from chicago_location_investigator.cassette import Cassette, CassetteMiss
+
+    recording_prompt = dumps([HumanMessage("Which ward is 1601 W CHICAGO AVE in?", id="run-1")])
+    replay_prompt = dumps([HumanMessage("Which ward is 1601 W CHICAGO AVE in?", id="run-2")])
+    generation = ChatGeneration(message=AIMessage("", tool_calls=[{"name": "search_ward_for_point", "args": {"latitude": 41.89, "longitude": -87.67}, "id": "call_1"}]))
+
+    recorder = Cassette(tmp_path / "llm.json", "record")
+    recorder.update(recording_prompt, "claude-haiku-4-5", [generation])
+    recorder.save()
+
+    replayer = Cassette(tmp_path / "llm.json", "replay")
+    replayed, = replayer.lookup(replay_prompt, "claude-haiku-4-5")
+    assert replayed.message.tool_calls[0]["name"] == "search_ward_for_point"
+    with pytest.raises(CassetteMiss):
+        replayer.lookup(replay_prompt, "llama3.1")